@@ -1,44 +1,81 @@
+import hashlib
 import json
 import os
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from functools import lru_cache
+from typing import Dict, Any, Optional
 
-# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-# do not change this unless explicitly requested by the user
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import numpy as np
 
-def analyze_market_trends(market_data: Dict[str, Any], current_rent: float) -> Dict[str, Any]:
-    """Analyze market trends and generate insights using OpenAI"""
+from utils.records import CompBatch, MarketMetrics
+
+@lru_cache(maxsize=1)
+def get_client():
+    """Construct the OpenAI client on first use instead of at import"""
+    from openai import OpenAI
+
+    # Retries and timeouts are handled by utils.resilience
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def __getattr__(name):
+    # Keep `from utils.advanced_analysis import client` working without eager construction
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Longest the LLM market analysis may hold up its caller, in seconds; a caller's tighter deadline wins
+MARKET_ANALYSIS_DEADLINE = float(os.getenv('MARKET_ANALYSIS_DEADLINE', 8))
+
+# Shape the model is asked for; responses that don't match are retried on the next provider
+MARKET_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "required": ["market_position", "price_trend", "negotiation_leverage",
+                 "best_time_to_negotiate", "key_insights", "confidence_score"],
+    "properties": {
+        "market_position": {"type": "string", "description": "whether the rent is above/below market"},
+        "price_trend": {"type": "string", "enum": ["increasing", "decreasing", "stable"]},
+        "negotiation_leverage": {"type": "string", "enum": ["strong", "moderate", "weak"]},
+        "best_time_to_negotiate": {"type": "string", "description": "recommended season"},
+        "key_insights": {"type": "array", "items": {"type": "string"}, "minItems": 1,
+                         "description": "3-4 key observations"},
+        "confidence_score": {"type": "number", "minimum": 0, "maximum": 1}
+    }
+}
+
+def analyze_market_trends(market_data: Optional[MarketMetrics], current_rent: float) -> Dict[str, Any]:
+    """
+    Analyze market trends and generate insights with the configured LLM providers
+    Price trend and best time to negotiate come from the local forecaster
+    when market data carries one, overriding the model's guess
+    """
+    from utils.forecasting import describe_outlook
+
+    outlook = describe_outlook(market_data)
+    market_data = market_data or MarketMetrics()
     try:
         prompt = f"""
         Analyze the following rental market data and provide insights in JSON format:
         - Current Rent: ${current_rent}
-        - Market Average: ${market_data.get('avg_rent', 0)}
-        - Vacancy Rate: {market_data.get('vacancy_rate', 0)*100}%
-        - Yearly Change: {market_data.get('yearly_change', 0)*100}%
-        - Seasonal Patterns: {market_data.get('seasonal_patterns', {})}
-
-        Provide analysis in this JSON format:
-        {{
-            "market_position": string (whether the rent is above/below market),
-            "price_trend": string (increasing/decreasing/stable),
-            "negotiation_leverage": string (strong/moderate/weak),
-            "best_time_to_negotiate": string (recommended season),
-            "key_insights": list of strings (3-4 key observations),
-            "confidence_score": float (0-1)
-        }}
+        - Market Average: ${market_data.avg_rent}
+        - Vacancy Rate: {market_data.vacancy_rate*100}%
+        - Yearly Change: {market_data.yearly_change*100}%
+        - Seasonal Patterns: {market_data.seasonal_patterns}
+        - 12-Month Price Trend Forecast: {outlook.get('price_trend', 'unknown')}
+
+        Respond with a single JSON object matching this JSON schema:
+        {json.dumps(MARKET_ANALYSIS_SCHEMA)}
         """
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }],
-            response_format={"type": "json_object"}
-        )
-        
-        return json.loads(response.choices[0].message.content)
+        # Breaker, deadline and last-good fallback per distinct prompt;
+        # provider hedging and schema validation happen in complete_json
+        from utils.resilience import call, deadline
+        from utils.llm_providers import complete_json
+
+        key = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        with deadline(MARKET_ANALYSIS_DEADLINE):
+            analysis = call('llm', key, lambda timeout: complete_json(prompt, MARKET_ANALYSIS_SCHEMA, timeout=timeout))
+        if analysis is None:
+            raise RuntimeError("Market analysis unavailable")
+        return {**analysis, **outlook}
     except Exception as e:
         print(f"Error in market trend analysis: {str(e)}")
         return {
@@ -47,30 +84,34 @@ def analyze_market_trends(market_data: Dict[str, Any], current_rent: float) -> D
             "negotiation_leverage": "moderate",
             "best_time_to_negotiate": "current",
             "key_insights": ["Unable to generate detailed insights"],
-            "confidence_score": 0.5
+            "confidence_score": 0.5,
+            **outlook
         }
 
-def calculate_price_metrics(current_rent: float, market_data: Dict[str, Any], comps: List[Dict[str, Any]]) -> Dict[str, Any]:
+def calculate_price_metrics(current_rent: float, market_data: MarketMetrics, comps: CompBatch,
+                            bedrooms: Optional[int] = None, unit_type: Optional[str] = None,
+                            zip_code: Optional[str] = None) -> Dict[str, Any]:
     """Calculate advanced price metrics"""
     try:
-        # Calculate price per bedroom
-        comp_prices_per_bedroom = [comp['rent'] / comp['bedrooms'] for comp in comps if comp.get('bedrooms', 0) > 0]
-        avg_price_per_bedroom = sum(comp_prices_per_bedroom) / len(comp_prices_per_bedroom) if comp_prices_per_bedroom else 0
+        # Calculate price per bedroom over the comps with a bedroom count
+        has_bedrooms = comps.bedrooms > 0
+        avg_price_per_bedroom = (
+            float((comps.rent[has_bedrooms] / comps.bedrooms[has_bedrooms]).mean()) if has_bedrooms.any() else 0
+        )
         
-        # Calculate market position percentile
-        all_rents = [comp['rent'] for comp in comps] + [current_rent]
-        all_rents.sort()
-        percentile = (all_rents.index(current_rent) / len(all_rents)) * 100
+        # Calculate market position percentile against the ZIP's precomputed
+        # rent distribution for the unit's bedrooms, falling back to the comps passed in
+        percentile = _market_percentile(current_rent, comps, bedrooms, zip_code)
 
         # Calculate price volatility
-        seasonal_patterns = market_data.get('seasonal_patterns', {})
-        price_volatility = max(seasonal_patterns.values()) - min(seasonal_patterns.values()) if seasonal_patterns else 0
+        seasonal = market_data.seasonal
+        price_volatility = max(seasonal) - min(seasonal) if seasonal else 0
 
         return {
             "price_per_bedroom": avg_price_per_bedroom,
             "market_percentile": percentile,
             "price_volatility": price_volatility,
-            "value_score": calculate_value_score(current_rent, market_data, comps)
+            "value_score": calculate_value_score(current_rent, market_data, comps, bedrooms, unit_type, zip_code)
         }
     except Exception as e:
         print(f"Error calculating price metrics: {str(e)}")
@@ -81,26 +122,55 @@ def calculate_price_metrics(current_rent: float, market_data: Dict[str, Any], co
             "value_score": 50
         }
 
-def calculate_value_score(current_rent: float, market_data: Dict[str, Any], comps: List[Dict[str, Any]]) -> float:
+def _market_percentile(current_rent: float, comps: CompBatch, bedrooms: Optional[int] = None,
+                       zip_code: Optional[str] = None) -> float:
+    """Mid-rank percentile of current_rent, found by binary search"""
+    from utils.market_model import bedrooms_key
+    from utils.rent_distribution import RentDistribution, get_distribution_index
+
+    zip_code = zip_code or (comps.zip_code[0] if len(comps) else None)
+    index = get_distribution_index() if zip_code else None
+    distribution = index.get(zip_code, bedrooms_key(bedrooms)) if index else None
+    if distribution is None:
+        distribution = RentDistribution.from_rents(np.append(comps.rent, current_rent))
+    return distribution.percentile(current_rent)
+
+def comps_reference(comps: CompBatch, bedrooms: Optional[int] = None, unit_type: Optional[str] = None,
+                    zip_code: Optional[str] = None) -> float:
+    """
+    Rent the comps stand for: the median of the like-for-like segment from
+    utils.market_model, or the comps' mean rent when there is none
+    """
+    from utils.market_model import lookup_segment
+
+    zip_code = zip_code or (comps.zip_code[0] if len(comps) else None)
+    segment = lookup_segment(zip_code, bedrooms, unit_type) if zip_code else None
+    return segment.median if segment else comps.mean_rent()
+
+def calculate_value_score(current_rent: float, market_data: MarketMetrics, comps: CompBatch,
+                          bedrooms: Optional[int] = None, unit_type: Optional[str] = None,
+                          zip_code: Optional[str] = None) -> float:
     """Calculate a value score (0-100) based on multiple factors"""
     try:
-        # Base score starts at 50
-        score = 50
-        
-        # Adjust based on market rate difference
-        market_rate = market_data.get('avg_rent', current_rent)
-        if market_rate > 0:
-            rate_diff_percent = (market_rate - current_rent) / market_rate
-            score += rate_diff_percent * 30  # Adjust up to 30 points based on market rate
-        
-        # Adjust based on comparable properties
-        if comps:
-            comp_avg = sum(comp['rent'] for comp in comps) / len(comps)
-            if comp_avg > 0:
-                comp_diff_percent = (comp_avg - current_rent) / comp_avg
-                score += comp_diff_percent * 20  # Adjust up to 20 points based on comps
-        
-        return max(0, min(100, score))  # Ensure score is between 0 and 100
+        comp_avg = comps_reference(comps, bedrooms, unit_type, zip_code)
+        return value_score_from_averages(current_rent, market_data.avg_rent, comp_avg)
     except Exception as e:
         print(f"Error calculating value score: {str(e)}")
         return 50
+
+def value_score_from_averages(current_rent: float, market_rate: float, comp_avg: float) -> float:
+    """Value score from precomputed market and comps averages (pure arithmetic, no I/O)"""
+    # Base score starts at 50
+    score = 50
+
+    # Adjust based on market rate difference
+    if market_rate > 0:
+        rate_diff_percent = (market_rate - current_rent) / market_rate
+        score += rate_diff_percent * 30  # Adjust up to 30 points based on market rate
+
+    # Adjust based on comparable properties
+    if comp_avg > 0:
+        comp_diff_percent = (comp_avg - current_rent) / comp_avg
+        score += comp_diff_percent * 20  # Adjust up to 20 points based on comps
+
+    return max(0, min(100, score))  # Ensure score is between 0 and 100
@@ -1,12 +1,15 @@
 import json
-import pandas as pd
-import numpy as np
+from functools import lru_cache
 from utils.data_loader import load_market_data, load_rental_comps
+from utils.market_model import lookup_segment
+from utils.records import MarketMetrics, violations_from_dicts
+
+VIOLATIONS_PATH = 'data/mock_violations.json'
 
 def load_violations_data():
     """Load mock violations data from JSON file"""
     try:
-        with open('data/mock_violations.json', 'r') as f:
+        with open(VIOLATIONS_PATH, 'r') as f:
             return json.load(f)
     except FileNotFoundError:
         # Create mock violations data if file doesn't exist
@@ -20,59 +23,101 @@ def load_violations_data():
                 "Security deposit protection"
             ]
         }
-        with open('data/mock_violations.json', 'w') as f:
+        with open(VIOLATIONS_PATH, 'w') as f:
             json.dump(mock_data, f)
         return mock_data
 
-def calculate_rent_score(current_rent, zip_code):
-    """Calculate a rent score based on market data"""
-    market_data = load_market_data(zip_code)
-
-    if not market_data:
-        return 50, 'No Market Data Available'
-
-    avg_rent = market_data['avg_rent']
-
+def score_rent(current_rent, avg_rent):
+    """Score a rent against the market average (pure arithmetic, no I/O)"""
     if current_rent > avg_rent:
         score = 100 - min(100, ((current_rent - avg_rent) / avg_rent * 100))
     else:
         score = 100
 
-    return max(0, score), 'Local Market Data'
+    return max(0, score)
 
-def get_comparable_units(zip_code, current_rent, tolerance=0.2):
-    """Find comparable units within the same zip code"""
-    comps = load_rental_comps(zip_code, current_rent, tolerance)
-    return comps, 'Local Market Data'
+def like_for_like_segment(zip_code, bedrooms=None, unit_type=None):
+    """Comps segment with the unit's bedroom count, or None when that is unknown or has no comps"""
+    if bedrooms is None:
+        return None
+    segment = lookup_segment(zip_code, bedrooms, unit_type)
+    return segment if segment and segment.bedrooms is not None else None
+
+def calculate_rent_score(current_rent, zip_code, bedrooms=None, unit_type=None):
+    """Calculate a rent score against like-for-like comps, or the metro market data"""
+    segment = like_for_like_segment(zip_code, bedrooms, unit_type)
+    if segment:
+        return score_rent(current_rent, segment.median), f"Comparable {segment.describe()}"
 
-def get_market_insights(zip_code):
-    """Get market insights for the given zip code"""
     market_data = load_market_data(zip_code)
+
     if not market_data:
-        return {
-            'avg_rent': 0,
-            'vacancy_rate': 0,
-            'yearly_change': 0,
-            'seasonal_patterns': {},
-            'data_source': 'No Data Available'
-        }
-    return market_data
+        return 50, 'No Market Data Available'
+
+    return score_rent(current_rent, market_data.avg_rent), 'Local Market Data'
+
+def get_comparable_units(zip_code, current_rent, tolerance=0.2, bedrooms=None, unit_type=None):
+    """Find comparable units within the same zip code, or its metro when the zip has too few"""
+    comps = load_rental_comps(zip_code, current_rent, tolerance, bedrooms, unit_type)
+    return comps, 'Local Market Data'
+
+@lru_cache(maxsize=4096)
+def _market_insights(zip_code, data_version):
+    # data_version is part of the key so a refresh invalidates cached entries
+    return load_market_data(zip_code) or MarketMetrics()
+
+def get_market_insights(zip_code):
+    """
+    Get market insights for the given zip code
+    The record is frozen, so the cached instance is shared rather than copied
+    """
+    from utils.market_store import get_data_version
+
+    try:
+        data_version = get_data_version()
+    except Exception as e:
+        print(f"Error reading market data version: {str(e)}")
+        return _market_insights.__wrapped__(zip_code, None)
+    return _market_insights(zip_code, data_version)
 
 def get_building_violations(address):
     """Get building violations for the given address"""
     data = load_violations_data()
-    violations = [
-        building['violations'] for building in data['building_violations']
-        if building['address'].lower() == address.lower()
-    ]
-    return violations[0] if violations else []
-
-def get_tenant_rights():
-    """Get list of tenant rights"""
-    data = load_violations_data()
-    return data['tenant_rights']
+    for building in data['building_violations']:
+        if building['address'].lower() == address.lower():
+            return violations_from_dicts(building['violations'])
+    return []
+
+def get_tenant_rights(zip_code=None):
+    """Get list of tenant rights that apply at the zip code"""
+    from utils.tenant_rights import get_tenant_rights as rights_for_zip
+    return rights_for_zip(zip_code)
 
 def load_rental_data():
     """Load mock rental data from JSON file"""
     with open('data/mock_rental_data.json', 'r') as f:
-        return json.load(f)
\ No newline at end of file
+        return json.load(f)
+
+def analyze(zip_code, current_rent, address, bedrooms=None, unit_type=None):
+    """
+    Run the full rent analysis for one search
+    Returns everything the results page and letter need, as typed records
+    With a bedroom count, the market rate is the median of like-for-like comps
+    """
+    rent_score, score_source = calculate_rent_score(current_rent, zip_code, bedrooms, unit_type)
+    market_data = get_market_insights(zip_code)
+    metro_rate = market_data.avg_rent or current_rent
+    like_for_like = like_for_like_segment(zip_code, bedrooms, unit_type)
+    comps, _ = get_comparable_units(zip_code, current_rent, bedrooms=bedrooms, unit_type=unit_type)
+    return {
+        'rent_score': rent_score,
+        'score_source': score_source,
+        'market_data': market_data,
+        'market_rate': like_for_like.median if like_for_like else metro_rate,
+        # Saved searches keep the metro figures the watchlist re-scores against
+        'metro_rate': metro_rate,
+        'metro_rent_score': calculate_rent_score(current_rent, zip_code)[0] if like_for_like else rent_score,
+        'segment': lookup_segment(zip_code, bedrooms, unit_type),
+        'comps': comps,
+        'violations': get_building_violations(address)
+    }
@@ -1,22 +1,36 @@
 """Real estate API integrations for HUD data"""
 import os
-import requests
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
+# Longest a FMR lookup may hold up its caller, in seconds; a caller's tighter deadline wins
+HUD_DEADLINE = float(os.getenv('HUD_DEADLINE', 3))
+
 class HUDAPI:
     def __init__(self):
         self.api_key = os.getenv('HUD_API_KEY')
-        # Updated base URL for HUD API
-        self.base_url = "https://www.huduser.gov/hudapi/public/fmr/data"
+        # Updated base URL for HUD API, overridable to point at a local stub
+        self.base_url = os.getenv('HUD_API_BASE_URL', "https://www.huduser.gov/hudapi/public/fmr/data")
 
     def get_fair_market_rent(self, zip_code: str) -> Optional[Dict[str, Any]]:
         """
         Fetch Fair Market Rent data from HUD API
-        Returns None if data not found or error occurs
+        Returns None if data not found or error occurs. Goes through the
+        resilience layer, so a slow or failing HUD answers from the last
+        good value for the ZIP within HUD_DEADLINE or the caller's deadline.
         """
         if not self.api_key:
             raise ValueError("HUD API key not configured")
 
+        from utils.resilience import call, deadline
+
+        with deadline(HUD_DEADLINE):
+            return call('hud', zip_code, lambda timeout: self._fetch_fair_market_rent(zip_code, timeout))
+
+    def _fetch_fair_market_rent(self, zip_code: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """One HUD request; server-side failures raise so they count against the breaker"""
+        from utils.resilience import UpstreamError
+
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
@@ -28,24 +42,30 @@ class HUDAPI:
             'year': '2024'
         }
 
-        try:
-            response = requests.get(
-                self.base_url, 
-                headers=headers, 
-                params=params,
-                timeout=10
-            )
-
-            # Log the response for debugging
-            print(f"HUD API Response Status: {response.status_code}")
-            if response.status_code != 200:
-                print(f"HUD API Error Response: {response.text}")
-                return None
-
-            return response.json()
-        except requests.RequestException as e:
-            print(f"Error fetching HUD data: {str(e)}")
+        import requests
+
+        response = requests.get(
+            self.base_url,
+            headers=headers,
+            params=params,
+            timeout=timeout
+        )
+
+        if response.status_code >= 500 or response.status_code == 429:
+            raise UpstreamError(f"HUD API returned {response.status_code}")
+        if response.status_code != 200:
+            print(f"HUD API Error Response: {response.status_code} {response.text}")
             return None
 
-# Initialize API client
-hud_client = HUDAPI()
\ No newline at end of file
+        return response.json()
+
+@lru_cache(maxsize=1)
+def get_hud_client() -> HUDAPI:
+    """Shared API client, created on first use"""
+    return HUDAPI()
+
+def __getattr__(name):
+    # `hud_client` used to be built at import; resolve it lazily instead
+    if name == "hud_client":
+        return get_hud_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
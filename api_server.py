@@ -0,0 +1,379 @@
+"""
+Headless JSON HTTP API for the analysis engine
+
+An asyncio HTTP/1.1 server accepts requests and hands the CPU-bound work
+to a process pool. Every endpoint takes a JSON object, or a JSON list of
+objects to score a batch in one round trip; batches are split across
+workers and results come back in request order.
+
+Endpoints (POST):
+    /v1/rent-score          {zip_code, current_rent, bedrooms?, unit_type?}
+    /v1/comparables         {zip_code, current_rent, tolerance?, bedrooms?, unit_type?}
+    /v1/market-insights     {zip_code}
+    /v1/price-metrics       {zip_code, current_rent, bedrooms?, unit_type?, market_data?, comps?}
+    /v1/negotiation-score   {zip_code, current_rent, address?, bedrooms?, unit_type?} or
+                            {current_rent, market_rate, violations?, comps?, negotiation_power?}
+    /v1/letter              {name, address, zip_code, current_rent, bedrooms?, unit_type?}
+    /v1/tenant-rights       {zip_code}
+    /v1/market-trends       {zip_code, current_rent}
+GET /healthz
+
+bedrooms and unit_type describe the renter's unit; with them, rents are
+compared with like-for-like comps (see utils.market_model).
+
+Usage:
+    python -m utils.api_server --port 8080 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+MAX_BODY_BYTES = int(os.getenv('API_MAX_BODY_BYTES', 8 * 1024 * 1024))
+MAX_BATCH_SIZE = int(os.getenv('API_MAX_BATCH_SIZE', 10000))
+MAX_HEADER_BYTES = int(os.getenv('API_MAX_HEADER_BYTES', 16 * 1024))
+MAX_HEADERS = int(os.getenv('API_MAX_HEADERS', 100))
+
+# Batch items handed to a worker per task; amortises inter-process overhead
+BATCH_CHUNK_SIZE = 256
+
+# Budget for upstream calls made while handling one request, in seconds
+REQUEST_DEADLINE = float(os.getenv('API_REQUEST_DEADLINE', 10))
+
+# Idle keep-alive connections and clients stalling mid-request are dropped after this many seconds
+READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', 30))
+
+class RequestError(ValueError):
+    """Raised for a malformed request body"""
+
+class HeadersTooLarge(Exception):
+    """Raised when a request's headers exceed MAX_HEADERS or MAX_HEADER_BYTES"""
+
+def _require(payload: Dict[str, Any], *fields: str):
+    missing = [f for f in fields if payload.get(f) in (None, '')]
+    if missing:
+        raise RequestError(f"Missing required fields: {', '.join(missing)}")
+
+def _unit(payload) -> Tuple[Optional[int], Optional[str]]:
+    """Optional bedrooms and unit type of the renter's unit"""
+    bedrooms = payload.get('bedrooms')
+    return (None if bedrooms in (None, '') else int(bedrooms)), (payload.get('unit_type') or None)
+
+def _rent_score(payload):
+    from utils.analysis import calculate_rent_score
+
+    _require(payload, 'zip_code', 'current_rent')
+    score, source = calculate_rent_score(float(payload['current_rent']), str(payload['zip_code']), *_unit(payload))
+    return {'score': score, 'source': source}
+
+def _comparables(payload):
+    from utils.analysis import get_comparable_units
+
+    _require(payload, 'zip_code', 'current_rent')
+    comps, source = get_comparable_units(
+        str(payload['zip_code']), float(payload['current_rent']), float(payload.get('tolerance', 0.2)),
+        *_unit(payload)
+    )
+    return {'comps': comps.to_dicts(), 'source': source}
+
+def _market_insights(payload):
+    from utils.analysis import get_market_insights
+
+    _require(payload, 'zip_code')
+    return get_market_insights(str(payload['zip_code'])).to_dict()
+
+def _price_metrics(payload):
+    from utils.analysis import get_market_insights, get_comparable_units
+    from utils.advanced_analysis import calculate_price_metrics
+    from utils.records import CompBatch, MarketMetrics
+
+    _require(payload, 'current_rent')
+    current_rent = float(payload['current_rent'])
+    market_data = payload.get('market_data')
+    comps = payload.get('comps')
+    market_data = MarketMetrics.from_dict(market_data) if market_data is not None else None
+    comps = CompBatch.from_dicts(comps) if comps is not None else None
+    bedrooms, unit_type = _unit(payload)
+    zip_code = str(payload['zip_code']) if payload.get('zip_code') else None
+    if market_data is None or comps is None:
+        _require(payload, 'zip_code')
+        market_data = market_data if market_data is not None else get_market_insights(zip_code)
+        if comps is None:
+            comps = get_comparable_units(zip_code, current_rent, bedrooms=bedrooms, unit_type=unit_type)[0]
+    return calculate_price_metrics(current_rent, market_data, comps, bedrooms, unit_type, zip_code)
+
+def _analysis_for(payload):
+    from utils.result_cache import get_cached_analysis
+
+    _require(payload, 'zip_code', 'current_rent')
+    return get_cached_analysis(
+        str(payload['zip_code']), float(payload['current_rent']), str(payload.get('address', '')),
+        *_unit(payload)
+    )
+
+def _negotiation_score(payload):
+    from utils.gamification import (
+        calculate_negotiation_power, calculate_negotiation_score, get_level_title
+    )
+    from utils.records import CompBatch, MarketMetrics, violations_from_dicts
+
+    _require(payload, 'current_rent')
+    if payload.get('market_rate') is not None:
+        market_data = MarketMetrics.from_dict(payload.get('market_data') or {})
+        market_rate = float(payload['market_rate'])
+        if not market_rate > 0:
+            raise RequestError("market_rate must be positive")
+        violations = violations_from_dicts(payload.get('violations') or [])
+        comps = CompBatch.from_dicts(payload.get('comps') or [])
+    else:
+        analysis = _analysis_for(payload)
+        market_data = analysis['market_data']
+        market_rate = analysis['market_rate']
+        violations = analysis['violations']
+        comps = analysis['comps']
+
+    power = payload.get('negotiation_power')
+    if power is None:
+        power = calculate_negotiation_power(market_data, violations)
+    result = calculate_negotiation_score(float(payload['current_rent']), market_rate, float(power), violations, comps)
+    result['level_title'] = get_level_title(result['level'])
+    return result
+
+def _letter(payload):
+    from utils.letter_generator import generate_negotiation_letter
+
+    _require(payload, 'name', 'address')
+    analysis = _analysis_for(payload)
+    letter = generate_negotiation_letter(
+        payload['name'], payload['address'], float(payload['current_rent']),
+        analysis['market_rate'], analysis['violations'], analysis['comps']
+    )
+    return {'letter': letter, 'market_rate': analysis['market_rate']}
+
+def _tenant_rights(payload):
+    from utils.tenant_rights import get_catalog
+
+    _require(payload, 'zip_code')
+    return get_catalog().lookup(str(payload['zip_code']))
+
+def _market_trends(payload):
+    from utils.analysis import get_market_insights
+    from utils.advanced_analysis import analyze_market_trends
+
+    _require(payload, 'zip_code', 'current_rent')
+    return analyze_market_trends(get_market_insights(str(payload['zip_code'])), float(payload['current_rent']))
+
+ENDPOINTS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    '/v1/rent-score': _rent_score,
+    '/v1/comparables': _comparables,
+    '/v1/market-insights': _market_insights,
+    '/v1/price-metrics': _price_metrics,
+    '/v1/negotiation-score': _negotiation_score,
+    '/v1/letter': _letter,
+    '/v1/tenant-rights': _tenant_rights,
+    '/v1/market-trends': _market_trends,
+}
+
+def _dispatch(path: str, payloads: List[Any]) -> List[Dict[str, Any]]:
+    """Run one endpoint over a chunk of payloads inside a worker process"""
+    from utils.resilience import deadline
+
+    handler = ENDPOINTS[path]
+    results = []
+    for payload in payloads:
+        try:
+            if not isinstance(payload, dict):
+                raise RequestError("Each request must be a JSON object")
+            with deadline(REQUEST_DEADLINE):
+                results.append({'ok': True, 'result': handler(payload)})
+        except (RequestError, KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            results.append({'ok': False, 'status': 400, 'error': str(e)})
+        except Exception as e:
+            print(f"Error handling {path}: {str(e)}")
+            results.append({'ok': False, 'status': 500, 'error': 'Internal error'})
+    return results
+
+def _finite(value):
+    """JSON has no NaN or Infinity; send them as null"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+def _warm_worker():
+    # Load the market matrix, comps model and rights catalog once per worker instead of on the first request
+    try:
+        from utils.market_store import get_market_matrix
+        from utils.market_model import get_market_model
+        from utils.tenant_rights import get_catalog
+        get_market_matrix()
+        get_market_model()
+        get_catalog()
+    except Exception as e:
+        print(f"Worker warmup failed: {str(e)}")
+
+class APIServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080, workers: int = None):
+        self.host = host
+        self.port = port
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_warm_worker)
+        self.server = None
+
+    async def _run(self, path: str, payloads: List[Any]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        chunks = [payloads[i:i + BATCH_CHUNK_SIZE] for i in range(0, len(payloads), BATCH_CHUNK_SIZE)]
+        parts = await asyncio.gather(*(loop.run_in_executor(self.pool, _dispatch, path, c) for c in chunks))
+        return [item for part in parts for item in part]
+
+    async def _respond(self, writer, status: int, body: Any, keep_alive: bool):
+        data = json.dumps(_finite(body), default=lambda o: _finite(float(o)), allow_nan=False).encode()
+        reason = HTTPStatus(status).phrase
+        headers = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(headers.encode() + data)
+        await writer.drain()
+
+    async def _handle_request(self, method: str, path: str, body: bytes):
+        path = path.split('?', 1)[0]
+        if method == 'GET' and path == '/healthz':
+            return 200, {'status': 'ok'}
+        if path not in ENDPOINTS:
+            return 404, {'error': f"Unknown endpoint {path}"}
+        if method != 'POST':
+            return 405, {'error': "Use POST"}
+
+        try:
+            payload = json.loads(body or b'null')
+        except json.JSONDecodeError as e:
+            return 400, {'error': f"Invalid JSON: {str(e)}"}
+
+        if isinstance(payload, list):
+            if len(payload) > MAX_BATCH_SIZE:
+                return 413, {'error': f"Batch larger than {MAX_BATCH_SIZE} requests"}
+            results = await self._run(path, payload)
+            return 200, {'results': [
+                r['result'] if r['ok'] else {'error': r['error'], 'status': r['status']} for r in results
+            ]}
+
+        result = (await self._run(path, [payload]))[0]
+        if result['ok']:
+            return 200, result['result']
+        return result['status'], {'error': result['error']}
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers = {}
+        size = 0
+        for _ in range(MAX_HEADERS + 1):
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # One line over the stream's buffer limit
+                raise HeadersTooLarge()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            size += len(line)
+            if size > MAX_HEADER_BYTES:
+                raise HeadersTooLarge()
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise HeadersTooLarge()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    await self._respond(writer, 414, {'error': 'Request line too long'}, False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Bad request line'}, False)
+                    break
+
+                try:
+                    headers = await asyncio.wait_for(self._read_headers(reader), READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    await self._respond(writer, 408, {'error': 'Request headers not received in time'}, False)
+                    break
+                except HeadersTooLarge:
+                    await self._respond(writer, 431, {'error': 'Request headers too large'}, False)
+                    break
+                if 'transfer-encoding' in headers:
+                    await self._respond(writer, 411, {'error': 'Chunked bodies are not supported; send Content-Length'}, False)
+                    break
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'Request body too large'}, False)
+                    break
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b''
+                except asyncio.TimeoutError:
+                    await self._respond(writer, 408, {'error': 'Request body not received in time'}, False)
+                    break
+
+                keep_alive = (
+                    headers.get('connection', '').lower() != 'close'
+                    and version.upper() == 'HTTP/1.1'
+                )
+                status, response = await self._handle_request(method.upper(), path, body)
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Rent analysis API listening on http://{self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the rent analysis engine as a JSON API")
+    parser.add_argument('--host', default=os.getenv('API_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('API_PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    server = APIServer(args.host, args.port, args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
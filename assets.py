@@ -0,0 +1,269 @@
+"""
+Static asset pipeline for the landing and home pages
+
+`build_assets` resizes source images into compressed variants (AVIF and
+WebP where Pillow supports them, plus small PNG fallbacks) and minifies
+the page stylesheets. Every output gets a content-hashed file name under
+static/, which Streamlit serves at app/static/ with
+server.enableStaticServing on. A file's name changes whenever its bytes
+do, so a proxy in front of the app can serve app/static/* with
+`Cache-Control: public, max-age=31536000, immutable`.
+
+Usage:
+    python -m utils.assets build
+"""
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+
+# Logical image name -> source file
+IMAGE_SOURCES = {'icon': 'generated-icon.png'}
+STYLE_DIR = 'styles'
+STATIC_DIR = 'static'
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'manifest.json')
+STATIC_URL = 'app/static'
+
+# Output widths; PNG fallbacks are only kept at the small sizes
+IMAGE_WIDTHS = (32, 64, 192, 512)
+PNG_WIDTHS = (32, 64, 192)
+IMAGE_FORMATS = {
+    'avif': {'quality': 50},
+    'webp': {'quality': 80, 'method': 6},
+}
+
+def _supports(fmt: str) -> bool:
+    from PIL import features
+    try:
+        return bool(features.check(fmt))
+    except Exception:
+        return False
+
+def _write_hashed(out_dir: str, stem: str, data: bytes, ext: str) -> str:
+    digest = hashlib.blake2b(data, digest_size=5).hexdigest()
+    name = f"{stem}.{digest}.{ext}"
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return name
+
+def _encode(image, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+def build_image(source_path: str, stem: str, out_dir: str = STATIC_DIR) -> Dict[str, Any]:
+    """Write resized variants of one image, returning {format: {width: file name}}"""
+    from PIL import Image
+
+    image = Image.open(source_path)
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    formats = {fmt: options for fmt, options in IMAGE_FORMATS.items() if _supports(fmt)}
+
+    variants: Dict[str, Dict[str, str]] = {}
+    for width in IMAGE_WIDTHS:
+        if width > image.width:
+            continue
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for fmt, options in formats.items():
+            data = _encode(resized, fmt, **options)
+            variants.setdefault(fmt, {})[str(width)] = _write_hashed(out_dir, f"{stem}-{width}", data, fmt)
+        if width in PNG_WIDTHS:
+            palette = resized.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+            data = _encode(palette, 'png', optimize=True)
+            variants.setdefault('png', {})[str(width)] = _write_hashed(out_dir, f"{stem}-{width}", data, 'png')
+
+    return {'width': image.width, 'height': image.height, 'variants': variants}
+
+def minify_css(css: str) -> str:
+    """Strip comments and insignificant whitespace"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r'\s*:\s*(?=[^{}]*;)', ':', css)
+    return css.replace(';}', '}').strip()
+
+def build_assets(out_dir: str = STATIC_DIR) -> Dict[str, Any]:
+    """Build every image and stylesheet and write the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest: Dict[str, Any] = {'images': {}, 'styles': {}}
+
+    for name, source_path in IMAGE_SOURCES.items():
+        if os.path.exists(source_path):
+            manifest['images'][name] = build_image(source_path, name, out_dir)
+
+    for source_path in sorted(glob.glob(os.path.join(STYLE_DIR, '*.css'))):
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        with open(source_path) as f:
+            css = minify_css(f.read())
+        manifest['styles'][name] = _write_hashed(out_dir, name, css.encode(), 'css')
+
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
+
+def _sources_newer_than(path: str) -> bool:
+    built_at = os.path.getmtime(path)
+    sources = list(IMAGE_SOURCES.values()) + glob.glob(os.path.join(STYLE_DIR, '*.css'))
+    return any(os.path.exists(s) and os.path.getmtime(s) > built_at for s in sources)
+
+_manifest: Optional[Dict[str, Any]] = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> Dict[str, Any]:
+    """
+    Manifest of built assets, loaded once per process
+    Builds first if the manifest is missing or older than its sources
+    """
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    if not os.path.exists(MANIFEST_PATH) or _sources_newer_than(MANIFEST_PATH):
+                        _manifest = build_assets()
+                    else:
+                        with open(MANIFEST_PATH) as f:
+                            _manifest = json.load(f)
+                except Exception as e:
+                    print(f"Error building static assets: {str(e)}")
+                    _manifest = {'images': {}, 'styles': {}}
+    return _manifest
+
+def _variant(name: str, fmt: str, width: int) -> Optional[Tuple[int, str]]:
+    """Smallest variant at least `width` wide, else the largest available"""
+    widths = get_manifest()['images'].get(name, {}).get('variants', {}).get(fmt, {})
+    if not widths:
+        return None
+    ordered = sorted((int(w), f) for w, f in widths.items())
+    return next(((w, f) for w, f in ordered if w >= width), ordered[-1])
+
+def asset_url(file_name: str) -> str:
+    return f"{STATIC_URL}/{file_name}"
+
+def image_path(name: str, width: int = 64) -> Optional[str]:
+    """Filesystem path of a PNG variant, e.g. for st.set_page_config(page_icon=...)"""
+    variant = _variant(name, 'png', width)
+    return os.path.join(STATIC_DIR, variant[1]) if variant else None
+
+def picture_tag(name: str, width: int, alt: str = '', css_class: str = '') -> str:
+    """<picture> markup with AVIF/WebP sources at 1x and 2x and a PNG fallback"""
+    fallback = _variant(name, 'png', width)
+    if fallback is None:
+        return ''
+
+    sources = []
+    for fmt in IMAGE_FORMATS:
+        one_x, two_x = _variant(name, fmt, width), _variant(name, fmt, width * 2)
+        if one_x is None:
+            continue
+        srcset = asset_url(one_x[1])
+        if two_x and two_x[0] > one_x[0]:
+            srcset += f" 1x, {asset_url(two_x[1])} 2x"
+        sources.append(f'<source type="image/{fmt}" srcset="{srcset}">')
+
+    class_attr = f' class="{css_class}"' if css_class else ''
+    return (
+        f'<picture{class_attr}>{"".join(sources)}'
+        f'<img src="{asset_url(fallback[1])}" width="{width}" height="{width}" alt="{alt}" decoding="async">'
+        f'</picture>'
+    )
+
+@lru_cache(maxsize=None)
+def stylesheet(name: str) -> Tuple[str, str]:
+    """(hashed file name, minified CSS) for a built stylesheet"""
+    file_name = get_manifest()['styles'].get(name)
+    if file_name:
+        with open(os.path.join(STATIC_DIR, file_name)) as f:
+            return file_name, f.read()
+    # Not built; serve the source so the page still renders
+    with open(os.path.join(STYLE_DIR, f"{name}.css")) as f:
+        css = minify_css(f.read())
+    return hashlib.blake2b(css.encode(), digest_size=5).hexdigest(), css
+
+def load_styles(page: str, shared: Tuple[str, ...] = ('base',)):
+    """
+    Install the shared and page stylesheets into the document head
+    Streamlit drops elements that a rerun doesn't re-emit, so the CSS is
+    injected into the parent document from a zero-height component; it
+    is only sent again after a page switch or a new browser session.
+    """
+    import streamlit as st
+    import streamlit.components.v1 as components
+
+    loaded = st.session_state.setdefault('_loaded_styles', {})
+    # The page slot holds one stylesheet so page-specific rules don't leak across pages
+    slots = {name: name for name in shared}
+    slots['page'] = page
+
+    pending = {}
+    for slot, name in slots.items():
+        try:
+            file_name, css = stylesheet(name)
+        except OSError as e:
+            print(f"Error loading stylesheet {name}: {str(e)}")
+            continue
+        if loaded.get(slot) != file_name:
+            pending[slot] = (file_name, css)
+    if not pending:
+        return
+
+    installs = "".join(
+        f"install({json.dumps('asset-style-' + slot)}, {json.dumps(file_name)}, {json.dumps(css)});"
+        for slot, (file_name, css) in pending.items()
+    )
+    components.html(f"""
+    <script>
+        const head = window.parent.document.head;
+        function install(id, version, css) {{
+            let style = head.querySelector('#' + id);
+            if (!style) {{
+                style = window.parent.document.createElement('style');
+                style.id = id;
+                head.appendChild(style);
+            }}
+            if (style.dataset.version !== version) {{
+                style.textContent = css;
+                style.dataset.version = version;
+            }}
+        }}
+        {installs}
+    </script>
+    """, height=0)
+    loaded.update({slot: file_name for slot, (file_name, _) in pending.items()})
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed static assets")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--out', default=STATIC_DIR)
+    args = parser.parse_args()
+
+    manifest = build_assets(args.out)
+    total = 0
+    for file_name in os.listdir(args.out):
+        if file_name != 'manifest.json':
+            total += os.path.getsize(os.path.join(args.out, file_name))
+    for name, image in manifest['images'].items():
+        for fmt, widths in image['variants'].items():
+            for width, file_name in widths.items():
+                size = os.path.getsize(os.path.join(args.out, file_name))
+                print(f"{name:<8} {fmt:>4} {width + 'px':>6}  {size / 1024:7.1f} KB  {file_name}")
+    for name, file_name in manifest['styles'].items():
+        size = os.path.getsize(os.path.join(args.out, file_name))
+        print(f"{name:<8} {'css':>4} {'':>6}  {size / 1024:7.1f} KB  {file_name}")
+    print(f"Total {total / 1024:.1f} KB in {args.out}")
+
+if __name__ == "__main__":
+    main()
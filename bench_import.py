@@ -0,0 +1,112 @@
+"""
+Cold start import benchmark
+
+Imports each app module in a fresh interpreter, checks that heavy
+dependencies stay unloaded and that the median import time stays within
+budget. Exits non-zero on regression so it can gate deploys.
+
+Usage:
+    python bench_import.py --budget-ms 800 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Any, List
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TARGETS = [
+    'utils.data_loader',
+    'utils.analysis',
+    'utils.advanced_analysis',
+    'utils.api_integrations',
+    'main.py',
+]
+
+# Modules that must not be pulled in just by importing the app
+DEFERRED_MODULES = ['pandas', 'plotly', 'openai', 'requests']
+
+# Imported before the clock starts for page files; `import streamlit` itself
+# loads plotly to register its theme, which no page can avoid
+PAGE_BASELINE_MODULES = ['streamlit']
+
+DEFAULT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', 800))
+
+_PROBE = """
+import json, runpy, sys, time
+target = sys.argv[1]
+for module in sys.argv[2:]:
+    __import__(module)
+baseline = set(sys.modules)
+start = time.perf_counter()
+if target.endswith('.py'):
+    runpy.run_path(target, run_name='import_bench')
+else:
+    __import__(target)
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(set(sys.modules) - baseline)}))
+"""
+
+def measure_import(target: str) -> Dict[str, Any]:
+    """
+    Import one target in a clean interpreter and return elapsed time and the
+    modules it loaded; page files are measured on top of PAGE_BASELINE_MODULES
+    """
+    baseline = PAGE_BASELINE_MODULES if target.endswith('.py') else []
+    result = subprocess.run(
+        [sys.executable, '-c', _PROBE, target, *baseline],
+        cwd=APP_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_benchmark(targets: List[str], runs: int, budget_ms: float) -> Dict[str, Any]:
+    report = {'budget_ms': budget_ms, 'targets': {}, 'failures': []}
+    for target in targets:
+        samples = []
+        leaked = set()
+        for _ in range(runs):
+            measurement = measure_import(target)
+            samples.append(measurement['elapsed'] * 1000)
+            loaded = set(measurement['modules'])
+            leaked.update(m for m in DEFERRED_MODULES if m in loaded)
+
+        median_ms = statistics.median(samples)
+        report['targets'][target] = {
+            'median_ms': median_ms,
+            'max_ms': max(samples),
+            'eager_heavy_modules': sorted(leaked)
+        }
+        if median_ms > budget_ms:
+            report['failures'].append(f"{target}: median {median_ms:.1f}ms exceeds budget {budget_ms:.0f}ms")
+        if leaked:
+            report['failures'].append(f"{target}: eagerly imports {', '.join(sorted(leaked))}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if app cold start imports regress")
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS,
+                        help="Modules or page files to import")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Maximum median import time per target")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.targets, args.runs, args.budget_ms)
+    for target, stats in report['targets'].items():
+        print(f"{target:<28} median={stats['median_ms']:.1f}ms max={stats['max_ms']:.1f}ms")
+    if report['failures']:
+        print("\nCold start regression:")
+        for failure in report['failures']:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nAll targets within {args.budget_ms:.0f}ms budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Near-duplicate detection for the comps dataset
+
+With comps from several sites and crawls, one unit shows up many times
+with slightly different addresses ("W 34th St Apt 5B", "West 34th Street
+#5B") and rents, which skews segment medians and the comps shown with an
+analysis. This stage clusters those rows and keeps one canonical comp
+per unit, with how many listings and sources it was seen in.
+
+Candidates come from MinHash signatures over character bigrams of the
+street part of the normalized address, banded for LSH. Each band key is
+paired with an attribute signature (ZIP, bedrooms, house and unit
+number, and any numbers in the street name), so only rows that could be
+the same unit share a bucket. Rows next to each other in a bucket are
+accepted as duplicates when their estimated address similarity and rent
+agree, and accepted pairs are merged into clusters with a vectorized
+union-find.
+
+All of it runs on NumPy columns, one batch of whole ZIPs at a time. A
+comps file sorted by ZIP (as listing_extract writes it) is read in
+chunks, so memory is bounded by the batch size and time grows linearly
+with rows; other files are sorted in memory first.
+
+The canonical comp is the latest fetch, with the latest known unit type.
+
+Usage:
+    python -m utils.comp_dedup run data/raw_comps.csv --out data/rental_comps.csv
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from utils.listing_extract import COLUMNS, normalize_address
+
+# Rows per batch; a batch is extended to the end of its last ZIP
+BATCH_ROWS = 500000
+# Rows hashed at a time while computing signatures
+SIGNATURE_ROWS = 50000
+
+NUM_PERM = 32
+# Two signature rows per band (packed into 32-bit keys) catch pairs down to ~0.3 similarity
+BANDS = 16
+SHINGLE = 2
+# Longer addresses are truncated for hashing
+ADDRESS_BYTES = 48
+SEED = 20240601
+
+# Estimated Jaccard similarity of street bigrams for a duplicate
+SIMILARITY_THRESHOLD = 0.4
+# Largest rent difference for a duplicate, relative to the higher rent
+RENT_TOLERANCE = 0.1
+
+OUTPUT_COLUMNS = COLUMNS + ['listings', 'sources', 'first_seen']
+
+_HOST = r'^[a-z][a-z0-9+.-]*://(?:www\.)?([^/:?#]+)'
+_PARTS = r'^(?P<house>\d+[a-z]?(?:-\d+)?)?\s*(?P<street>.*?)(?:\s*\bapt\b\s*(?P<unit>.*))?$'
+
+_rng = np.random.default_rng(SEED)
+# Multiply-shift hashes: odd multipliers, wrapping uint32 arithmetic
+_HASH_A = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+_HASH_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64).astype(np.uint32)
+
+class _Unsorted(Exception):
+    pass
+
+# Signatures
+
+def minhash(streets: np.ndarray) -> np.ndarray:
+    """(rows, NUM_PERM) uint16 MinHash signatures of each string's character bigrams"""
+    signatures = np.empty((len(streets), NUM_PERM), dtype=np.uint16)
+    for start in range(0, len(streets), SIGNATURE_ROWS):
+        chunk = streets[start:start + SIGNATURE_ROWS]
+        data = np.array([s.encode('utf-8', 'ignore') for s in chunk], dtype=f'S{ADDRESS_BYTES}')
+        lengths = np.char.str_len(data)
+        chars = data.view(np.uint8).reshape(len(chunk), ADDRESS_BYTES).astype(np.uint32)
+        grams = chars[:, :-1] << np.uint32(8) | chars[:, 1:]
+        positions = np.arange(grams.shape[1])
+        # Strings shorter than a shingle still get one (padded) gram
+        invalid = positions >= np.maximum(lengths - (SHINGLE - 1), 1)[:, None]
+        for k in range(NUM_PERM):
+            hashed = grams * _HASH_A[k] + _HASH_B[k]
+            hashed[invalid] = np.iinfo(np.uint32).max
+            # The high 16 bits of each minimum are enough to estimate similarity
+            signatures[start:start + len(chunk), k] = hashed.min(axis=1) >> np.uint32(16)
+    return signatures
+
+def _band_keys(signatures: np.ndarray) -> np.ndarray:
+    """(rows, BANDS) keys, each packing one band's signature values"""
+    bands = signatures.reshape(len(signatures), BANDS, NUM_PERM // BANDS).astype(np.uint32)
+    keys = np.zeros((len(signatures), BANDS), dtype=np.uint32)
+    for i in range(bands.shape[2]):
+        keys |= bands[:, :, i] << np.uint32(16 * i)
+    return keys
+
+def _clusters(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Cluster label (lowest member index) per row from duplicate pairs"""
+    parent = np.arange(n)
+    while len(left):
+        roots_left, roots_right = parent[left], parent[right]
+        active = roots_left != roots_right
+        left, right = left[active], right[active]
+        if not len(left):
+            break
+        # Hook each higher root under the lowest root it is paired with
+        high = np.maximum(roots_left[active], roots_right[active])
+        np.minimum.at(parent, high, np.minimum(roots_left[active], roots_right[active]))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+# Clustering
+
+def cluster_comps(df) -> np.ndarray:
+    """Cluster label per comp; rows with the same label are one unit"""
+    import pandas as pd
+
+    n = len(df)
+    if n < 2:
+        return np.arange(n)
+
+    addresses = df['address'].map({a: normalize_address(a) for a in df['address'].unique()})
+    parts = addresses.str.extract(_PARTS).fillna('')
+    streets = parts['street'].to_numpy(dtype=object)
+    street_numbers = parts['street'].str.findall(r'\d+').str.join(' ')
+    # Rows can only be duplicates within one attribute signature. A listing without a unit
+    # number may be any unit in its building, so it only matches others without one
+    attributes = pd.DataFrame({
+        'zip_code': df['zip_code'].to_numpy(), 'bedrooms': df['bedrooms'].to_numpy(),
+        'house': parts['house'].to_numpy(), 'street_numbers': street_numbers.to_numpy(),
+        'unit': parts['unit'].str.replace(r'[^0-9a-z]', '', regex=True).to_numpy()
+    }).groupby(['zip_code', 'bedrooms', 'house', 'street_numbers', 'unit'], sort=False, dropna=False).ngroup()
+    attributes = attributes.to_numpy().astype(np.uint64)
+    rents = df['rent'].to_numpy(dtype=np.float64)
+
+    signatures = minhash(streets)
+    keys = _band_keys(signatures)
+    has_street = streets != ''
+
+    # Rows within a bucket are ordered by rent, so neighbours are the likeliest duplicates
+    by_rent = np.argsort(rents, kind='stable')
+    left, right = [], []
+    for band in range(BANDS):
+        bucket = attributes << np.uint64(32) | keys[:, band]
+        order = by_rent[np.argsort(bucket[by_rent], kind='stable')]
+        a, b = order[:-1], order[1:]
+        same = bucket[a] == bucket[b]
+        left.append(a[same])
+        right.append(b[same])
+    # Drop pairs found in several bands
+    left, right = np.concatenate(left), np.concatenate(right)
+    pairs = np.sort(np.minimum(left, right).astype(np.int64) * n + np.maximum(left, right))
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    pairs = pairs[first]
+    a, b = np.divmod(pairs, n)
+
+    similarity = (signatures[a] == signatures[b]).mean(axis=1)
+    close_rent = np.abs(rents[a] - rents[b]) <= RENT_TOLERANCE * np.maximum(rents[a], rents[b])
+    duplicate = (similarity >= SIMILARITY_THRESHOLD) & close_rent & has_street[a] & has_street[b]
+    return _clusters(n, a[duplicate], b[duplicate])
+
+def canonical_comps(df):
+    """One comp per cluster: its latest fetch, with listing and source counts"""
+    labels = cluster_comps(df)
+    df = df.assign(
+        cluster=labels,
+        host=df['source_url'].str.extract(_HOST, flags=re.I)[0].str.lower().fillna(''),
+        # Empty unit types are skipped when picking the latest known one
+        unit_type=df['unit_type'].replace('', np.nan)
+    )
+    grouped = df.sort_values('fetched_at', ascending=False, kind='stable').groupby('cluster', sort=False)
+    canonical = grouped[COLUMNS].first()
+    canonical['unit_type'] = canonical['unit_type'].fillna('')
+    canonical['listings'] = grouped.size()
+    canonical['sources'] = grouped['host'].nunique()
+    # Rows are newest first, so the last one is the first fetch
+    canonical['first_seen'] = grouped['fetched_at'].last()
+    return canonical.sort_values(['zip_code', 'address'], kind='stable')[OUTPUT_COLUMNS]
+
+# Files
+
+def _read(path: str, chunksize: Optional[int] = None):
+    import pandas as pd
+
+    return pd.read_csv(
+        path, chunksize=chunksize, keep_default_na=False,
+        dtype={'zip_code': str, 'address': str, 'unit_type': str, 'source_url': str, 'fetched_at': str}
+    )
+
+def _prepare(df):
+    """Comps with every provenance column, valid rents and 5-digit ZIPs"""
+    import pandas as pd
+
+    df = df.assign(**{column: '' for column in COLUMNS if column not in df})
+    df = df.assign(rent=pd.to_numeric(df['rent'], errors='coerce'),
+                   bedrooms=pd.to_numeric(df['bedrooms'], errors='coerce').astype('Int64'))
+    df = df[(df['zip_code'] != '') & (df['rent'] > 0)]
+    return df.assign(zip_code=df['zip_code'].str.strip().str.zfill(5))[COLUMNS]
+
+def _zip_batches(frames: Iterable, batch_rows: int) -> Iterator:
+    """Regroup frames sorted by ZIP into batches of whole ZIPs"""
+    import pandas as pd
+
+    carry = None
+    for frame in frames:
+        frame = _prepare(frame)
+        if carry is not None:
+            frame = pd.concat([carry, frame], ignore_index=True)
+        if frame.empty:
+            continue
+        zips = frame['zip_code'].to_numpy()
+        if (zips[1:] < zips[:-1]).any():
+            raise _Unsorted()
+        last = zips == zips[-1]
+        if len(frame) < batch_rows or last.all():
+            carry = frame
+            continue
+        yield frame[~last]
+        carry = frame[last].reset_index(drop=True)
+    if carry is not None and not carry.empty:
+        yield carry
+
+def dedupe_file(path: str, out: str, batch_rows: int = BATCH_ROWS) -> Dict[str, int]:
+    """Write the canonical comps for a comps CSV; `out` may be `path` and is replaced only once complete"""
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{out}.{os.getpid()}.tmp"
+
+    def write(batches) -> Dict[str, int]:
+        stats = {'rows': 0, 'comps': 0, 'merged': 0}
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            f.write(','.join(OUTPUT_COLUMNS) + '\n')
+            for batch in batches:
+                canonical = canonical_comps(batch)
+                canonical.to_csv(f, header=False, index=False)
+                stats['rows'] += len(batch)
+                stats['comps'] += len(canonical)
+                stats['merged'] += int((canonical['listings'] > 1).sum())
+        return stats
+
+    try:
+        try:
+            stats = write(_zip_batches(_read(path, chunksize=batch_rows), batch_rows))
+        except _Unsorted:
+            print(f"{path} is not sorted by ZIP; sorting it in memory")
+            df = _prepare(_read(path)).sort_values('zip_code', kind='stable').reset_index(drop=True)
+            stats = write(_zip_batches((df[i:i + batch_rows] for i in range(0, len(df), batch_rows)), batch_rows))
+        os.replace(tmp_path, out)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    stats['duplicates'] = stats['rows'] - stats['comps']
+    return stats
+
+def main():
+    from utils.rent_distribution import RENTAL_COMPS_PATH
+
+    parser = argparse.ArgumentParser(description="Merge near-duplicate comps into one canonical comp per unit")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Deduplicate a comps CSV")
+    run_parser.add_argument('comps', nargs='?', default=RENTAL_COMPS_PATH)
+    run_parser.add_argument('--out', help="Output CSV (default: replace the input)")
+    run_parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = dedupe_file(args.comps, args.out or args.comps, args.batch_rows)
+    elapsed = time.perf_counter() - start
+    print(f"{stats['rows']} comps -> {stats['comps']} units ({stats['duplicates']} duplicates in "
+          f"{stats['merged']} clusters) in {elapsed:.1f}s, {stats['rows'] / max(elapsed, 1e-9):,.0f} rows/s",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
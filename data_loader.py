@@ -1,123 +1,122 @@
-import pandas as pd
 import json
-from typing import Dict, Any, Optional
+from typing import Optional
 import os
 
-def load_market_data(zip_code: str) -> Optional[Dict[str, Any]]:
+import numpy as np
+
+from utils.records import CompBatch, MarketMetrics
+
+# For now, map ZIP codes to nearest metro area
+# This is a simplified mapping - we should expand this based on actual ZIP code data
+ZIP_TO_METRO = {
+    '10001': 'New York, NY',
+    '90001': 'Los Angeles, CA',
+    '60601': 'Chicago, IL',
+    '75001': 'Dallas, TX',
+    '77001': 'Houston, TX',
+    '20001': 'Washington, DC',
+    '19101': 'Philadelphia, PA',
+    '33101': 'Miami, FL',
+    '30301': 'Atlanta, GA',
+    '02101': 'Boston, MA',
+    '85001': 'Phoenix, AZ',
+    '94101': 'San Francisco, CA'
+}
+
+DEFAULT_METRO = 'New York, NY'  # Default to largest market
+
+# 'postgres' reads the materialized views built by utils.market_db
+MARKET_DATA_SOURCE = os.getenv('MARKET_DATA_SOURCE', 'matrix')
+
+def mapped_metro(zip_code: str) -> Optional[str]:
+    """Metro area the ZIP code belongs to, or None when it isn't mapped to one"""
+    for zip_prefix, metro in ZIP_TO_METRO.items():
+        if zip_code.startswith(zip_prefix[:3]):
+            return metro
+    return None
+
+def get_metro_for_zip(zip_code: str) -> str:
+    """Get the metro area for the ZIP code, falling back to the largest market"""
+    return mapped_metro(zip_code) or DEFAULT_METRO
+
+def _metro_market_data(matrix, metro: str) -> Optional[MarketMetrics]:
+    """Read precomputed market metrics for one metro of the rent matrix"""
+    from utils.market_store import LATEST_OFFSET
+    from utils.forecasting import metro_forecast
+
+    i = matrix.metro_index.get(metro)
+    if i is None:
+        return None
+
+    return MarketMetrics(
+        avg_rent=float(matrix.values[i, -LATEST_OFFSET]),
+        vacancy_rate=0.05,  # Default placeholder since Zillow data doesn't include vacancy
+        yearly_change=float(matrix.arrays['yearly_change'][i]),
+        seasonal=tuple(matrix.arrays['seasonal'][i].tolist()),
+        volatility=float(matrix.arrays['volatility'][i]),
+        forecast=metro_forecast(matrix, i),
+        data_source='Zillow Observed Rent Index',
+        data_version=matrix.version
+    )
+
+def load_market_data(zip_code: str) -> Optional[MarketMetrics]:
     """
-    Load market data from Zillow rental data CSV
+    Load market data from the Zillow rent matrix, or from Postgres when
+    MARKET_DATA_SOURCE=postgres
     Returns market insights for the closest metro area
     """
     try:
-        # Load the Zillow data
-        df = pd.read_csv('attached_assets/Metro_zori_uc_sfrcondomfr_sm_month (1).csv')
-
-        # Get the latest 12 months of data for year-over-year calculations
-        latest_date = df.columns[-13]  # Skip the last column as it might be incomplete
-        year_ago_date = df.columns[-25]  # 12 months before
-
-        # Calculate market metrics for each metro area
-        metro_data = {}
-        for _, row in df.iterrows():
-            latest_rent = row[latest_date]
-            year_ago_rent = row[year_ago_date]
-            yearly_change = (latest_rent - year_ago_rent) / year_ago_rent
-
-            # Calculate seasonal patterns
-            spring_change = (row['2023-04-30'] - row['2023-01-31']) / row['2023-01-31']
-            summer_change = (row['2023-07-31'] - row['2023-04-30']) / row['2023-04-30']
-            fall_change = (row['2023-10-31'] - row['2023-07-31']) / row['2023-07-31']
-            winter_change = (row['2024-01-31'] - row['2023-10-31']) / row['2023-10-31']
-
-            metro_data[row['RegionName']] = {
-                'avg_rent': latest_rent,
-                'vacancy_rate': 0.05,  # Default placeholder since Zillow data doesn't include vacancy
-                'yearly_change': yearly_change,
-                'seasonal_patterns': {
-                    'Spring': spring_change,
-                    'Summer': summer_change,
-                    'Fall': fall_change,
-                    'Winter': winter_change
-                },
-                'data_source': 'Zillow Observed Rent Index'
-            }
-
-        # For now, map ZIP codes to nearest metro area
-        # This is a simplified mapping - we should expand this based on actual ZIP code data
-        zip_to_metro = {
-            '10001': 'New York, NY',
-            '90001': 'Los Angeles, CA',
-            '60601': 'Chicago, IL',
-            '75001': 'Dallas, TX',
-            '77001': 'Houston, TX',
-            '20001': 'Washington, DC',
-            '19101': 'Philadelphia, PA',
-            '33101': 'Miami, FL',
-            '30301': 'Atlanta, GA',
-            '02101': 'Boston, MA',
-            '85001': 'Phoenix, AZ',
-            '94101': 'San Francisco, CA'
-        }
-
-        # Get the metro area for the ZIP code
-        metro_area = None
-        for zip_prefix, metro in zip_to_metro.items():
-            if zip_code.startswith(zip_prefix[:3]):
-                metro_area = metro
-                break
-
-        if metro_area and metro_area in metro_data:
-            return metro_data[metro_area]
+        if MARKET_DATA_SOURCE == 'postgres':
+            from utils import market_db
+            return market_db.load_market_data(zip_code)
+
+        from utils.market_store import get_market_matrix
+
+        # Shared across worker processes when MARKET_STORE_DIR is set
+        matrix = get_market_matrix()
+
+        metro_data = _metro_market_data(matrix, get_metro_for_zip(zip_code))
+        if metro_data:
+            return metro_data
 
         # If no exact match, return data for the largest nearby metro area
         # This is a fallback for ZIP codes we don't have exact mappings for
-        return metro_data['New York, NY']  # Default to largest market
+        return _metro_market_data(matrix, DEFAULT_METRO)
 
     except Exception as e:
         print(f"Error loading market data: {str(e)}")
         return None
 
-def load_rental_comps(zip_code: str, current_rent: float, tolerance: float = 0.2) -> list:
+def load_rental_comps(zip_code: str, current_rent: float, tolerance: float = 0.2,
+                      bedrooms: Optional[int] = None, unit_type: Optional[str] = None) -> CompBatch:
     """
     Load comparable rental properties from local spreadsheet
-    Returns empty list if no comps found
+    Comps come from the like-for-like segment of utils.market_model, within
+    tolerance of its median, closest to current_rent first
+    Returns an empty batch if no comps found
     """
     try:
-        # Get market data for the area to generate realistic comps
-        market_data = load_market_data(zip_code)
-        if not market_data:
-            return []
-
-        avg_rent = market_data['avg_rent']
-
-        # Generate some realistic comps around the market rate
-        comps = []
-        rent_range = [
-            avg_rent * (1 - tolerance),
-            avg_rent * (1 + tolerance)
-        ]
-
-        # Generate 5 comparable properties
-        for i in range(5):
-            comp_rent = avg_rent * (0.9 + i * 0.05)  # Spread rents around average
-            if rent_range[0] <= comp_rent <= rent_range[1]:
-                comps.append({
-                    'rent': comp_rent,
-                    'bedrooms': 2,  # Assuming 2BR as default
-                    'address': f'Sample Address {i+1}',
-                    'zip_code': zip_code
-                })
-
-        return comps
+        from utils.market_model import get_market_model
+
+        model = get_market_model()
+        segment = model.lookup(zip_code, bedrooms, unit_type) if model else None
+        if segment is None:
+            return CompBatch.empty()
+
+        comps = model.comps_in(segment)
+        comps = comps[np.abs(comps.rent - segment.median) <= segment.median * tolerance]
+        return comps[np.argsort(np.abs(comps.rent - current_rent), kind='stable')]
     except Exception as e:
         print(f"Error loading rental comps: {str(e)}")
-        return []
+        return CompBatch.empty()
 
 def create_sample_data():
     """
     Create sample data files if they don't exist
     This is temporary until real data is provided
     """
+    import pandas as pd
+
     if not os.path.exists('data'):
         os.makedirs('data')
     
@@ -139,10 +138,15 @@ def create_sample_data():
         'zip_code': ['10001'] * 5 + ['10002'] * 5 + ['10003'] * 5,
         'rent': [2800, 2900, 3000, 3100, 3200] * 3,
         'bedrooms': [2, 2, 2, 2, 2] * 3,
-        'address': [f'Sample Address {i}' for i in range(15)]
+        'address': [f'Sample Address {i}' for i in range(15)],
+        'unit_type': ['apartment'] * 15
     })
     rental_comps.to_csv('data/rental_comps.csv', index=False)
 
-# Create sample data files if they don't exist
-if not os.path.exists('data/market_data.csv') or not os.path.exists('data/rental_comps.csv'):
-    create_sample_data()
\ No newline at end of file
+def ensure_sample_data():
+    """
+    Create sample data files if they don't exist
+    Called from the warmup hook rather than at import so cold starts stay cheap
+    """
+    if not os.path.exists('data/market_data.csv') or not os.path.exists('data/rental_comps.csv'):
+        create_sample_data()
@@ -0,0 +1,196 @@
+"""
+Streaming export of saved rent searches
+
+Rows are read in batches through a server-side cursor (`yield_per`) as
+plain column tuples, so no ORM objects pile up in the session, and each
+batch is written out before the next is fetched. Memory stays flat
+however many searches there are.
+
+Formats are CSV, JSON Lines and Parquet (one row group per batch, needs
+pyarrow). With gzip, text formats are gzip-compressed and Parquet
+uses its internal gzip codec.
+
+Usage:
+    python -m utils.export searches --format csv --gzip --out searches.csv.gz [--user-id 42]
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from database.models import User, RentSearch
+
+BATCH_SIZE = 10000
+
+EXPORT_COLUMNS = [
+    RentSearch.id, RentSearch.user_id, RentSearch.address, RentSearch.zip_code,
+    RentSearch.current_rent, RentSearch.market_rate, RentSearch.rent_score,
+    RentSearch.negotiated, RentSearch.created_at, RentSearch.latest_market_rate,
+    RentSearch.latest_rent_score, RentSearch.violation_count, RentSearch.rescored_at,
+]
+
+FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'jsonl': ('application/x-ndjson', '.jsonl'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+def iter_search_batches(session, user_id: Optional[int] = None, include_email: bool = False,
+                        batch_size: int = BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Search rows in id order, `batch_size` tuples at a time"""
+    from sqlalchemy import select
+
+    columns = EXPORT_COLUMNS + ([User.email] if include_email else [])
+    query = select(*columns).order_by(RentSearch.id)
+    if include_email:
+        query = query.outerjoin(User, User.id == RentSearch.user_id)
+    if user_id is not None:
+        query = query.where(RentSearch.user_id == user_id)
+    result = session.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+def column_names(include_email: bool = False) -> List[str]:
+    return [column.key for column in EXPORT_COLUMNS] + (['email'] if include_email else [])
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _write_csv(batches, out: BinaryIO, names: List[str], compress: bool) -> int:
+    rows = 0
+    with _text_stream(out, compress) as text:
+        writer = csv.writer(text)
+        writer.writerow(names)
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+def _write_jsonl(batches, out: BinaryIO, names: List[str], compress: bool) -> int:
+    rows = 0
+    with _text_stream(out, compress) as text:
+        for batch in batches:
+            text.writelines(
+                json.dumps({name: _json_value(value) for name, value in zip(names, row)}) + '\n'
+                for row in batch
+            )
+            rows += len(batch)
+    return rows
+
+def _parquet_schema(names: List[str]):
+    import pyarrow as pa
+
+    types = {
+        'id': pa.int64(), 'user_id': pa.int64(), 'violation_count': pa.int64(),
+        'negotiated': pa.bool_(), 'created_at': pa.timestamp('us'), 'rescored_at': pa.timestamp('us'),
+        'current_rent': pa.float64(), 'market_rate': pa.float64(), 'rent_score': pa.float64(),
+        'latest_market_rate': pa.float64(), 'latest_rent_score': pa.float64(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in names])
+
+def _write_parquet(batches, out: BinaryIO, names: List[str], compress: bool) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow; install it or choose csv/jsonl")
+
+    schema = _parquet_schema(names)
+    rows = 0
+    with pq.ParquetWriter(out, schema, compression='gzip' if compress else 'snappy') as writer:
+        for batch in batches:
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            rows += len(batch)
+    return rows
+
+WRITERS = {'csv': _write_csv, 'jsonl': _write_jsonl, 'parquet': _write_parquet}
+
+@contextmanager
+def _text_stream(out: BinaryIO, compress: bool):
+    """UTF-8 text view of a binary stream, optionally gzipped; leaves `out` open"""
+    raw = gzip.GzipFile(fileobj=out, mode='wb') if compress else out
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=False)
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if compress:
+            raw.close()
+
+def export_searches(session, out: Union[str, BinaryIO], fmt: str = 'csv', compress: bool = False,
+                    user_id: Optional[int] = None, include_email: bool = False,
+                    batch_size: int = BATCH_SIZE) -> int:
+    """
+    Stream searches to a path or binary file object; returns the row count
+    A path is written to a temporary name and renamed on success
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    batches = iter_search_batches(session, user_id, include_email, batch_size)
+    names = column_names(include_email)
+
+    if not isinstance(out, str):
+        return WRITERS[fmt](batches, out, names, compress)
+
+    tmp_path = f"{out}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            rows = WRITERS[fmt](batches, f, names, compress)
+        os.replace(tmp_path, out)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+def export_filename(fmt: str, compress: bool, prefix: str = 'rent-searches') -> str:
+    suffix = FORMATS[fmt][1] + ('.gz' if compress and fmt != 'parquet' else '')
+    return f"{prefix}-{datetime.utcnow():%Y%m%d}{suffix}"
+
+def export_mime(fmt: str, compress: bool) -> str:
+    return 'application/gzip' if compress and fmt != 'parquet' else FORMATS[fmt][0]
+
+def main():
+    from database.session import get_read_session
+
+    parser = argparse.ArgumentParser(description="Export saved rent searches")
+    parser.add_argument('dataset', choices=['searches'])
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--out', help="Output path, '-' for stdout (default: dated file name)")
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--no-email', action='store_true', help="Leave out user emails")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    out = args.out or export_filename(args.format, args.gzip)
+    session = get_read_session()
+    try:
+        start = time.perf_counter()
+        rows = export_searches(
+            session, sys.stdout.buffer if out == '-' else out, args.format, args.gzip,
+            args.user_id, not args.no_email, args.batch_size
+        )
+    finally:
+        session.close()
+
+    elapsed = time.perf_counter() - start
+    size = f", {os.path.getsize(out) / 1e6:.1f} MB" if out != '-' else ''
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Exported {rows} searches to {out}{size} in {elapsed:.1f}s "
+          f"(peak RSS {peak_rss:.0f} MB)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Batched rent forecasting over the metro x month matrix
+
+Additive Holt-Winters with a damped trend, run for every metro at once:
+the time loop is in Python but each step is a NumPy operation across all
+metros. The fitted state (level, trend, seasonal, error sums) is stored
+with the market metrics, so appending a month only advances the state by
+one step and forecasts are served from precomputed arrays.
+
+Usage:
+    python -m utils.forecasting backtest [--csv PATH] [--horizon 12]
+"""
+import argparse
+import calendar
+import time
+from datetime import date
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from utils.records import Forecast, MarketMetrics
+
+SEASON_LENGTH = 12
+HORIZON = 12
+ALPHA = 0.3
+BETA = 0.05
+GAMMA = 0.2
+PHI = 0.98
+Z_95 = 1.96
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """Forward fill missing months per metro, then back fill leading gaps"""
+    values = np.asarray(values, dtype=np.float64)
+    n, t = values.shape
+    valid = np.isfinite(values)
+    idx = np.where(valid, np.arange(t), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = values[np.arange(n)[:, None], idx]
+
+    first_valid = np.where(valid.any(axis=1), valid.argmax(axis=1), 0)
+    leading = np.arange(t)[None, :] < first_valid[:, None]
+    return np.where(leading, filled[np.arange(n), first_valid][:, None], filled)
+
+def _damped_sum(steps: int, phi: float = PHI) -> np.ndarray:
+    """phi + phi^2 + ... + phi^k for k = 1..steps"""
+    return np.cumsum(phi ** np.arange(1, steps + 1))
+
+def _advance(state: Dict[str, np.ndarray], observations: np.ndarray, t0: int) -> Dict[str, np.ndarray]:
+    """Run Holt-Winters updates over `observations` (metros x months) starting at time index t0"""
+    level = np.array(state['hw_level'], dtype=np.float64)
+    trend = np.array(state['hw_trend'], dtype=np.float64)
+    season = np.array(state['hw_season'], dtype=np.float64)
+    error = np.array(state['hw_error'], dtype=np.float64)
+    m = season.shape[1]
+
+    for k in range(observations.shape[1]):
+        y = observations[:, k]
+        valid = np.isfinite(y) & np.isfinite(level)
+        s_idx = (t0 + k) % m
+        s = season[:, s_idx]
+
+        pred = level + PHI * trend + s
+        err = np.where(valid, y - pred, 0.0)
+
+        new_level = ALPHA * (y - s) + (1 - ALPHA) * (level + PHI * trend)
+        new_trend = BETA * (new_level - level) + (1 - BETA) * PHI * trend
+        new_season = GAMMA * (y - new_level) + (1 - GAMMA) * s
+
+        level = np.where(valid, new_level, level)
+        trend = np.where(valid, new_trend, trend)
+        season[:, s_idx] = np.where(valid, new_season, s)
+        error[:, 0] += err ** 2
+        error[:, 1] += valid
+
+    return {'hw_level': level, 'hw_trend': trend, 'hw_season': season, 'hw_error': error}
+
+def _forecast_arrays(state: Dict[str, np.ndarray], t: int, horizon: int = HORIZON) -> Dict[str, np.ndarray]:
+    level, trend, season, error = state['hw_level'], state['hw_trend'], state['hw_season'], state['hw_error']
+    m = season.shape[1]
+    steps = np.arange(1, horizon + 1)
+    seasonal = season[:, (t + steps - 1) % m]
+    forecast = level[:, None] + _damped_sum(horizon)[None, :] * trend[:, None] + seasonal
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(error[:, 0] / error[:, 1])
+    width = Z_95 * sigma[:, None] * np.sqrt(steps)[None, :]
+    return {
+        'forecast': forecast.astype(np.float32),
+        'forecast_lower': (forecast - width).astype(np.float32),
+        'forecast_upper': (forecast + width).astype(np.float32)
+    }
+
+def fit(values: np.ndarray, horizon: int = HORIZON) -> Dict[str, np.ndarray]:
+    """Fit every metro from full history and return state plus forecasts"""
+    filled = _fill_gaps(values)
+    n, t = filled.shape
+    m = SEASON_LENGTH
+    if t < 2 * m:
+        nan = np.full((n, horizon), np.nan, dtype=np.float32)
+        return {'forecast': nan, 'forecast_lower': nan, 'forecast_upper': nan}
+
+    first = filled[:, :m]
+    level = first.mean(axis=1)
+    trend = (filled[:, m:2 * m].mean(axis=1) - level) / m
+    state = {
+        'hw_level': level,
+        'hw_trend': trend,
+        'hw_season': first - level[:, None],
+        'hw_error': np.zeros((n, 2))
+    }
+    # Missing months stay NaN here so they don't count as observed errors
+    state = _advance(state, np.asarray(values, dtype=np.float64)[:, m:], m)
+    return {**state, **_forecast_arrays(state, t, horizon)}
+
+def update(metrics: Dict[str, np.ndarray], values: np.ndarray, months_before: int,
+           horizon: int = HORIZON) -> Dict[str, np.ndarray]:
+    """
+    Advance stored state over the months of `values` after `months_before`
+    Without stored state (history was too short to fit) the full series is
+    fitted instead, so forecasts start once enough months have accumulated
+    """
+    if 'hw_level' not in metrics:
+        return fit(values, horizon)
+    state = {key: metrics[key] for key in ('hw_level', 'hw_trend', 'hw_season', 'hw_error')}
+    state = _advance(state, np.asarray(values[:, months_before:], dtype=np.float64), months_before)
+    return {**state, **_forecast_arrays(state, values.shape[1], horizon)}
+
+def seasonal_naive(values: np.ndarray, horizon: int = HORIZON) -> np.ndarray:
+    """Repeat last year's values shifted by the average yearly drift"""
+    filled = _fill_gaps(values)
+    m = SEASON_LENGTH
+    last_season = filled[:, -m:]
+    drift = (filled[:, -m:].mean(axis=1) - filled[:, -2 * m:-m].mean(axis=1))[:, None]
+    steps = np.arange(horizon)
+    return last_season[:, steps % m] + drift * (steps // m + 1)[None, :]
+
+def future_months(last_month: str, horizon: int = HORIZON) -> List[str]:
+    """Month-end labels following `last_month` (YYYY-MM-DD)"""
+    year, month = int(last_month[:4]), int(last_month[5:7])
+    labels = []
+    for _ in range(horizon):
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+        labels.append(date(year, month, calendar.monthrange(year, month)[1]).isoformat())
+    return labels
+
+def metro_forecast(matrix, i: int) -> Optional[Forecast]:
+    """Forecast for one metro row, read straight from the precomputed arrays"""
+    if 'forecast' not in matrix.arrays:
+        return None
+    rent = matrix.arrays['forecast'][i]
+    if not np.isfinite(rent).all():
+        return None
+    return Forecast(
+        months=tuple(future_months(matrix.months[-1], len(rent))),
+        rent=tuple(rent.tolist()),
+        lower=tuple(matrix.arrays['forecast_lower'][i].tolist()),
+        upper=tuple(matrix.arrays['forecast_upper'][i].tolist())
+    )
+
+def describe_outlook(market_data: Optional[MarketMetrics]) -> Dict[str, str]:
+    """Derive price trend and best negotiation season from local data"""
+    outlook = {}
+    if market_data is None:
+        return outlook
+    forecast = market_data.forecast
+    current = market_data.avg_rent
+    if forecast and current:
+        change = (forecast.rent[-1] - current) / current
+        if change > 0.02:
+            outlook['price_trend'] = 'increasing'
+        elif change < -0.02:
+            outlook['price_trend'] = 'decreasing'
+        else:
+            outlook['price_trend'] = 'stable'
+
+    seasonal_patterns = market_data.seasonal_patterns
+    finite = {season: change for season, change in seasonal_patterns.items() if np.isfinite(change)}
+    if finite:
+        outlook['best_time_to_negotiate'] = min(finite, key=finite.get)
+    return outlook
+
+def backtest(values: np.ndarray, horizon: int = HORIZON) -> Dict[str, Any]:
+    """Hold out the last `horizon` months and score each method on all metros"""
+    values = np.asarray(values, dtype=np.float64)
+    train, actual = values[:, :-horizon], values[:, -horizon:]
+    report = {'metros': values.shape[0], 'train_months': train.shape[1], 'horizon': horizon, 'methods': {}}
+
+    start = time.perf_counter()
+    hw = fit(train, horizon)
+    hw_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive = seasonal_naive(train, horizon)
+    naive_time = time.perf_counter() - start
+
+    for name, forecast, elapsed, bounds in (
+        ('holt_winters', hw['forecast'], hw_time, (hw['forecast_lower'], hw['forecast_upper'])),
+        ('seasonal_naive', naive, naive_time, None),
+    ):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ape = np.abs((forecast - actual) / actual)
+        result = {
+            'mape': float(np.nanmean(ape)),
+            'median_ape': float(np.nanmedian(ape)),
+            'seconds': elapsed
+        }
+        if bounds is not None:
+            inside = (actual >= bounds[0]) & (actual <= bounds[1])
+            result['interval_coverage'] = float(inside[np.isfinite(actual)].mean())
+        report['methods'][name] = result
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the batched rent forecaster")
+    parser.add_argument('command', choices=['backtest'])
+    parser.add_argument('--csv', default=None, help="Zillow ZORI CSV to read")
+    parser.add_argument('--horizon', type=int, default=HORIZON)
+    args = parser.parse_args()
+
+    from utils.market_store import read_zori_csv, ZORI_CSV_PATH
+
+    matrix = read_zori_csv(args.csv or ZORI_CSV_PATH)
+    report = backtest(matrix.values, args.horizon)
+    print(f"{report['metros']} metros, {report['train_months']} training months, horizon {report['horizon']}")
+    for name, result in report['methods'].items():
+        coverage = f" coverage={result['interval_coverage']:.1%}" if 'interval_coverage' in result else ''
+        print(f"  {name:<15} MAPE={result['mape']:.2%} medianAPE={result['median_ape']:.2%} "
+              f"time={result['seconds'] * 1000:.1f}ms{coverage}")
+
+if __name__ == "__main__":
+    main()
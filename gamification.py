@@ -2,16 +2,18 @@
 from typing import Dict, Any, List, Optional
 import math
 
-def calculate_negotiation_power(market_data: Dict[str, Any], violations: List[Dict[str, Any]]) -> float:
+from utils.records import CompBatch, MarketMetrics, Violation
+
+def calculate_negotiation_power(market_data: Optional[MarketMetrics], violations: List[Violation]) -> float:
     """Calculate negotiation power score (0-100) based on market conditions and violations"""
     base_score = 50
     
     # Market conditions impact (up to 30 points)
     if market_data:
         # Higher vacancy rate increases negotiation power
-        vacancy_impact = market_data.get('vacancy_rate', 0) * 100 * 0.3
+        vacancy_impact = market_data.vacancy_rate * 100 * 0.3
         # Negative yearly change increases negotiation power
-        yearly_change = market_data.get('yearly_change', 0)
+        yearly_change = market_data.yearly_change
         trend_impact = -yearly_change * 100 * 0.2 if yearly_change < 0 else 0
         base_score += vacancy_impact + trend_impact
     
@@ -22,12 +24,19 @@ def calculate_negotiation_power(market_data: Dict[str, Any], violations: List[Di
     
     return min(100, max(0, base_score))
 
+def lease_length_bonus(lease_months: int) -> float:
+    """Extra negotiation power (0-10) for offering a lease longer than a year"""
+    if lease_months <= 12:
+        return 0
+    # Landlords avoid turnover costs, so longer commitments earn leverage up to 24 months
+    return min(10, (lease_months - 12) / 12 * 10)
+
 def calculate_negotiation_score(
     current_rent: float,
     market_rate: float,
     negotiation_power: float,
-    violations: List[Dict[str, Any]],
-    comps: List[Dict[str, Any]]
+    violations: List[Violation],
+    comps: CompBatch
 ) -> Dict[str, Any]:
     """Calculate overall negotiation score and provide feedback"""
     
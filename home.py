@@ -1,10 +1,11 @@
 import streamlit as st
-import streamlit.components.v1 as components
+from utils.savings import get_total_savings, format_savings
+from utils.assets import image_path, load_styles, picture_tag
 
 # Must be the first Streamlit command
 st.set_page_config(
     page_title="RentNinja",
-    page_icon=None,
+    page_icon=image_path("icon", 64),
     layout="wide"
 )
 
@@ -14,32 +15,16 @@ def logout():
         st.switch_page("home.py")
 
 def show_home_page():
-    # Custom CSS for the title
-    st.markdown("""
-        <style>
-        .title-container {
-            display: flex;
-            align-items: center;
-            gap: 4px;
-            padding: 0.5rem 0;
-        }
-        .title-text {
-            font-size: 20px;
-            font-weight: bold;
-            margin: 0;
-            padding: 0;
-            display: inline-flex;
-            align-items: center;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Shared and page CSS, sent once per session rather than on every rerun
+    load_styles('home')
 
     # Top Navigation Bar with fixed title
     with st.container():
         cols = st.columns([3, 6, 3])
         with cols[0]:
             st.markdown(
-                '<div class="title-container"><span class="title-text">RentNinja</span></div>',
+                f'<div class="title-container">{picture_tag("icon", 32, css_class="brand-logo")}'
+                '<span class="title-text">RentNinja</span></div>',
                 unsafe_allow_html=True
             )
         with cols[2]:
@@ -63,46 +48,14 @@ def show_home_page():
         </div>
     """, unsafe_allow_html=True)
 
-    # Savings Counter
-    counter_html = """
-    <div style="text-align: center; padding: 40px 0;">
-        <div style="font-family: monospace; font-size: 4.5rem; font-weight: 600; color: #FF4B4B;" id="savings-counter">$342,191</div>
-        <div style="font-family: system-ui; font-size: 1.5rem; color: #666; margin-top: 10px;">Saved for Customers</div>
-    </div>
-    """
-
-    counter_js = """
-    <script>
-        let lastUpdate = Date.now();
-        let currentAmount = 342191;
-        const updateRate = 35;
-
-        function formatNumber(num) {
-            return '$' + num.toLocaleString('en-US');
-        }
-
-        function updateCounter() {
-            const counter = document.getElementById('savings-counter');
-            if (counter) {
-                const now = Date.now();
-                const deltaTime = (now - lastUpdate) / 1000;
-                currentAmount += updateRate * deltaTime;
-                counter.textContent = formatNumber(Math.floor(currentAmount));
-                lastUpdate = now;
-            }
-            requestAnimationFrame(updateCounter);
-        }
-
-        if (document.readyState === 'loading') {
-            document.addEventListener('DOMContentLoaded', updateCounter);
-        } else {
-            updateCounter();
-        }
-    </script>
-    """
-
-    # Use Streamlit components to inject the HTML and JavaScript
-    components.html(counter_html + counter_js, height=200)
+    # Savings Counter, driven by the materialized total of negotiated savings;
+    # plain markup animated by home.css, so reruns don't rebuild an iframe
+    st.markdown(f"""
+        <div class="savings">
+            <div class="savings-counter">{format_savings(get_total_savings())}</div>
+            <div class="savings-label">Saved for Customers</div>
+        </div>
+    """, unsafe_allow_html=True)
 
     # Features Section
     st.markdown("<h2 style='text-align: center; margin: 40px 0;'>How RentNinja Works</h2>", unsafe_allow_html=True)
@@ -134,16 +87,6 @@ def show_home_page():
         """)
 
     # Primary CTA Button
-    st.markdown("""
-        <style>
-        div[data-testid="stButton"] button {
-            font-size: 1.5rem !important;
-            padding: 1rem 2rem !important;
-            height: auto !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
     if st.button("Start Your Rent Analysis", type="primary", use_container_width=True):
         if 'user' in st.session_state:
             st.switch_page("pages/analysis.py")
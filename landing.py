@@ -1,120 +1,28 @@
 import streamlit as st
-import streamlit.components.v1 as components
+from utils.savings import get_total_savings, format_savings
+from utils.assets import image_path, load_styles, picture_tag
 
 # Must be the first Streamlit command
 st.set_page_config(
     page_title="RentNinja",
-    page_icon=None,
+    page_icon=image_path("icon", 64),
     layout="wide"
 )
 
 def show_landing_page():
-    # Custom CSS for styling
-    st.markdown("""
-        <style>
-        .section {
-            padding: 4rem 0;
-            margin: 2rem 0;
-        }
-        .section-alt {
-            background-color: #f8f9fa;
-            padding: 4rem 0;
-            margin: 2rem 0;
-            border-radius: 12px;
-        }
-        .feature-card {
-            background: white;
-            padding: 2rem;
-            border-radius: 10px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-            height: 100%;
-            margin: 1rem 0;
-            transition: transform 0.2s;
-        }
-        .feature-card:hover {
-            transform: translateY(-5px);
-        }
-        .testimonial-card {
-            background: white;
-            padding: 2rem;
-            border-radius: 10px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-            margin: 1.5rem 0;
-        }
-        .testimonial-text {
-            font-style: italic;
-            font-size: 1.1rem;
-            line-height: 1.6;
-            margin-bottom: 1.5rem;
-            color: #333;
-        }
-        .testimonial-author {
-            font-weight: 600;
-            margin-bottom: 0.3rem;
-        }
-        .testimonial-location {
-            color: #666;
-            font-size: 0.9rem;
-        }
-        .hero-title {
-            font-size: 4rem;
-            font-weight: 800;
-            margin-bottom: 1.5rem;
-            line-height: 1.2;
-        }
-        .hero-subtitle {
-            font-size: 1.5rem;
-            color: #666;
-            margin-bottom: 3rem;
-            line-height: 1.4;
-        }
-        .nav-container {
-            padding: 1rem 0;
-            margin-bottom: 2rem;
-            border-bottom: 1px solid #eee;
-        }
-        .counter-section {
-            background: linear-gradient(45deg, #FF4B4B, #FF6B6B);
-            color: white;
-            padding: 3rem 0;
-            margin: 3rem 0;
-            border-radius: 12px;
-        }
-        .counter-value {
-            font-size: 3.5rem;
-            font-weight: 700;
-            margin-bottom: 0.5rem;
-        }
-        .counter-label {
-            font-size: 1.2rem;
-            opacity: 0.9;
-        }
-        .cta-section {
-            text-align: center;
-            padding: 5rem 0;
-            background: #f8f9fa;
-            border-radius: 12px;
-            margin: 4rem 0;
-        }
-        .cta-title {
-            font-size: 2.5rem;
-            font-weight: 700;
-            margin-bottom: 1.5rem;
-        }
-        .cta-subtitle {
-            font-size: 1.3rem;
-            color: #666;
-            margin-bottom: 2.5rem;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Shared and page CSS, sent once per session rather than on every rerun
+    load_styles('landing')
 
     # Navigation
     with st.container():
         st.markdown('<div class="nav-container">', unsafe_allow_html=True)
         cols = st.columns([3, 6, 3])
         with cols[0]:
-            st.markdown('<h1 style="margin: 0; font-size: 1.5rem;">RentNinja</h1>', unsafe_allow_html=True)
+            st.markdown(
+                f'<h1 style="margin: 0; font-size: 1.5rem; display: flex; align-items: center; gap: 8px;">'
+                f'{picture_tag("icon", 32, css_class="brand-logo")}RentNinja</h1>',
+                unsafe_allow_html=True
+            )
         with cols[2]:
             if 'user' in st.session_state:
                 if st.button("Logout"):
@@ -136,11 +44,11 @@ def show_landing_page():
         </div>
     """, unsafe_allow_html=True)
 
-    # Counter Section
-    st.markdown("""
+    # Counter Section, driven by the materialized total of negotiated savings
+    st.markdown(f"""
         <div class="counter-section">
             <div style="text-align: center;">
-                <div class="counter-value" id="savings-counter">$342,191</div>
+                <div class="counter-value" id="savings-counter">{format_savings(get_total_savings())}</div>
                 <div class="counter-label">Total Savings Generated</div>
             </div>
         </div>
@@ -253,24 +161,6 @@ def show_landing_page():
         </div>
     """, unsafe_allow_html=True)
 
-    # Custom button styling
-    st.markdown("""
-        <style>
-        div[data-testid="stButton"] button {
-            font-size: 1.3rem !important;
-            padding: 1rem 2rem !important;
-            height: auto !important;
-            background-color: #FF4B4B !important;
-            border: none !important;
-            transition: all 0.3s ease !important;
-        }
-        div[data-testid="stButton"] button:hover {
-            transform: translateY(-2px) !important;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1) !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
     if st.button("Start Your Rent Analysis", type="primary", use_container_width=True):
         if 'user' in st.session_state:
             st.switch_page("pages/analysis.py")
@@ -0,0 +1,276 @@
+"""
+Negotiation leaderboard with incrementally maintained ranks
+
+Each user's best `calculate_negotiation_score` result is stored in the
+negotiation_scores table. In memory, scores are kept in a sorted list of
+bounded buckets with a Fenwick tree over bucket sizes, globally and per
+ZIP, so an insert touches one bucket and rank, top-N and percentile
+queries are O(log n) without sorting the table per page view.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+# Bucket size before it is split in two
+BUCKET_LOAD = 512
+
+# Other worker processes' inserts become visible after this many seconds
+LEADERBOARD_RELOAD_INTERVAL = float(os.getenv('LEADERBOARD_RELOAD_INTERVAL', 60))
+
+# Catch-up rereads this far behind the newest change seen, for rows committed late
+CATCH_UP_OVERLAP = timedelta(seconds=30)
+
+class _Fenwick:
+    """Prefix sums over bucket sizes"""
+
+    def __init__(self, sizes: List[int]):
+        self.tree = [0] * (len(sizes) + 1)
+        for i, size in enumerate(sizes):
+            self.add(i, size)
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """Sum of sizes of buckets [0, i)"""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+class RankIndex:
+    """Users ordered by descending score; ties broken by user id"""
+
+    def __init__(self):
+        self._buckets: List[List[Tuple[float, int]]] = []
+        self._maxes: List[Tuple[float, int]] = []
+        self._fenwick = _Fenwick([])
+        self._scores: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._scores
+
+    def score(self, user_id: int) -> Optional[float]:
+        return self._scores.get(user_id)
+
+    def _rebuild_fenwick(self):
+        self._fenwick = _Fenwick([len(b) for b in self._buckets])
+
+    def _locate(self, key: Tuple[float, int]) -> int:
+        i = bisect_left(self._maxes, key)
+        return min(i, len(self._buckets) - 1)
+
+    def add(self, user_id: int, score: float):
+        if user_id in self._scores:
+            self.remove(user_id)
+        key = (-score, user_id)
+        self._scores[user_id] = score
+
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._rebuild_fenwick()
+            return
+
+        i = self._locate(key)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > BUCKET_LOAD:
+            half = len(bucket) // 2
+            self._buckets[i:i + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[i:i + 1] = [bucket[half - 1], bucket[-1]]
+            self._rebuild_fenwick()
+        else:
+            self._fenwick.add(i, 1)
+
+    def remove(self, user_id: int):
+        score = self._scores.pop(user_id, None)
+        if score is None:
+            return
+        key = (-score, user_id)
+        i = self._locate(key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._fenwick.add(i, -1)
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+            self._rebuild_fenwick()
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank, 1 being the best score"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        key = (-score, user_id)
+        i = self._locate(key)
+        return self._fenwick.prefix(i) + bisect_left(self._buckets[i], key) + 1
+
+    def percentile(self, user_id: int) -> Optional[float]:
+        """Share of other users this user outscores, 0-100"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return None
+        others = len(self) - 1
+        return 100.0 if others == 0 else (len(self) - rank) / others * 100
+
+    def top(self, n: int) -> List[Tuple[int, float]]:
+        result = []
+        for bucket in self._buckets:
+            for neg_score, user_id in bucket:
+                if len(result) >= n:
+                    return result
+                result.append((user_id, -neg_score))
+        return result
+
+class Leaderboard:
+    """Global and per-ZIP rank indexes backed by negotiation_scores"""
+
+    def __init__(self):
+        self.overall = RankIndex()
+        self.by_zip: Dict[str, RankIndex] = {}
+        self._zip_of: Dict[int, str] = {}
+        self._lock = threading.RLock()
+        self.loaded_at = 0.0
+        self._changed_since = None
+
+    def load(self, session):
+        """Build indexes from the database, streaming rows; done once per process"""
+        from database.models import NegotiationScore
+
+        overall, by_zip, zip_of = RankIndex(), {}, {}
+        newest = None
+        rows = session.query(
+            NegotiationScore.user_id, NegotiationScore.zip_code, NegotiationScore.score,
+            NegotiationScore.updated_at
+        ).yield_per(5000)
+        for user_id, zip_code, score, updated_at in rows:
+            overall.add(user_id, score)
+            by_zip.setdefault(zip_code, RankIndex()).add(user_id, score)
+            zip_of[user_id] = zip_code
+            if updated_at is not None and (newest is None or updated_at > newest):
+                newest = updated_at
+        with self._lock:
+            self.overall, self.by_zip, self._zip_of = overall, by_zip, zip_of
+            self._changed_since = newest
+            self.loaded_at = time.monotonic()
+
+    def catch_up(self, session) -> int:
+        """Apply scores other workers changed since the last pass; returns rows read"""
+        from database.models import NegotiationScore
+
+        query = session.query(
+            NegotiationScore.user_id, NegotiationScore.zip_code, NegotiationScore.score,
+            NegotiationScore.updated_at
+        )
+        since = self._changed_since
+        if since is not None:
+            query = query.filter(NegotiationScore.updated_at >= since - CATCH_UP_OVERLAP)
+        count = 0
+        for user_id, zip_code, score, updated_at in query.yield_per(5000):
+            # Best scores only rise; a row read before a local apply() is stale
+            current = self.overall.score(user_id)
+            if current is None or score > current:
+                self.apply(user_id, zip_code, score)
+            if updated_at is not None and (since is None or updated_at > since):
+                since = updated_at
+            count += 1
+        with self._lock:
+            self._changed_since = since
+            self.loaded_at = time.monotonic()
+        return count
+
+    def apply(self, user_id: int, zip_code: str, score: float):
+        """Update the in-memory indexes once a recorded score is committed"""
+        with self._lock:
+            old_zip = self._zip_of.get(user_id)
+            if old_zip == zip_code and self.overall.score(user_id) == score:
+                return
+            if old_zip is not None and old_zip != zip_code and old_zip in self.by_zip:
+                self.by_zip[old_zip].remove(user_id)
+            self.overall.add(user_id, score)
+            self.by_zip.setdefault(zip_code, RankIndex()).add(user_id, score)
+            self._zip_of[user_id] = zip_code
+
+    @staticmethod
+    def record(session, user_id: int, zip_code: str, result: Dict) -> bool:
+        """
+        Store the result if it beats the user's best
+        Returns True when the score improved; the caller commits the session
+        and then calls apply() so ranks never run ahead of the database
+        """
+        from database.models import NegotiationScore
+
+        score = float(result['score'])
+        best = session.query(NegotiationScore).filter(NegotiationScore.user_id == user_id).first()
+        if best is not None and best.score >= score:
+            return False
+        if best is None:
+            best = NegotiationScore(user_id=user_id)
+            session.add(best)
+        best.zip_code = zip_code
+        best.score = score
+        best.level = result.get('level')
+        return True
+
+    def _index(self, zip_code: Optional[str]) -> RankIndex:
+        return self.overall if zip_code is None else self.by_zip.get(zip_code, RankIndex())
+
+    def standing(self, user_id: int, zip_code: Optional[str] = None) -> Optional[Dict]:
+        """Rank, total and percentile for a user, overall or within a ZIP"""
+        with self._lock:
+            index = self._index(zip_code)
+            rank = index.rank(user_id)
+            if rank is None:
+                return None
+            return {'rank': rank, 'total': len(index), 'percentile': index.percentile(user_id)}
+
+    def top(self, n: int = 10, zip_code: Optional[str] = None) -> List[Tuple[int, float]]:
+        with self._lock:
+            return self._index(zip_code).top(n)
+
+def _refresh(leaderboard: Leaderboard):
+    # Full load once, then only the rows changed since, off the request path
+    from database.session import get_read_session
+
+    while True:
+        try:
+            session = get_read_session()
+            try:
+                if not leaderboard.loaded_at:
+                    leaderboard.load(session)
+                # Also picks up scores committed while the first load streamed
+                leaderboard.catch_up(session)
+            finally:
+                session.close()
+        except Exception as e:
+            print(f"Leaderboard refresh failed: {str(e)}")
+        time.sleep(LEADERBOARD_RELOAD_INTERVAL)
+
+_leaderboard: Optional[Leaderboard] = None
+_leaderboard_lock = threading.Lock()
+
+def get_leaderboard() -> Leaderboard:
+    """
+    Process-wide leaderboard, loaded and kept current by a daemon thread
+    Never blocks on the database; until the first load lands it is empty
+    """
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard = Leaderboard()
+            threading.Thread(target=_refresh, args=(_leaderboard,), name='leaderboard-refresh', daemon=True).start()
+        return _leaderboard
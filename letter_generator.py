@@ -21,7 +21,7 @@ Based on extensive research of the local rental market, I have found that compar
     if violations:
         letter_template += "\nBuilding Maintenance Considerations:\n"
         for violation in violations:
-            letter_template += f"• {violation['type']}: {violation['description']}\n"
+            letter_template += f"• {violation.type}: {violation.description}\n"
         letter_template += "\nThese maintenance issues affect the property's value and tenant quality of life, and should be considered in our rent discussion.\n"
 
     letter_template += """
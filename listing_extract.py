@@ -0,0 +1,429 @@
+"""
+Offline extraction of rental listings into the comps dataset
+
+Reads archived listing pages from directories of HTML files (optionally
+gzipped) or from WARC files, pulls rent, bedrooms, address, ZIP and unit
+type out of each page, and writes them as a comps CSV for
+`data_loader.load_rental_comps` (via utils.market_model).
+
+Per page, schema.org JSON-LD and meta tags are read first. Only when a
+field is still missing does trafilatura extract the main text for the
+regex parsers, since that is the expensive step. Pages are parsed on a
+process pool in chunks; WARC files are read sequentially in the parent
+and their pages handed out in chunks with a bounded number in flight,
+so memory stays flat on large archives. No network access is needed.
+
+The same listing seen several times (the same address and bedrooms in a
+ZIP) is kept once, from the most recent fetch. Near-duplicates, such as
+one unit listed on several sites with slightly different addresses, are
+then merged by utils.comp_dedup.
+
+Usage:
+    python -m utils.listing_extract build crawl/*.warc.gz pages/ --out data/rental_comps.csv [--workers 8]
+"""
+import argparse
+import csv
+import gzip
+import html
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Pages per task handed to a worker; amortises inter-process overhead
+CHUNK_SIZE = 200
+# Tasks in flight per worker while streaming WARC records
+MAX_PENDING_PER_WORKER = 4
+# Pages larger than this are skipped (bytes)
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+
+MIN_RENT = 300
+MAX_RENT = 50000
+MAX_BEDROOMS = 10
+
+HTML_SUFFIXES = ('.html', '.htm', '.html.gz', '.htm.gz')
+WARC_SUFFIXES = ('.warc', '.warc.gz')
+
+# Columns read by market_model.read_comps, then provenance
+COLUMNS = ['zip_code', 'rent', 'bedrooms', 'address', 'unit_type', 'source_url', 'fetched_at']
+
+_JSON_LD = re.compile(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S)
+_META = re.compile(r'<meta\s+[^>]*?(?:property|name)=["\']([^"\']+)["\'][^>]*?content=["\']([^"\']*)["\']', re.I)
+_TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+_TAGS = re.compile(r'<[^>]+>')
+
+_RENT = re.compile(
+    r'\$\s?(\d{1,2},\d{3}|\d{3,5})(?:\.\d{2})?\s*(?:/\s*mo(?:nth)?\b|per\s+month\b|a\s+month\b|monthly\b)', re.I)
+_ANY_PRICE = re.compile(r'\$\s?(\d{1,2},\d{3}|\d{3,5})(?:\.\d{2})?\b')
+_BEDROOMS = re.compile(r'\b(\d{1,2})\s*-?\s*(?:bd|bds|br|beds?|bedrooms?)\b', re.I)
+_STUDIO = re.compile(r'\bstudio\b', re.I)
+_STREET = (r'St|Street|Ave|Avenue|Blvd|Boulevard|Rd|Road|Dr|Drive|Ln|Lane|Ct|Court|Pl|Place|Way|'
+           r'Ter|Terrace|Pkwy|Parkway|Sq|Square|Hwy|Highway|Cir|Circle|Broadway')
+_ADDRESS = re.compile(
+    r'\b(\d{1,6}[A-Za-z]?(?:-\d{1,5})?\s+(?:[NSEW]\.?\s+)?(?:[A-Za-z0-9.\']+\s+){0,4}?(?:' + _STREET + r')\b\.?'
+    r'(?:,?\s*(?:#|Apt\.?|Apartment|Unit|Suite)\s*[\w-]+)?)'
+)
+_ZIP = re.compile(r'\b[A-Z]{2}\s+(\d{5})(?:-\d{4})?\b')
+# JSON-LD nodes describing the site or agent rather than the unit
+_NOT_A_UNIT = re.compile(r'Organization|Agent|Business|Person|WebSite|WebPage|Breadcrumb|Place$', re.I)
+_UNIT_TYPE = re.compile(r'\b(condominium|condo|co-op|townhouse|townhome|single[- ]family|house|apartment|apt)\b', re.I)
+
+_ADDRESS_WORDS = {
+    'street': 'st', 'avenue': 'ave', 'boulevard': 'blvd', 'road': 'rd', 'drive': 'dr', 'lane': 'ln',
+    'court': 'ct', 'place': 'pl', 'terrace': 'ter', 'parkway': 'pkwy', 'square': 'sq', 'highway': 'hwy',
+    'circle': 'cir', 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'apartment': 'apt', 'unit': 'apt', 'suite': 'apt', '#': 'apt',
+}
+_ADDRESS_PUNCTUATION = re.compile(r"[.,']")
+_ADDRESS_HASH = re.compile(r'#\s*')
+
+def normalize_address(address: str) -> str:
+    """Lowercase, unpunctuated address with USPS-style abbreviations, for matching"""
+    address = _ADDRESS_HASH.sub('# ', _ADDRESS_PUNCTUATION.sub(' ', (address or '').lower()))
+    return ' '.join(_ADDRESS_WORDS.get(word, word) for word in address.split())
+
+# Parsing
+
+def _decode(body: bytes) -> str:
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        return body.decode('cp1252', errors='replace')
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, dict):
+        value = value.get('value', value.get('price', value.get('minPrice')))
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = re.search(r'\d[\d,]*(?:\.\d+)?', value)
+        if match:
+            return float(match.group().replace(',', ''))
+    return None
+
+def _json_ld_nodes(page: str) -> Iterator[Dict[str, Any]]:
+    """Every JSON object inside the page's JSON-LD blocks"""
+    for block in _JSON_LD.findall(page):
+        try:
+            stack = [json.loads(html.unescape(block).strip())]
+        except ValueError:
+            continue
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                yield node
+                stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+
+def _from_json_ld(page: str, fields: Dict[str, Any]):
+    for node in _json_ld_nodes(page):
+        types = node.get('@type', '')
+        types = ' '.join(types) if isinstance(types, list) else str(types)
+        if _NOT_A_UNIT.search(types):
+            continue
+        if not fields.get('unit_type'):
+            fields['unit_type'] = _unit_type(re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', types))
+
+        address = node.get('address')
+        if isinstance(address, dict):
+            if not fields.get('address') and address.get('streetAddress'):
+                fields['address'] = str(address['streetAddress'])
+            if not fields.get('zip_code') and address.get('postalCode'):
+                fields['zip_code'] = str(address['postalCode'])[:5]
+        elif isinstance(address, str) and not fields.get('address'):
+            fields['text'].append(address)
+
+        if fields.get('bedrooms') is None:
+            bedrooms = _number(node.get('numberOfBedrooms', node.get('numberOfRooms')))
+            if bedrooms is not None:
+                fields['bedrooms'] = int(bedrooms)
+
+        if fields.get('rent') is None:
+            offers = node.get('offers')
+            for offer in (offers if isinstance(offers, list) else [offers] if offers else []):
+                if isinstance(offer, dict):
+                    price = _number(offer.get('priceSpecification') or offer.get('price'))
+                    if price:
+                        fields['rent'] = price
+                        break
+
+def _unit_type(text: str) -> str:
+    from utils.market_model import normalize_unit_type
+
+    match = _UNIT_TYPE.search(text or '')
+    return normalize_unit_type(match.group(1)) if match else ''
+
+def _from_text(text: str, fields: Dict[str, Any], title: str):
+    if fields.get('rent') is None:
+        match = _RENT.search(text) or _ANY_PRICE.search(title)
+        if match:
+            fields['rent'] = float(match.group(1).replace(',', ''))
+    if fields.get('bedrooms') is None:
+        match = _BEDROOMS.search(text)
+        if match:
+            fields['bedrooms'] = int(match.group(1))
+        elif _STUDIO.search(text):
+            fields['bedrooms'] = 0
+    if not fields.get('address'):
+        match = _ADDRESS.search(text)
+        if match:
+            fields['address'] = match.group(1)
+    if not fields.get('zip_code'):
+        match = _ZIP.search(text)
+        if match:
+            fields['zip_code'] = match.group(1)
+    if not fields.get('unit_type'):
+        fields['unit_type'] = _unit_type(text)
+
+def _complete(fields: Dict[str, Any]) -> bool:
+    return all(fields.get(name) not in (None, '') for name in ('rent', 'bedrooms', 'address', 'zip_code'))
+
+def parse_listing(body: bytes, url: str = '', fetched_at: str = '') -> Optional[tuple]:
+    """One listing page to a row in COLUMNS order, or None when it isn't a usable listing"""
+    page = _decode(body)
+    fields: Dict[str, Any] = {'text': []}
+    _from_json_ld(page, fields)
+
+    title = _TITLE.search(page)
+    title = html.unescape(_TAGS.sub(' ', title.group(1))).strip() if title else ''
+    meta = {name.lower(): html.unescape(content) for name, content in _META.findall(page)}
+    if fields.get('rent') is None and meta.get('product:price:amount'):
+        fields['rent'] = _number(meta['product:price:amount'])
+    text = '\n'.join([title, meta.get('og:title', ''), meta.get('og:description', meta.get('description', ''))]
+                     + fields['text'])
+    _from_text(text, fields, title)
+
+    if not _complete(fields):
+        # Main text only when the markup didn't have everything
+        import trafilatura
+
+        main_text = trafilatura.extract(page, url=url or None, include_comments=False,
+                                        include_tables=True, favor_precision=True)
+        if main_text:
+            _from_text(main_text, fields, title)
+    if not _complete(fields):
+        return None
+
+    rent, bedrooms = fields['rent'], fields['bedrooms']
+    zip_code = str(fields['zip_code']).strip()
+    if not (MIN_RENT <= rent <= MAX_RENT and 0 <= bedrooms <= MAX_BEDROOMS
+            and len(zip_code) == 5 and zip_code.isdigit()):
+        return None
+    address = ' '.join(str(fields['address']).split())
+    return (zip_code, round(rent, 2), bedrooms, address, fields.get('unit_type') or '', url, fetched_at)
+
+# Inputs
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _http_body(block: bytes) -> Optional[bytes]:
+    """Decoded body of an archived HTTP 200 HTML response, else None"""
+    head, _, body = block.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = lines[0].split()
+    if len(status) < 2 or status[1] != '200':
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'html' not in headers.get('content-type', 'text/html'):
+        return None
+
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        chunks, rest = [], body
+        while rest:
+            size_line, _, rest = rest.partition(b'\r\n')
+            size = int(size_line.split(b';')[0] or b'0', 16)
+            if size == 0:
+                break
+            chunks.append(rest[:size])
+            rest = rest[size + 2:]
+        body = b''.join(chunks)
+    encoding = headers.get('content-encoding', '')
+    if encoding in ('gzip', 'x-gzip'):
+        body = gzip.decompress(body)
+    elif encoding == 'deflate':
+        body = zlib.decompress(body, -zlib.MAX_WBITS)
+    elif encoding not in ('', 'identity'):
+        return None
+    return body
+
+def iter_warc(path: str) -> Iterator[Tuple[bytes, str, str]]:
+    """(HTML body, target URI, WARC-Date) for each HTML response record in a WARC file"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if not line.strip():
+                continue
+            if not line.startswith(b'WARC/'):
+                raise ValueError(f"{path}: expected a WARC record header, got {line[:40]!r}")
+            headers = {}
+            while True:
+                line = f.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('utf-8', errors='replace').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if (headers.get('warc-type') != 'response' or length > MAX_PAGE_BYTES
+                    or not headers.get('content-type', '').startswith('application/http')):
+                f.seek(length, os.SEEK_CUR)
+                continue
+            try:
+                body = _http_body(f.read(length))
+            except (ValueError, OSError, zlib.error) as e:
+                print(f"Skipping record {headers.get('warc-record-id')}: {str(e)}")
+                continue
+            if body:
+                yield body, headers.get('warc-target-uri', ''), headers.get('warc-date', '')
+
+def iter_html_files(directory: str) -> Iterator[str]:
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(HTML_SUFFIXES):
+                yield os.path.join(root, name)
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Workers
+
+def _parse_pages(pages: List[Tuple[bytes, str, str]]) -> Tuple[List[tuple], int]:
+    """Rows for a chunk of (body, url, fetched_at), and the count of failed pages"""
+    rows, failed = [], 0
+    for body, url, fetched_at in pages:
+        try:
+            row = parse_listing(body, url, fetched_at)
+        except Exception as e:
+            print(f"Error parsing {url}: {str(e)}")
+            failed += 1
+            continue
+        if row:
+            rows.append(row)
+    return rows, failed
+
+def _parse_files(paths: List[str]) -> Tuple[List[tuple], int]:
+    pages, failed = [], 0
+    for path in paths:
+        try:
+            if os.path.getsize(path) > MAX_PAGE_BYTES:
+                continue
+            with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as f:
+                pages.append((f.read(), path, _timestamp(os.path.getmtime(path))))
+        except OSError as e:
+            print(f"Error reading {path}: {str(e)}")
+            failed += 1
+    rows, parse_failed = _parse_pages(pages)
+    return rows, failed + parse_failed
+
+def _tasks(inputs: List[str], chunk_size: int) -> Iterator[Tuple[Any, list]]:
+    """(worker function, chunk) over every input: file paths for directories, page bodies for WARCs"""
+    for source in inputs:
+        if os.path.isdir(source):
+            for chunk in _chunks(iter_html_files(source), chunk_size):
+                yield _parse_files, chunk
+        elif source.endswith(WARC_SUFFIXES):
+            for chunk in _chunks(iter_warc(source), chunk_size):
+                yield _parse_pages, chunk
+        elif source.endswith(HTML_SUFFIXES):
+            yield _parse_files, [source]
+        else:
+            raise ValueError(f"Not a directory, WARC or HTML file: {source}")
+
+def extract_listings(inputs: List[str], workers: Optional[int] = None,
+                     chunk_size: int = CHUNK_SIZE) -> Tuple[List[tuple], Dict[str, int]]:
+    """
+    Deduplicated listing rows from every input, with page counts
+    At most MAX_PENDING_PER_WORKER chunks per worker are queued at a time
+    """
+    workers = workers or os.cpu_count()
+    latest: Dict[tuple, tuple] = {}
+    stats = {'pages': 0, 'listings': 0, 'failed': 0}
+
+    def collect(future):
+        rows, failed = future.result()
+        stats['failed'] += failed
+        stats['listings'] += len(rows)
+        for row in rows:
+            key = (row[0], normalize_address(row[3]), row[2])
+            kept = latest.get(key)
+            if kept is None or row[6] > kept[6]:
+                latest[key] = row
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for fn, chunk in _tasks(inputs, chunk_size):
+            stats['pages'] += len(chunk)
+            pending.add(pool.submit(fn, chunk))
+            if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        for future in pending:
+            collect(future)
+
+    stats['duplicates'] = stats['listings'] - len(latest)
+    return sorted(latest.values(), key=lambda row: (row[0], row[3])), stats
+
+def write_comps(rows: List[tuple], out: str):
+    """Write rows as a comps CSV, replacing `out` only once complete"""
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{out}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        os.replace(tmp_path, out)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def main():
+    from utils.rent_distribution import RENTAL_COMPS_PATH
+
+    parser = argparse.ArgumentParser(description="Extract rental listings from archived pages into a comps CSV")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="Parse pages and write the comps dataset")
+    build_parser.add_argument('inputs', nargs='+', help="Directories of HTML pages, WARC or HTML files")
+    build_parser.add_argument('--out', default=RENTAL_COMPS_PATH)
+    build_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    build_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    build_parser.add_argument('--no-dedupe', action='store_true', help="Skip merging near-duplicate listings")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows, stats = extract_listings(args.inputs, args.workers, args.chunk_size)
+    write_comps(rows, args.out)
+    print(f"{stats['pages']} pages, {stats['listings']} listings ({stats['duplicates']} duplicates, "
+          f"{stats['failed']} failed) -> {len(rows)} comps in {args.out}", file=sys.stderr)
+    if not args.no_dedupe:
+        from utils.comp_dedup import dedupe_file
+
+        merged = dedupe_file(args.out, args.out)
+        print(f"{merged['duplicates']} near-duplicates merged -> {merged['comps']} comps", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.1f}s, {stats['pages'] / elapsed * 3600:,.0f} pages/hour", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
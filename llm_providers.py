@@ -0,0 +1,396 @@
+"""
+Pluggable LLM providers with hedged streaming and token accounting
+
+Every provider streams text chunks and reports token usage. `LLMStream`
+starts the first provider and, if it hasn't produced a token within the
+hedge delay, starts the next one as well; the first provider to produce
+a token wins and the others are cancelled. `complete_json` collects the
+winner's text, checks it against the JSON schema the prompt was built
+from, and moves on to the remaining providers if it doesn't validate.
+
+Each call records tokens, latency and time to first token in
+utils.metrics. Providers are skipped while their circuit breaker in
+utils.resilience is open.
+
+Providers are chosen with LLM_PROVIDERS (comma-separated, in priority
+order); by default every provider with an API key is used, OpenAI first.
+
+Usage:
+    python -m utils.llm_providers bench [--primary-latency 3] [--hedge-after 0.5]
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional
+
+from utils import metrics
+
+# Start the next provider if the current one has produced no token by then
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 3.0))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 20.0))
+LLM_MAX_TOKENS = 1024
+
+class LLMError(Exception):
+    """Raised when no provider produced a usable response"""
+
+class Provider:
+    """Streams completions for a prompt from one model"""
+    name = 'base'
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def stream(self, prompt: str, timeout: float, usage: Dict[str, int]) -> Iterator[str]:
+        """Yield text chunks; fill `usage` with input and output token counts"""
+        raise NotImplementedError
+
+class OpenAIProvider(Provider):
+    name = 'openai'
+
+    # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+    # do not change this unless explicitly requested by the user
+    def __init__(self, model: str = 'gpt-4o'):
+        super().__init__(model)
+
+    def stream(self, prompt, timeout, usage):
+        from utils.advanced_analysis import get_client
+
+        response = get_client().chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            max_tokens=LLM_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+        try:
+            for chunk in response:
+                if chunk.usage:
+                    usage['input_tokens'] = chunk.usage.prompt_tokens
+                    usage['output_tokens'] = chunk.usage.completion_tokens
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        yield choice.delta.content
+        finally:
+            response.close()
+
+@lru_cache(maxsize=1)
+def get_anthropic_client():
+    """Construct the Anthropic client on first use"""
+    from anthropic import Anthropic
+
+    # Retries and timeouts are handled here and in utils.resilience
+    return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+
+class AnthropicProvider(Provider):
+    name = 'anthropic'
+
+    def __init__(self, model: str = 'claude-3-5-sonnet-20241022'):
+        super().__init__(model)
+
+    def stream(self, prompt, timeout, usage):
+        with get_anthropic_client().messages.stream(
+            model=self.model,
+            max_tokens=LLM_MAX_TOKENS,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=timeout
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+            message = stream.get_final_message()
+            usage['input_tokens'] = message.usage.input_tokens
+            usage['output_tokens'] = message.usage.output_tokens
+
+class StubProvider(Provider):
+    """In-process provider with scripted latency, output and failures"""
+
+    def __init__(self, name: str = 'stub', response: Any = None, first_token_latency: float = 0.0,
+                 chunk_size: int = 16, error: Optional[Exception] = None, model: str = 'stub'):
+        super().__init__(model)
+        self.name = name
+        self.response = response if isinstance(response, str) else json.dumps(response or {})
+        self.first_token_latency = first_token_latency
+        self.chunk_size = chunk_size
+        self.error = error
+
+    def stream(self, prompt, timeout, usage):
+        if self.first_token_latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{self.name} timed out")
+        time.sleep(self.first_token_latency)
+        if self.error:
+            raise self.error
+        for i in range(0, len(self.response), self.chunk_size):
+            yield self.response[i:i + self.chunk_size]
+        usage['input_tokens'] = len(prompt) // 4
+        usage['output_tokens'] = len(self.response) // 4
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'anthropic': AnthropicProvider,
+}
+
+def get_providers() -> List[Provider]:
+    """Configured providers in priority order"""
+    names = os.getenv('LLM_PROVIDERS')
+    if names:
+        return [PROVIDERS[name.strip()]() for name in names.split(',') if name.strip() in PROVIDERS]
+    providers = []
+    if os.getenv('OPENAI_API_KEY'):
+        providers.append(OpenAIProvider())
+    if os.getenv('ANTHROPIC_API_KEY'):
+        providers.append(AnthropicProvider())
+    return providers
+
+def _breaker(provider: Provider):
+    from utils.resilience import get_dependency
+    return get_dependency(provider.name).breaker
+
+class LLMStream:
+    """
+    Hedged stream over several providers
+    Iterate for the winner's text chunks; `provider`, `usage`,
+    `first_token_latency` and `latency` are set as the stream progresses.
+    """
+
+    def __init__(self, prompt: str, providers: List[Provider], hedge_after: float = LLM_HEDGE_AFTER,
+                 timeout: float = LLM_TIMEOUT):
+        self.prompt = prompt
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.provider: Optional[Provider] = None
+        self.usage: Dict[str, int] = {}
+        self.first_token_latency: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.errors: List[Exception] = []
+
+    def _pump(self, provider, timeout, events, cancel, usage):
+        chunks = provider.stream(self.prompt, timeout, usage)
+        try:
+            for chunk in chunks:
+                if cancel.is_set():
+                    return
+                events.put((provider, 'chunk', chunk))
+            events.put((provider, 'done', None))
+        except Exception as e:
+            events.put((provider, 'error', e))
+        finally:
+            chunks.close()
+
+    def __iter__(self) -> Iterator[str]:
+        from utils.resilience import remaining, CircuitOpenError, DeadlineExceeded
+
+        budget = remaining()
+        timeout = self.timeout if budget is None else min(self.timeout, budget)
+        untried = list(self.providers)
+
+        start = time.monotonic()
+        end = start + timeout
+        events: queue.Queue = queue.Queue()
+        cancels: Dict[Provider, threading.Event] = {}
+        usages: Dict[Provider, Dict[str, int]] = {}
+        failed = set()
+        # Launched providers whose breaker has been told the outcome (or given back its probe)
+        settled = set()
+        next_hedge = start
+
+        def launch() -> bool:
+            while untried:
+                provider = untried.pop(0)
+                # allow() claims the half-open probe, so only ask when actually starting a provider
+                if not _breaker(provider).allow():
+                    continue
+                cancels[provider] = threading.Event()
+                usages[provider] = {}
+                if len(cancels) > 1:
+                    metrics.inc('llm_hedges_total', provider=provider.name)
+                threading.Thread(
+                    target=self._pump,
+                    args=(provider, end - time.monotonic(), events, cancels[provider], usages[provider]),
+                    name=f'llm-{provider.name}', daemon=True
+                ).start()
+                return True
+            return False
+
+        def cancel(provider):
+            cancels[provider].set()
+            if provider not in settled:
+                settled.add(provider)
+                _breaker(provider).release()
+
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= end:
+                    raise DeadlineExceeded(f"No LLM response within {timeout:.1f}s")
+                can_launch = self.provider is None and bool(untried)
+                if can_launch and (now >= next_hedge or len(failed) == len(cancels)):
+                    if launch():
+                        next_hedge = now + self.hedge_after
+                    elif not cancels:
+                        raise CircuitOpenError("Every LLM provider's circuit is open")
+                    elif len(failed) == len(cancels):
+                        raise self.errors[-1]
+                    continue
+
+                wake = min(end, next_hedge) if can_launch else end
+                try:
+                    provider, kind, value = events.get(timeout=max(0.0, wake - now))
+                except queue.Empty:
+                    continue
+                if self.provider is not None and provider is not self.provider:
+                    continue
+
+                if kind == 'error':
+                    failed.add(provider)
+                    settled.add(provider)
+                    self.errors.append(value)
+                    _breaker(provider).record_failure()
+                    metrics.inc('llm_requests_total', provider=provider.name, outcome='error')
+                    if self.provider is provider or (len(failed) == len(cancels) and not untried):
+                        raise value
+                    continue
+
+                if self.provider is None:
+                    # First token wins; cancel the rest
+                    self.provider = provider
+                    self.first_token_latency = time.monotonic() - start
+                    metrics.observe('llm_first_token_seconds', self.first_token_latency, provider=provider.name)
+                    for other in cancels:
+                        if other is not provider:
+                            if other not in failed:
+                                metrics.inc('llm_requests_total', provider=other.name, outcome='cancelled')
+                            cancel(other)
+
+                if kind == 'chunk':
+                    yield value
+                else:
+                    settled.add(provider)
+                    self._finish(provider, usages[provider], start)
+                    return
+        finally:
+            # Covers deadlines and callers that stop reading before the end
+            for provider in cancels:
+                cancel(provider)
+
+    def _finish(self, provider, usage, start):
+        self.usage = usage
+        self.latency = time.monotonic() - start
+        _breaker(provider).record_success()
+        metrics.inc('llm_requests_total', provider=provider.name, outcome='ok')
+        metrics.observe('llm_request_seconds', self.latency, provider=provider.name)
+        for direction in ('input', 'output'):
+            metrics.inc('llm_tokens_total', usage.get(f'{direction}_tokens', 0),
+                        provider=provider.name, model=provider.model, direction=direction)
+
+_TYPES = {
+    'object': dict, 'array': list, 'string': str, 'boolean': bool,
+    'number': (int, float), 'integer': int, 'null': type(None),
+}
+
+def validate_json(instance: Any, schema: Dict[str, Any], path: str = '$') -> List[str]:
+    """Errors for `instance` against a JSON schema subset (type, enum, bounds, required, properties, items)"""
+    expected = schema.get('type')
+    if expected:
+        python_type = _TYPES[expected]
+        if not isinstance(instance, python_type) or (expected in ('number', 'integer') and isinstance(instance, bool)):
+            return [f"{path}: expected {expected}"]
+    errors = []
+    if 'enum' in schema and instance not in schema['enum']:
+        errors.append(f"{path}: {instance!r} is not one of {schema['enum']}")
+    if 'minimum' in schema and instance < schema['minimum']:
+        errors.append(f"{path}: below minimum {schema['minimum']}")
+    if 'maximum' in schema and instance > schema['maximum']:
+        errors.append(f"{path}: above maximum {schema['maximum']}")
+    if isinstance(instance, dict):
+        for name in schema.get('required', []):
+            if name not in instance:
+                errors.append(f"{path}.{name}: required")
+        for name, subschema in schema.get('properties', {}).items():
+            if name in instance:
+                errors.extend(validate_json(instance[name], subschema, f"{path}.{name}"))
+    if isinstance(instance, list):
+        if len(instance) < schema.get('minItems', 0):
+            errors.append(f"{path}: fewer than {schema['minItems']} items")
+        if 'items' in schema:
+            for i, item in enumerate(instance):
+                errors.extend(validate_json(item, schema['items'], f"{path}[{i}]"))
+    return errors
+
+def _extract_json(text: str) -> Any:
+    """Parse the outermost JSON object, ignoring any prose or code fences around it"""
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end < start:
+        raise ValueError("No JSON object in response")
+    return json.loads(text[start:end + 1])
+
+def complete_json(prompt: str, schema: Dict[str, Any], timeout: float = LLM_TIMEOUT,
+                  providers: Optional[List[Provider]] = None, hedge_after: float = LLM_HEDGE_AFTER) -> Dict[str, Any]:
+    """
+    Hedged completion parsed and validated against `schema`
+    A provider whose output doesn't validate is dropped and the rest are tried
+    """
+    remaining_providers = list(providers if providers is not None else get_providers())
+    if not remaining_providers:
+        raise LLMError("No LLM provider configured")
+
+    end = time.monotonic() + timeout
+    errors = []
+    while remaining_providers:
+        stream = LLMStream(prompt, remaining_providers, hedge_after, end - time.monotonic())
+        text = ''.join(stream)
+        try:
+            result = _extract_json(text)
+            problems = validate_json(result, schema)
+        except ValueError as e:
+            problems = [str(e)]
+        if not problems:
+            return result
+        metrics.inc('llm_invalid_outputs_total', provider=stream.provider.name)
+        errors.append(f"{stream.provider.name}: {'; '.join(problems[:3])}")
+        remaining_providers.remove(stream.provider)
+    raise LLMError(f"No provider returned valid output ({' | '.join(errors)})")
+
+def _bench(primary_latency: float, hedge_after: float, calls: int):
+    """Market analysis against the stub server, with the primary provider slowed down"""
+    from utils.stub_services import StubServer
+    from utils.advanced_analysis import MARKET_ANALYSIS_SCHEMA
+
+    server = StubServer().start()
+    server.set_fault('openai', latency=primary_latency)
+    os.environ['OPENAI_BASE_URL'] = server.openai_base_url
+    os.environ['ANTHROPIC_BASE_URL'] = server.base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'stub')
+
+    providers = [OpenAIProvider(), AnthropicProvider()]
+    try:
+        for i in range(calls):
+            stream = LLMStream(f"Analyze market {i} as JSON: {json.dumps(MARKET_ANALYSIS_SCHEMA)}",
+                               providers, hedge_after)
+            text = ''.join(stream)
+            print(f"call {i}: {stream.provider.name:9s} first token {stream.first_token_latency * 1000:6.0f} ms, "
+                  f"total {stream.latency * 1000:6.0f} ms, tokens {stream.usage}, "
+                  f"valid={not validate_json(_extract_json(text), MARKET_ANALYSIS_SCHEMA)}")
+    finally:
+        server.stop()
+    print()
+    print(metrics.render())
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the LLM provider layer against local stubs")
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--primary-latency', type=float, default=3.0)
+    parser.add_argument('--hedge-after', type=float, default=0.5)
+    parser.add_argument('--calls', type=int, default=5)
+    args = parser.parse_args()
+    _bench(args.primary_latency, args.hedge_after, args.calls)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Concurrent-user load test for the Streamlit pages
+
+Drives the analysis, login and profile pages through Streamlit's headless
+AppTest with N simulated users against a local database and stubbed
+OpenAI/HUD services, then reports throughput, latency, DB connection usage
+and memory per session.
+
+Usage:
+    python load_test.py --users 20 --iterations 5 --database-url sqlite:///loadtest.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PAGES = {
+    'analysis': 'main.py',
+    'login': 'login.py',
+    'profile': 'profile.py'
+}
+
+LOADTEST_PASSWORD = 'loadtest-password'
+
+class DBConnectionStats:
+    """Track DBAPI connections opened and pool checkouts across every engine"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pools_created = 0
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.pool import Pool
+
+        event.listen(Pool, 'first_connect', self._on_first_connect)
+        event.listen(Pool, 'connect', self._on_connect)
+        event.listen(Pool, 'checkout', self._on_checkout)
+        event.listen(Pool, 'checkin', self._on_checkin)
+
+    def _on_first_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.pools_created += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'connections_opened': self.connections_opened,
+            'pool_checkouts': self.checkouts,
+            'peak_connections_in_use': self.peak_in_use,
+            'pools_created': self.pools_created
+        }
+
+def configure_environment(database_url: str, stub_server) -> None:
+    """Point the app at the local database and stub services before any app module is imported"""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY', 'sk-loadtest')
+    os.environ['OPENAI_BASE_URL'] = stub_server.openai_base_url
+    os.environ['HUD_API_KEY'] = os.getenv('HUD_API_KEY', 'loadtest')
+    os.environ['HUD_API_BASE_URL'] = stub_server.hud_base_url
+
+def seed_users(count: int) -> List[Dict[str, Any]]:
+    """Create one account per simulated user and return their session payloads"""
+    from database.models import User, init_db
+    from database.session import get_session
+
+    init_db()
+    password_hash = hashlib.sha256(LOADTEST_PASSWORD.encode()).hexdigest()
+    session = get_session()
+    try:
+        users = []
+        for i in range(count):
+            email = f'loadtest-{i}@example.com'
+            user = session.query(User).filter(User.email == email).first()
+            if not user:
+                user = User(name=f'Load Test {i}', email=email, password_hash=password_hash)
+                session.add(user)
+                session.flush()
+            users.append({'id': user.id, 'name': user.name, 'email': user.email})
+        session.commit()
+        return users
+    finally:
+        session.close()
+
+def _page_path(pages: Dict[str, str], name: str) -> str:
+    return os.path.join(APP_ROOT, pages[name])
+
+def run_analysis(at_factory, user: Dict[str, Any], iteration: int):
+    at = at_factory('analysis')
+    at.run()
+    at.text_input(key='address_input').input(f'{100 + iteration} Main St')
+    at.text_input(key='zip_code_input').input('10001')
+    at.text_input(key='name_input').input(user['name'])
+    at.text_input(key='email_input').input(user['email'])
+    at.number_input[0].set_value(2500 + iteration)
+    at.button[0].click()
+    at.run()
+    return at
+
+def run_login(at_factory, user: Dict[str, Any], iteration: int):
+    at = at_factory('login')
+    at.run()
+    at.text_input(key='login_email').input(user['email'])
+    at.text_input(key='login_password').input(LOADTEST_PASSWORD)
+    at.button[0].click()
+    at.run()
+    return at
+
+def run_profile(at_factory, user: Dict[str, Any], iteration: int):
+    at = at_factory('profile')
+    at.session_state['user'] = dict(user)
+    at.run()
+    return at
+
+SCENARIOS = {
+    'analysis': run_analysis,
+    'login': run_login,
+    'profile': run_profile
+}
+
+def simulate_user(user: Dict[str, Any], scenarios: List[str], iterations: int,
+                  pages: Dict[str, str], timeout: float) -> List[Dict[str, Any]]:
+    """Run every scenario for one user and record per-step latency"""
+    from streamlit.testing.v1 import AppTest
+
+    def at_factory(name):
+        return AppTest.from_file(_page_path(pages, name), default_timeout=timeout)
+
+    results = []
+    for iteration in range(iterations):
+        for name in scenarios:
+            start = time.perf_counter()
+            error = None
+            try:
+                at = SCENARIOS[name](at_factory, user, iteration)
+                if at.exception:
+                    error = at.exception[0].value
+            except Exception as e:
+                error = str(e)
+            results.append({
+                'scenario': name,
+                'latency': time.perf_counter() - start,
+                'error': error
+            })
+    return results
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method='inclusive')
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = ordered[0]
+    return {
+        'min_ms': ordered[0] * 1000,
+        'p50_ms': p50 * 1000,
+        'p90_ms': p90 * 1000,
+        'p99_ms': p99 * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000
+    }
+
+def _rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_load_test(users: int, iterations: int, scenarios: List[str], database_url: str,
+                  pages: Dict[str, str] = None, timeout: float = 30) -> Dict[str, Any]:
+    """Run the load test and return the aggregated report"""
+    from utils.stub_services import StubServer
+
+    pages = pages or DEFAULT_PAGES
+    stub = StubServer().start()
+    try:
+        configure_environment(database_url, stub)
+        db_stats = DBConnectionStats()
+        db_stats.install()
+        seeded = seed_users(users)
+
+        tracemalloc.start()
+        rss_before = _rss_mb()
+        traced_before, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            futures = [
+                pool.submit(simulate_user, user, scenarios, iterations, pages, timeout)
+                for user in seeded
+            ]
+            results = [r for f in futures for r in f.result()]
+        elapsed = time.perf_counter() - start
+
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = _rss_mb()
+    finally:
+        stub.stop()
+
+    report = {
+        'users': users,
+        'iterations': iterations,
+        'requests': len(results),
+        'errors': sum(1 for r in results if r['error']),
+        'elapsed_s': elapsed,
+        'throughput_rps': len(results) / elapsed if elapsed else 0,
+        'latency': {'all': _percentiles([r['latency'] for r in results])},
+        'db': db_stats.summary(),
+        'memory': {
+            'rss_growth_mb': rss_after - rss_before,
+            'peak_traced_per_session_mb': (traced_peak - traced_before) / users / (1024 * 1024)
+        },
+        'stub_calls': dict(stub.calls),
+        'sample_errors': sorted({r['error'] for r in results if r['error']})[:5]
+    }
+    for name in scenarios:
+        report['latency'][name] = _percentiles([r['latency'] for r in results if r['scenario'] == name])
+    return report
+
+def print_report(report: Dict[str, Any]):
+    print(f"Users: {report['users']}  Iterations: {report['iterations']}  Requests: {report['requests']}")
+    print(f"Elapsed: {report['elapsed_s']:.2f}s  Throughput: {report['throughput_rps']:.2f} req/s  Errors: {report['errors']}")
+    print("\nLatency (ms)")
+    for name, stats in report['latency'].items():
+        if stats:
+            print(f"  {name:<10} p50={stats['p50_ms']:.1f} p90={stats['p90_ms']:.1f} "
+                  f"p99={stats['p99_ms']:.1f} max={stats['max_ms']:.1f}")
+    db = report['db']
+    print("\nDatabase")
+    print(f"  connections opened={db['connections_opened']} checkouts={db['pool_checkouts']} "
+          f"peak in use={db['peak_connections_in_use']} pools={db['pools_created']}")
+    memory = report['memory']
+    print("\nMemory")
+    print(f"  RSS growth={memory['rss_growth_mb']:.1f} MB  "
+          f"peak traced per session={memory['peak_traced_per_session_mb']:.2f} MB")
+    print(f"\nStub calls: {report['stub_calls']}")
+    for error in report['sample_errors']:
+        print(f"  error: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RentLeverage Streamlit pages")
+    parser.add_argument('--users', type=int, default=10, help="Number of concurrent simulated users")
+    parser.add_argument('--iterations', type=int, default=3, help="Scenario passes per user")
+    parser.add_argument('--scenarios', default='analysis,login,profile',
+                        help="Comma separated scenarios to run")
+    parser.add_argument('--database-url', default=os.getenv('LOADTEST_DATABASE_URL', 'sqlite:///loadtest.db'),
+                        help="Postgres or SQLite URL used for the run")
+    parser.add_argument('--timeout', type=float, default=30, help="Per script run timeout in seconds")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    report = run_load_test(args.users, args.iterations, scenarios, args.database_url, timeout=args.timeout)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
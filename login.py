@@ -1,6 +1,6 @@
 import streamlit as st
 from database.models import User
-from database.session import get_session
+from database.session import get_session, get_read_session
 import hashlib
 
 def hash_password(password):
@@ -36,7 +36,7 @@ def auth_user():
 
             submitted = st.form_submit_button("Sign In", use_container_width=True)
             if submitted and login_email and login_password:
-                session = get_session()
+                session = get_read_session()
                 try:
                     user = session.query(User).filter(
                         User.email == login_email,
@@ -1,16 +1,17 @@
 import streamlit as st
-import pandas as pd
-from utils.analysis import (
-    calculate_rent_score, get_comparable_units, get_market_insights,
-    get_building_violations, get_tenant_rights
-)
+from utils.tenant_rights import get_catalog
+from utils.result_cache import get_cached_analysis
 from utils.letter_generator import generate_negotiation_letter
-from utils.visualization import create_rent_comparison_chart, create_trend_chart
+from utils.warmup import start_warmup
+from utils.gamification import calculate_negotiation_power, calculate_negotiation_score
+from utils.leaderboard import Leaderboard, get_leaderboard
+from utils.market_model import UNIT_TYPES
 from database.models import User, RentSearch, init_db
 from database.session import get_session
+import hashlib
 import urllib.parse
 
-def save_search_data(name, email, address, zip_code, current_rent, market_rate, rent_score):
+def save_search_data(name, email, address, zip_code, current_rent, market_rate, rent_score, negotiation=None):
     try:
         session = get_session()
         user = session.query(User).filter(User.email == email).first()
@@ -28,142 +29,321 @@ def save_search_data(name, email, address, zip_code, current_rent, market_rate,
             rent_score=rent_score
         )
         session.add(rent_search)
+
+        # Keep the user's best negotiation score for the leaderboard
+        improved = Leaderboard.record(session, user.id, zip_code, negotiation) if negotiation else False
         session.commit()
+        if improved:
+            get_leaderboard().apply(user.id, zip_code, negotiation['score'])
+        return user.id
     except Exception as e:
         st.error(f"Error saving data: {str(e)}")
     finally:
         if 'session' in locals():
             session.close()
 
+# Analyses kept per browser session; older fingerprints are dropped first
+MAX_SESSION_RESULTS = 5
+
+@st.cache_resource
+def _init_database():
+    # Create tables once per server process rather than on every rerun
+    init_db()
+    return True
+
+# Form choices for the unit, mapped to the bedroom counts of utils.market_model
+BEDROOM_CHOICES = {"Not sure": None, "Studio": 0, "1": 1, "2": 2, "3": 3, "4+": 4}
+
+def _input_fingerprint(address, zip_code, current_rent, name, email, bedrooms=None, unit_type=None):
+    raw = "\x1f".join([address.strip().lower(), zip_code.strip(), str(current_rent), name.strip(), email.strip().lower(),
+                       str(bedrooms), unit_type or ''])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def _store_result(fingerprint, result):
+    results = st.session_state.setdefault('analysis_results', {})
+    results[fingerprint] = result
+    while len(results) > MAX_SESSION_RESULTS:
+        results.pop(next(iter(results)))
+    st.session_state['active_analysis'] = fingerprint
+
+def _active_result():
+    results = st.session_state.get('analysis_results', {})
+    return results.get(st.session_state.get('active_analysis'))
+
+@st.fragment
+def _render_results(result):
+    st.header("📊 Rent Analysis Results")
+
+    # Metrics
+    current_rent = result['current_rent']
+    market_rate = result['market_rate']
+    segment = result.get('segment')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Rent Score", f"{result['rent_score']:.0f}/100")
+    with col2:
+        difference = market_rate - current_rent
+        st.metric(
+            "Market Rate",
+            f"${market_rate:,.0f}",
+            delta=f"${abs(difference):,.0f} {'below' if difference < 0 else 'above'} your rent",
+            # The market rate is the segment median when the bedrooms matched
+            help=(f"Median of {segment.count} {segment.describe()}; "
+                  f"the middle half rent for ${segment.p25:,.0f}-${segment.p75:,.0f}")
+            if segment and segment.bedrooms is not None else None
+        )
+    with col3:
+        st.metric("Vacancy Rate", f"{result['market_data'].vacancy_rate*100:.1f}%")
+
+@st.fragment
+def _render_leaderboard(result):
+    if not result.get('user_id'):
+        return
+    try:
+        leaderboard = get_leaderboard()
+        local = leaderboard.standing(result['user_id'], result['zip_code'])
+        overall = leaderboard.standing(result['user_id'])
+    except Exception as e:
+        st.warning(f"Leaderboard unavailable: {str(e)}")
+        return
+    if not local or not overall:
+        return
+
+    st.subheader("🏆 Negotiation Leaderboard")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(f"Rank in {result['zip_code']}", f"#{local['rank']} of {local['total']}")
+    with col2:
+        st.metric(
+            "Overall",
+            f"#{overall['rank']} of {overall['total']}",
+            help=f"Ahead of {overall['percentile']:.0f}% of other renters"
+        )
+
+@st.fragment
+def _render_charts(result):
+    # Charts (plotly is imported lazily to keep cold start fast)
+    from utils.visualization import create_rent_comparison_chart, create_trend_chart
+
+    market_data = result['market_data']
+    st.subheader("Rent Comparison")
+    fig = create_rent_comparison_chart(result['current_rent'], result['market_rate'], result['comps'])
+    st.plotly_chart(fig, use_container_width=True)
+
+    if market_data and market_data.seasonal:
+        st.subheader("Market Trends")
+        trend_fig = create_trend_chart(market_data)
+        st.plotly_chart(trend_fig, use_container_width=True)
+
+    # Comparable Units
+    st.subheader("📍 Nearby Comparable Units")
+    for comp in result['comps'][:3]:
+        st.write(f"- {comp.address}: ${comp.rent:,.0f}/month")
+
+    # Building Issues
+    if result['violations']:
+        st.subheader("🏗️ Building Issues")
+        for violation in result['violations']:
+            st.write(f"- {violation.type}: {violation.description}")
+
+@st.fragment
+def _render_what_if(result):
+    from utils.visualization import create_rent_comparison_chart
+    from utils.whatif import build_context, evaluate
+    from utils.gamification import get_level_title
+
+    st.header("🎚️ What If?")
+    # Built once per result; every slider move after that is pure arithmetic
+    context = result.get('whatif_context')
+    if context is None:
+        context = result['whatif_context'] = build_context(result)
+
+    current_rent = int(result['current_rent'])
+    col1, col2 = st.columns(2)
+    with col1:
+        target_rent = st.slider(
+            "Target monthly rent ($)",
+            min_value=max(0, int(min(current_rent, context.market_rate) * 0.5)),
+            max_value=int(max(current_rent, context.market_rate) * 1.5),
+            value=current_rent,
+            step=25,
+            key="whatif_rent"
+        )
+    with col2:
+        lease_months = st.slider(
+            "Lease length (months)",
+            min_value=6,
+            max_value=36,
+            value=12,
+            step=6,
+            key="whatif_lease"
+        )
+
+    outcome = evaluate(context, target_rent, lease_months)
+    negotiation = outcome['negotiation']
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Rent Score", f"{outcome['rent_score']:.0f}/100")
+    with col2:
+        st.metric("Value Score", f"{outcome['value_score']:.0f}/100")
+    with col3:
+        st.metric(
+            "Negotiation Score",
+            f"{negotiation['score']:.0f}",
+            help=get_level_title(negotiation['level'])
+        )
+
+    fig = create_rent_comparison_chart(target_rent, context.market_rate, context.comps)
+    st.plotly_chart(fig, use_container_width=True, key="whatif_chart")
+
+    with st.expander("Letter preview at this rent"):
+        st.text(generate_negotiation_letter(
+            context.name, context.address, target_rent, context.market_rate,
+            context.violations, context.comps
+        ))
+    st.caption(f"Recomputed in {outcome['elapsed_ms']:.2f} ms")
+
+@st.fragment
+def _render_letter(result):
+    st.header("📝 Negotiation Letter")
+    letter = generate_negotiation_letter(
+        result['name'], result['address'], result['current_rent'], result['market_rate'],
+        result['violations'], result['comps']
+    )
+    st.text_area("Your customized negotiation letter:", letter, height=400)
+
+    # Email Button
+    email_subject = urllib.parse.quote("Rent Negotiation Request")
+    email_body = urllib.parse.quote(letter)
+    email_link = f"mailto:?subject={email_subject}&body={email_body}"
+
+    st.markdown(
+        f'<a href="{email_link}" target="_blank">'
+        '<button style="background-color: #FF4B4B; color: white; '
+        'padding: 10px 24px; border: none; border-radius: 4px; '
+        'cursor: pointer;">✉️ Send via Email</button></a>',
+        unsafe_allow_html=True
+    )
+
 def analyze_rent():
     """Main rent analysis function"""
     # Initialize database tables
     try:
-        init_db()
+        _init_database()
     except Exception as e:
         st.error(f"Database initialization error: {str(e)}")
 
     st.title("🏠 RentLeverage")
     st.subheader("Instant Rent Negotiation Power")
 
-    # User Input Section
-    col1, col2 = st.columns(2)
+    # User Input Section, submitted together so typing doesn't rerun the page
+    with st.form("analysis_form"):
+        col1, col2 = st.columns(2)
 
-    with col1:
-        address = st.text_input(
-            "Enter your address",
-            help="Start typing your address...",
-            key="address_input",
-            autocomplete="street-address"
-        )
-        zip_code = st.text_input(
-            "Enter your ZIP code",
-            max_chars=5,
-            help="5-digit ZIP code",
-            key="zip_code_input"
-        )
+        with col1:
+            address = st.text_input(
+                "Enter your address",
+                help="Start typing your address...",
+                key="address_input",
+                autocomplete="street-address"
+            )
+            zip_code = st.text_input(
+                "Enter your ZIP code",
+                max_chars=5,
+                help="5-digit ZIP code",
+                key="zip_code_input"
+            )
 
-    with col2:
-        current_rent = st.number_input(
-            "Enter your current monthly rent ($)",
-            min_value=0,
-            help="Your current monthly rent amount"
-        )
-        name = st.text_input(
-            "Enter your name",
-            help="Your full name for the negotiation letter",
-            key="name_input"
-        )
-        email = st.text_input(
-            "Enter your email",
-            help="Your email address for saving your analysis",
-            key="email_input"
-        )
+        with col2:
+            current_rent = st.number_input(
+                "Enter your current monthly rent ($)",
+                min_value=0,
+                help="Your current monthly rent amount"
+            )
+            unit_col1, unit_col2 = st.columns(2)
+            with unit_col1:
+                bedrooms = BEDROOM_CHOICES[st.selectbox(
+                    "Bedrooms",
+                    list(BEDROOM_CHOICES),
+                    help="Compares your rent with units of the same size",
+                    key="bedrooms_input"
+                )]
+            with unit_col2:
+                unit_type = st.selectbox(
+                    "Unit type",
+                    ("Not sure",) + tuple(t.title() for t in UNIT_TYPES),
+                    key="unit_type_input"
+                )
+                unit_type = None if unit_type == "Not sure" else unit_type.lower()
+            name = st.text_input(
+                "Enter your name",
+                help="Your full name for the negotiation letter",
+                key="name_input"
+            )
+            email = st.text_input(
+                "Enter your email",
+                help="Your email address for saving your analysis",
+                key="email_input"
+            )
 
-    if st.button("Analyze My Rent"):
+        submitted = st.form_submit_button("Analyze My Rent")
+
+    if submitted:
         if address and zip_code and current_rent and name and email:
-            with st.spinner("Analyzing your rent..."):
-                # Calculate rent score
-                rent_score = calculate_rent_score(current_rent, zip_code)
-
-                # Get market insights
-                market_data = get_market_insights(zip_code)
-                market_rate = market_data.get('avg_rent', current_rent)
-
-                # Save search data
-                try:
-                    save_search_data(name, email, address, zip_code, current_rent, market_rate, rent_score)
-                except Exception as e:
-                    st.warning(f"Unable to save search data: {str(e)}")
-
-                # Get comparable units and violations
-                comps = get_comparable_units(zip_code, current_rent)
-                violations = get_building_violations(address)
-
-                # Display Results
-                st.header("📊 Rent Analysis Results")
-
-                # Metrics
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Rent Score", f"{rent_score:.0f}/100")
-                with col2:
-                    difference = market_rate - current_rent
-                    st.metric(
-                        "Market Rate",
-                        f"${market_rate:,.0f}",
-                        delta=f"${abs(difference):,.0f} {'below' if difference < 0 else 'above'} your rent"
+            fingerprint = _input_fingerprint(address, zip_code, current_rent, name, email, bedrooms, unit_type)
+            if fingerprint in st.session_state.get('analysis_results', {}):
+                st.session_state['active_analysis'] = fingerprint
+            else:
+                with st.spinner("Analyzing your rent..."):
+                    # Score, market data, comps and violations, shared across workers
+                    analysis = get_cached_analysis(zip_code, current_rent, address, bedrooms, unit_type)
+                    negotiation = calculate_negotiation_score(
+                        current_rent, analysis['market_rate'],
+                        calculate_negotiation_power(analysis['market_data'], analysis['violations']),
+                        analysis['violations'], analysis['comps']
                     )
-                with col3:
-                    st.metric("Vacancy Rate", f"{market_data.get('vacancy_rate', 0)*100:.1f}%")
-
-                # Charts
-                st.subheader("Rent Comparison")
-                fig = create_rent_comparison_chart(current_rent, market_rate, comps)
-                st.plotly_chart(fig, use_container_width=True)
-
-                if market_data and market_data.get('seasonal_patterns'):
-                    st.subheader("Market Trends")
-                    trend_fig = create_trend_chart(market_data)
-                    st.plotly_chart(trend_fig, use_container_width=True)
-
-                # Comparable Units
-                st.subheader("📍 Nearby Comparable Units")
-                for comp in comps[:3]:
-                    st.write(f"- {comp['address']}: ${comp['rent']:,.0f}/month")
-
-                # Building Issues
-                if violations:
-                    st.subheader("🏗️ Building Issues")
-                    for violation in violations:
-                        st.write(f"- {violation['type']}: {violation['description']}")
-
-                # Negotiation Letter
-                st.header("📝 Negotiation Letter")
-                letter = generate_negotiation_letter(
-                    name, address, current_rent, market_rate, violations, comps
-                )
-                st.text_area("Your customized negotiation letter:", letter, height=400)
-
-                # Email Button
-                email_subject = urllib.parse.quote("Rent Negotiation Request")
-                email_body = urllib.parse.quote(letter)
-                email_link = f"mailto:?subject={email_subject}&body={email_body}"
-
-                st.markdown(
-                    f'<a href="{email_link}" target="_blank">'
-                    '<button style="background-color: #FF4B4B; color: white; '
-                    'padding: 10px 24px; border: none; border-radius: 4px; '
-                    'cursor: pointer;">✉️ Send via Email</button></a>',
-                    unsafe_allow_html=True
-                )
 
-                # Tenant Rights
-                st.header("⚖️ Know Your Rights")
-                for right in get_tenant_rights():
-                    st.write(f"- {right}")
+                    # Save search data
+                    user_id = None
+                    try:
+                        user_id = save_search_data(
+                            name, email, address, zip_code, current_rent,
+                            analysis['metro_rate'], analysis['metro_rent_score'], negotiation
+                        )
+                    except Exception as e:
+                        st.warning(f"Unable to save search data: {str(e)}")
+
+                _store_result(fingerprint, {
+                    **analysis,
+                    'negotiation': negotiation,
+                    'user_id': user_id,
+                    'name': name,
+                    'address': address,
+                    'zip_code': zip_code,
+                    'current_rent': current_rent
+                })
         else:
             st.error("Please fill in all required fields")
 
+    # Results persist across reruns; each section reruns on its own
+    result = _active_result()
+    if result:
+        _render_results(result)
+        _render_leaderboard(result)
+        _render_charts(result)
+        _render_what_if(result)
+        _render_letter(result)
+
+        # Tenant Rights
+        st.header("⚖️ Know Your Rights")
+        rights = get_catalog().lookup(result['zip_code'])
+        st.caption(" › ".join(rights['chain']))
+        for right in rights['rights']:
+            st.write(f"- {right}")
+
+    # Inputs are on screen; preload charting and API clients in the background
+    start_warmup()
+
 if __name__ == "__main__":
     analyze_rent()
\ No newline at end of file
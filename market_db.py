@@ -0,0 +1,444 @@
+"""
+Bulk loader for market data into Postgres
+
+The ZORI matrix, its forecasts, rental comps and building violations are
+loaded into plain tables next to the user data so that searches can be
+joined with market data server-side. Each load COPYs into fresh staging
+tables in one transaction (with FREEZE, since the tables are new), builds
+their indexes and materialized views, and then swaps staging for live by
+renaming. Readers only wait for the renames at commit, and a failed load
+leaves the previous data untouched.
+
+Materialized views:
+- metro_market_metrics: latest rent, YoY, seasonal changes, volatility
+  and forecast per metro, the same figures the rent matrix serves
+- zip_market_metrics: comp count, median and quartile rents per ZIP
+- address_violations: violation counts and types per normalized address
+
+`data_loader.load_market_data` reads from these views when
+MARKET_DATA_SOURCE=postgres.
+
+Usage:
+    python -m utils.market_db load [--zori PATH] [--comps PATH] [--violations PATH] [--only DATASET ...]
+    python -m utils.market_db refresh
+    python -m utils.market_db show 10001
+    python -m utils.market_db searches [--limit 20]
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+COMPS_PATH = 'data/rental_comps.csv'
+VIOLATIONS_PATH = 'data/mock_violations.json'
+
+# Bytes handed to COPY per read
+COPY_BUFFER = 1 << 20
+# Give up on the swap rather than queue app reads behind it for long
+SWAP_LOCK_TIMEOUT = '10s'
+
+# name -> (column definitions, [(index suffix, indexed columns)])
+TABLES = {
+    'market_zori': (
+        "metro text NOT NULL, month date NOT NULL, rent real NOT NULL",
+        [('metro_month', 'metro, month')]
+    ),
+    'market_forecasts': (
+        "metro text NOT NULL, step smallint NOT NULL, label text NOT NULL, "
+        "rent double precision, lower_rent double precision, upper_rent double precision",
+        [('metro_step', 'metro, step')]
+    ),
+    'zip_metros': (
+        "zip3 text NOT NULL, metro text NOT NULL",
+        [('zip3', 'zip3')]
+    ),
+    'rental_comps': (
+        "zip_code text NOT NULL, rent real NOT NULL, bedrooms smallint, address text, unit_type text, "
+        "source_url text, fetched_at timestamptz, listings integer, sources integer, first_seen timestamptz",
+        [('zip_code', 'zip_code')]
+    ),
+    'building_violations': (
+        "address text NOT NULL, type text, description text, violation_date date",
+        [('address', 'upper(trim(address))')]
+    ),
+}
+
+def _metro_metrics_sql() -> str:
+    from utils.market_store import SEASON_BOUNDS, LATEST_OFFSET, YEAR_AGO_OFFSET
+
+    def rent_at(condition):
+        return f"max(z.rent) FILTER (WHERE {condition})::float8"
+
+    seasonal = ',\n                   '.join(
+        f"{rent_at(f'z.month = DATE {end!r}')} / NULLIF({rent_at(f'z.month = DATE {start!r}')}, 0) - 1"
+        f" AS {season.lower()}_change"
+        for season, (start, end) in SEASON_BOUNDS.items()
+    )
+    return f"""
+        WITH months AS (
+            SELECT month, dense_rank() OVER (ORDER BY month DESC) AS back
+            FROM (SELECT DISTINCT month FROM {{market_zori}}) m
+        ), latest AS (
+            SELECT z.metro,
+                   {rent_at(f'm.back = {LATEST_OFFSET}')} AS avg_rent,
+                   {rent_at(f'm.back = {LATEST_OFFSET}')}
+                       / NULLIF({rent_at(f'm.back = {YEAR_AGO_OFFSET}')}, 0) - 1 AS yearly_change,
+                   {seasonal}
+            FROM {{market_zori}} z JOIN months m USING (month)
+            GROUP BY z.metro
+        ), changes AS (
+            -- Month-over-month changes between consecutive months only
+            SELECT metro,
+                   CASE WHEN month_no - lag(month_no) OVER w = 1
+                        THEN rent::float8 / NULLIF(lag(rent) OVER w, 0) - 1 END AS change
+            FROM (SELECT metro, rent, extract(year FROM month) * 12 + extract(month FROM month) AS month_no
+                  FROM {{market_zori}}) z
+            WINDOW w AS (PARTITION BY metro ORDER BY month_no)
+        ), volatility AS (
+            SELECT metro, stddev_pop(change) AS volatility FROM changes GROUP BY metro
+        ), forecasts AS (
+            SELECT metro,
+                   array_agg(label ORDER BY step) AS forecast_months,
+                   array_agg(rent ORDER BY step) AS forecast_rent,
+                   array_agg(lower_rent ORDER BY step) AS forecast_lower,
+                   array_agg(upper_rent ORDER BY step) AS forecast_upper
+            FROM {{market_forecasts}} GROUP BY metro
+        )
+        SELECT * FROM latest
+        LEFT JOIN volatility USING (metro)
+        LEFT JOIN forecasts USING (metro)
+    """
+
+# name -> (tables read, SELECT with {table} placeholders, unique index columns)
+VIEWS = {
+    'metro_market_metrics': (['market_zori', 'market_forecasts'], _metro_metrics_sql, 'metro'),
+    'zip_market_metrics': (['rental_comps'], lambda: """
+        SELECT zip_code,
+               count(*) AS comp_count,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY rent) AS median_rent,
+               percentile_cont(0.25) WITHIN GROUP (ORDER BY rent) AS p25_rent,
+               percentile_cont(0.75) WITHIN GROUP (ORDER BY rent) AS p75_rent,
+               avg(rent / NULLIF(bedrooms, 0)) AS rent_per_bedroom
+        FROM {rental_comps}
+        GROUP BY zip_code
+    """, 'zip_code'),
+    'address_violations': (['building_violations'], lambda: """
+        SELECT upper(trim(address)) AS address_key,
+               count(*) AS violation_count,
+               max(violation_date) AS latest_violation,
+               array_agg(DISTINCT type) AS violation_types
+        FROM {building_violations}
+        GROUP BY 1
+    """, 'address_key'),
+}
+
+@contextmanager
+def _transaction():
+    """psycopg2 connection to the primary for COPY; commits on success, rolls back otherwise"""
+    from database.session import get_engine
+
+    conn = get_engine().raw_connection()
+    try:
+        yield conn.cursor()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+class _CopyStream:
+    """Read-only file over an iterator of CSV text chunks, for COPY FROM STDIN"""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._current = io.BytesIO()
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            data = self._current.read(size)
+            if data:
+                return data
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b''
+            self._current = io.BytesIO(chunk.encode())
+
+def zori_rows(matrix, chunk_metros: int = 256) -> Iterator[str]:
+    """Non-missing (metro, month, rent) cells of the rent matrix as CSV"""
+    import pandas as pd
+
+    metros = np.asarray(matrix.metros, dtype=object)
+    months = np.asarray(matrix.months, dtype=object)
+    for start in range(0, len(metros), chunk_metros):
+        block = np.asarray(matrix.values[start:start + chunk_metros])
+        rows, cols = np.nonzero(np.isfinite(block))
+        yield pd.DataFrame({
+            'metro': metros[start + rows],
+            'month': months[cols],
+            'rent': block[rows, cols]
+        }).to_csv(header=False, index=False)
+
+def forecast_rows(matrix) -> Iterator[str]:
+    """Per-metro forecast steps as CSV, skipping metros without a forecast"""
+    from utils.forecasting import metro_forecast
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for i, metro in enumerate(matrix.metros):
+        forecast = metro_forecast(matrix, i)
+        if forecast is None:
+            continue
+        for step, row in enumerate(zip(forecast['months'], forecast['rent'], forecast['lower'], forecast['upper'])):
+            writer.writerow((metro, step, *row))
+    yield out.getvalue()
+
+def zip_metro_rows() -> Iterator[str]:
+    from utils.data_loader import ZIP_TO_METRO
+
+    out = io.StringIO()
+    csv.writer(out).writerows((zip_code[:3], metro) for zip_code, metro in ZIP_TO_METRO.items())
+    yield out.getvalue()
+
+def violation_rows(path: str = VIOLATIONS_PATH) -> Iterator[str]:
+    with open(path) as f:
+        buildings = json.load(f).get('building_violations', [])
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for building in buildings:
+        for violation in building.get('violations', []):
+            writer.writerow((building['address'], violation.get('type'),
+                             violation.get('description'), violation.get('date')))
+    yield out.getvalue()
+
+def _create_table(cursor, name: str, table: str):
+    columns, _ = TABLES[name]
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+
+def _create_view(cursor, name: str, view: str, tables: Dict[str, str]):
+    _, select, unique = VIEWS[name]
+    cursor.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS {select().format(**tables)}")
+    # A unique index lets `refresh` run concurrently with readers
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {view}_{unique}_key ON {view} ({unique})")
+
+def ensure_schema(cursor):
+    """Create empty live tables and views so reads work before the first full load"""
+    for name in TABLES:
+        _create_table(cursor, name, name)
+        for suffix, columns in TABLES[name][1]:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}_{suffix}_idx ON {name} ({columns})")
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS market_data_version "
+        "(id smallint PRIMARY KEY, version integer NOT NULL, loaded_at timestamptz)"
+    )
+    cursor.execute("INSERT INTO market_data_version VALUES (1, 0, NULL) ON CONFLICT (id) DO NOTHING")
+    for name in VIEWS:
+        _create_view(cursor, name, name, {table: table for table in TABLES})
+
+def _copy(cursor, name: str, source, columns: Optional[List[str]] = None) -> int:
+    staging = f"{name}_staging"
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    _create_table(cursor, name, staging)
+    column_list = f" ({', '.join(columns)})" if columns else ''
+    # FREEZE skips the later hint-bit rewrite; allowed because the table is new in this transaction
+    cursor.copy_expert(f"COPY {staging}{column_list} FROM STDIN WITH (FORMAT csv, FREEZE true)",
+                       source, size=COPY_BUFFER)
+    rows = cursor.rowcount
+    # Indexes are cheaper to build once over the loaded data than to maintain row by row
+    for suffix, indexed in TABLES[name][1]:
+        cursor.execute(f"CREATE INDEX {staging}_{suffix}_idx ON {staging} ({indexed})")
+    cursor.execute(f"ANALYZE {staging}")
+    return rows
+
+def _copy_csv_file(cursor, name: str, path: str) -> int:
+    """COPY a CSV file as-is, letting the server parse it, with columns taken from its header"""
+    with open(path, newline='') as f:
+        columns = next(csv.reader([f.readline()]))
+        known = [column.split()[0] for column in TABLES[name][0].split(', ')]
+        unknown = set(columns) - set(known)
+        if unknown:
+            raise ValueError(f"{path} has columns not in {name}: {sorted(unknown)}")
+        return _copy(cursor, name, f, columns)
+
+def load(zori_path: Optional[str] = None, comps_path: Optional[str] = None,
+         violations_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Replace the given datasets in one transaction
+    Returns rows loaded per table. Datasets passed as None keep their current data
+    """
+    sources = {}
+    if zori_path:
+        from utils.market_store import read_zori_csv
+
+        matrix = read_zori_csv(zori_path)
+        sources['market_zori'] = lambda cursor: _copy(cursor, 'market_zori', _CopyStream(zori_rows(matrix)))
+        sources['market_forecasts'] = lambda cursor: _copy(
+            cursor, 'market_forecasts', _CopyStream(forecast_rows(matrix)))
+    if comps_path:
+        sources['rental_comps'] = lambda cursor: _copy_csv_file(cursor, 'rental_comps', comps_path)
+    if violations_path:
+        sources['building_violations'] = lambda cursor: _copy(
+            cursor, 'building_violations', _CopyStream(violation_rows(violations_path)))
+    sources['zip_metros'] = lambda cursor: _copy(cursor, 'zip_metros', _CopyStream(zip_metro_rows()))
+
+    views = [name for name, (tables, _, _) in VIEWS.items() if set(tables) & set(sources)]
+    counts = {}
+    with _transaction() as cursor:
+        ensure_schema(cursor)
+        cursor.execute("SET LOCAL maintenance_work_mem = '512MB'")
+        for name, copy in sources.items():
+            counts[name] = copy(cursor)
+
+        tables = {name: f"{name}_staging" if name in sources else name for name in TABLES}
+        for name in views:
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}_staging")
+            _create_view(cursor, name, f"{name}_staging", tables)
+
+        # Swap: catalog changes only, so live readers wait milliseconds
+        cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        for name in views:
+            cursor.execute(f"DROP MATERIALIZED VIEW {name}")
+        for name in sources:
+            cursor.execute(f"DROP TABLE {name}")
+            cursor.execute(f"ALTER TABLE {name}_staging RENAME TO {name}")
+            for suffix, _ in TABLES[name][1]:
+                cursor.execute(f"ALTER INDEX {name}_staging_{suffix}_idx RENAME TO {name}_{suffix}_idx")
+        for name in views:
+            unique = VIEWS[name][2]
+            cursor.execute(f"ALTER MATERIALIZED VIEW {name}_staging RENAME TO {name}")
+            cursor.execute(f"ALTER INDEX {name}_staging_{unique}_key RENAME TO {name}_{unique}_key")
+        cursor.execute("UPDATE market_data_version SET version = version + 1, loaded_at = now() WHERE id = 1")
+    return counts
+
+def refresh_views(names: Optional[List[str]] = None):
+    """Recompute views in place after incremental writes to the base tables"""
+    with _transaction() as cursor:
+        for name in names or VIEWS:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+
+_MARKET_DATA_SQL = """
+    WITH target AS (
+        SELECT coalesce((SELECT metro FROM zip_metros WHERE zip3 = left(:zip_code, 3)), :default_metro) AS metro
+    )
+    SELECT m.*, z.comp_count, z.median_rent, z.p25_rent, z.p75_rent,
+           (SELECT version FROM market_data_version WHERE id = 1) AS data_version
+    FROM metro_market_metrics m
+    LEFT JOIN zip_market_metrics z ON z.zip_code = :zip_code
+    WHERE m.metro IN ((SELECT metro FROM target), :default_metro)
+    ORDER BY m.metro = (SELECT metro FROM target) DESC
+    LIMIT 1
+"""
+
+def _finite(value) -> float:
+    return float('nan') if value is None else float(value)
+
+def load_market_data(zip_code: str) -> Optional["MarketMetrics"]:
+    """Market data for a ZIP's metro from the materialized views, as data_loader returns it"""
+    from sqlalchemy import text
+    from database.session import get_read_engine
+    from utils.market_store import SEASONS
+    from utils.data_loader import DEFAULT_METRO
+    from utils.records import Forecast, MarketMetrics, ZipComps
+
+    with get_read_engine().connect() as conn:
+        row = conn.execute(text(_MARKET_DATA_SQL),
+                           {'zip_code': zip_code, 'default_metro': DEFAULT_METRO}).mappings().first()
+    if row is None:
+        return None
+
+    forecast = None
+    if row['forecast_rent']:
+        forecast = Forecast(
+            months=tuple(str(month) for month in row['forecast_months']),
+            rent=tuple(map(float, row['forecast_rent'])),
+            lower=tuple(map(float, row['forecast_lower'])),
+            upper=tuple(map(float, row['forecast_upper']))
+        )
+    zip_comps = None
+    if row['comp_count']:
+        zip_comps = ZipComps(
+            count=int(row['comp_count']),
+            median_rent=float(row['median_rent']),
+            p25_rent=float(row['p25_rent']),
+            p75_rent=float(row['p75_rent'])
+        )
+    return MarketMetrics(
+        avg_rent=_finite(row['avg_rent']),
+        vacancy_rate=0.05,  # Default placeholder since Zillow data doesn't include vacancy
+        yearly_change=_finite(row['yearly_change']),
+        seasonal=tuple(_finite(row[f"{season.lower()}_change"]) for season in SEASONS),
+        volatility=_finite(row['volatility']),
+        forecast=forecast,
+        data_source='Zillow Observed Rent Index',
+        data_version=row['data_version'],
+        zip_comps=zip_comps
+    )
+
+def searches_vs_market(limit: int = 20) -> List[Dict[str, Any]]:
+    """ZIPs where users' searched rents sit furthest above the local comps median"""
+    from sqlalchemy import text
+    from database.session import get_read_engine
+
+    with get_read_engine().connect() as conn:
+        rows = conn.execute(text("""
+            SELECT s.zip_code, count(*) AS searches, avg(s.current_rent) AS avg_current_rent,
+                   z.median_rent, z.comp_count,
+                   avg(s.current_rent) / NULLIF(z.median_rent, 0) - 1 AS premium
+            FROM rent_searches s
+            JOIN zip_market_metrics z ON z.zip_code = s.zip_code
+            GROUP BY s.zip_code, z.median_rent, z.comp_count
+            ORDER BY premium DESC NULLS LAST
+            LIMIT :limit
+        """), {'limit': limit}).mappings().all()
+    return [dict(row) for row in rows]
+
+def main():
+    from utils.market_store import ZORI_CSV_PATH
+
+    parser = argparse.ArgumentParser(description="Load market data into Postgres and query it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    load_parser = subparsers.add_parser('load')
+    load_parser.add_argument('--zori', default=ZORI_CSV_PATH)
+    load_parser.add_argument('--comps', default=COMPS_PATH)
+    load_parser.add_argument('--violations', default=VIOLATIONS_PATH)
+    load_parser.add_argument('--only', nargs='+', choices=['zori', 'comps', 'violations'],
+                             help="Reload only these datasets")
+    subparsers.add_parser('refresh')
+    show_parser = subparsers.add_parser('show')
+    show_parser.add_argument('zip_code')
+    searches_parser = subparsers.add_parser('searches')
+    searches_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        only = set(args.only or ['zori', 'comps', 'violations'])
+        start = time.perf_counter()
+        counts = load(
+            args.zori if 'zori' in only else None,
+            args.comps if 'comps' in only else None,
+            args.violations if 'violations' in only else None
+        )
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        for name, rows in counts.items():
+            print(f"{name}: {rows} rows")
+        print(f"Loaded {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s)")
+    elif args.command == 'refresh':
+        start = time.perf_counter()
+        refresh_views()
+        print(f"Refreshed {len(VIEWS)} views in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'show':
+        market_data = load_market_data(args.zip_code)
+        print(json.dumps(market_data.to_dict() if market_data else None, indent=2, default=str))
+    else:
+        for row in searches_vs_market(args.limit):
+            print(f"{row['zip_code']}: {row['searches']} searches, avg ${row['avg_current_rent']:,.0f} "
+                  f"vs median ${row['median_rent']:,.0f} ({row['premium']:+.1%})")
+
+if __name__ == "__main__":
+    main()
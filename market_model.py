@@ -0,0 +1,246 @@
+"""
+Rent model by area, bedrooms and unit type
+
+Comps are grouped once, with vectorized group-bys over the whole comps
+file, into segments keyed by (area, bedrooms, unit type), where the area
+is a ZIP or its metro and bedrooms or unit type may be left open. Each
+segment keeps its comp count, median and quartiles, so comparing a rent
+with like-for-like units is a few dict lookups instead of a pass over
+raw comps.
+
+Lookups go from the most specific segment to broader ones: bedrooms
+matter more than area, and area more than unit type. Segments with
+fewer than MIN_SEGMENT_COMPS comps are left out. ZIPs outside the mapped
+metros have no metro level, rather than borrowing the default market's.
+
+Usage:
+    python -m utils.market_model show 10001 --bedrooms 2 [--unit-type condo]
+"""
+import argparse
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from utils.records import CompBatch, RentSegment
+from utils.rent_distribution import RENTAL_COMPS_PATH
+
+MIN_SEGMENT_COMPS = int(os.getenv('MIN_SEGMENT_COMPS', 3))
+
+# Larger units are counted with the top bucket ("4+")
+MAX_BEDROOMS = 4
+# Bedrooms value for comps without a count, and for segments open on bedrooms
+ANY_BEDROOMS = -1
+
+UNIT_TYPES = ('apartment', 'condo', 'townhouse', 'house')
+_UNIT_TYPE_ALIASES = {
+    'apt': 'apartment', 'apartments': 'apartment', 'flat': 'apartment', 'studio': 'apartment',
+    'co-op': 'condo', 'coop': 'condo', 'condominium': 'condo',
+    'townhome': 'townhouse', 'rowhouse': 'townhouse', 'row house': 'townhouse',
+    'single family': 'house', 'single-family': 'house', 'sfh': 'house', 'duplex': 'house',
+}
+
+# (area column, by bedrooms, by unit type), most specific first
+LEVELS = (
+    ('zip_code', True, True),
+    ('zip_code', True, False),
+    ('metro', True, True),
+    ('metro', True, False),
+    ('zip_code', False, True),
+    ('zip_code', False, False),
+    ('metro', False, True),
+    ('metro', False, False),
+)
+
+def normalize_unit_type(unit_type: Optional[str]) -> str:
+    """One of UNIT_TYPES, or '' when missing or unrecognized"""
+    if not unit_type:
+        return ''
+    value = ' '.join(str(unit_type).lower().replace('_', ' ').split())
+    value = _UNIT_TYPE_ALIASES.get(value, value)
+    return value if value in UNIT_TYPES else ''
+
+def bedrooms_key(bedrooms: Optional[int]) -> Optional[int]:
+    if bedrooms is None or bedrooms < 0:
+        return None
+    return min(int(bedrooms), MAX_BEDROOMS)
+
+def read_comps(path: str = RENTAL_COMPS_PATH) -> CompBatch:
+    """
+    Comps from the CSV as a batch sorted by ZIP
+    unit_type is optional; unknown bedroom counts become ANY_BEDROOMS
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path, dtype={'zip_code': str, 'address': str, 'unit_type': str})
+    df = df.dropna(subset=['zip_code', 'rent'])
+    df = df[df['rent'] > 0]
+    bedrooms = df['bedrooms'].fillna(ANY_BEDROOMS).astype(int) if 'bedrooms' in df else ANY_BEDROOMS
+    unit_types = df['unit_type'].fillna('') if 'unit_type' in df else pd.Series('', index=df.index)
+    df = df.assign(
+        zip_code=df['zip_code'].str.strip().str.zfill(5),
+        bedrooms=np.minimum(bedrooms, MAX_BEDROOMS),
+        # Normalize each distinct spelling once
+        unit_type=unit_types.map({value: normalize_unit_type(value) for value in unit_types.unique()}),
+        address=df['address'].fillna('') if 'address' in df else ''
+    ).sort_values('zip_code', kind='stable')
+
+    return CompBatch.from_columns(
+        df['rent'].to_numpy(dtype=np.float64), df['bedrooms'].to_numpy(),
+        df['address'].to_numpy(), df['zip_code'].to_numpy(), df['unit_type'].to_numpy()
+    )
+
+class MarketModel:
+    """Segment statistics as columns, with a (area, bedrooms, unit type) -> row index"""
+
+    def __init__(self, comps: CompBatch, keys: Dict[Tuple[str, int, str], int], count: np.ndarray,
+                 median: np.ndarray, p25: np.ndarray, p75: np.ndarray):
+        from utils.data_loader import mapped_metro
+
+        self.comps = comps
+        self.keys = keys
+        self.count = count
+        self.median = median
+        self.p25 = p25
+        self.p75 = p75
+
+        # Comps are sorted by ZIP, so each ZIP is one contiguous slice
+        zips, starts = np.unique(comps.zip_code.astype(str), return_index=True)
+        bounds = list(starts) + [len(comps)]
+        self.zip_rows = {z: slice(bounds[i], bounds[i + 1]) for i, z in enumerate(zips)}
+        self.metro_zips: Dict[str, list] = {}
+        for z in zips:
+            metro = mapped_metro(z)
+            if metro is not None:
+                self.metro_zips.setdefault(metro, []).append(z)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def lookup(self, zip_code: str, bedrooms: Optional[int] = None,
+               unit_type: Optional[str] = None) -> Optional[RentSegment]:
+        """Most specific segment for the ZIP with the attributes that were given"""
+        from utils.data_loader import mapped_metro
+
+        bedrooms = bedrooms_key(bedrooms)
+        unit_type = normalize_unit_type(unit_type)
+        areas = {'zip_code': zip_code, 'metro': mapped_metro(zip_code)}
+        for area_column, by_bedrooms, by_type in LEVELS:
+            if (by_bedrooms and bedrooms is None) or (by_type and not unit_type) or areas[area_column] is None:
+                continue
+            key = (areas[area_column], bedrooms if by_bedrooms else ANY_BEDROOMS, unit_type if by_type else '')
+            row = self.keys.get(key)
+            if row is not None:
+                return RentSegment(
+                    area=key[0], bedrooms=key[1] if by_bedrooms else None, unit_type=key[2] or None,
+                    count=int(self.count[row]), median=float(self.median[row]),
+                    p25=float(self.p25[row]), p75=float(self.p75[row])
+                )
+        return None
+
+    def comps_in(self, segment: RentSegment) -> CompBatch:
+        """The comps a segment was computed from"""
+        zip_codes = [segment.area] if segment.area in self.zip_rows else self.metro_zips.get(segment.area, [])
+        rows = [np.arange(self.zip_rows[z].start, self.zip_rows[z].stop) for z in zip_codes]
+        comps = self.comps[np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)]
+        mask = np.ones(len(comps), dtype=bool)
+        if segment.bedrooms is not None:
+            mask &= comps.bedrooms == segment.bedrooms
+        if segment.unit_type:
+            mask &= comps.unit_type == segment.unit_type
+        return comps[mask]
+
+def build_market_model(path: str = RENTAL_COMPS_PATH, min_comps: int = MIN_SEGMENT_COMPS) -> MarketModel:
+    """Group comps into every level's segments and keep their counts and quartiles"""
+    import pandas as pd
+    from utils.data_loader import mapped_metro
+
+    comps = read_comps(path)
+    df = pd.DataFrame({
+        'zip_code': comps.zip_code, 'rent': comps.rent,
+        'bedrooms': comps.bedrooms.astype(np.int64), 'unit_type': comps.unit_type
+    })
+    # Unmapped ZIPs get no metro, so they only form ZIP-level segments
+    df['metro'] = df['zip_code'].map({z: mapped_metro(z) for z in df['zip_code'].unique()})
+
+    parts = []
+    for area_column, by_bedrooms, by_type in LEVELS:
+        subset = df[df['metro'].notna()] if area_column == 'metro' else df
+        if by_bedrooms:
+            subset = subset[subset['bedrooms'] != ANY_BEDROOMS]
+        if by_type:
+            subset = subset[subset['unit_type'] != '']
+        if subset.empty:
+            continue
+        columns = [area_column] + (['bedrooms'] if by_bedrooms else []) + (['unit_type'] if by_type else [])
+        grouped = subset.groupby(columns, sort=False)['rent']
+        stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+        stats['count'] = grouped.size()
+        stats = stats[stats['count'] >= min_comps].reset_index()
+        parts.append(pd.DataFrame({
+            'area': stats[area_column].astype(str),
+            'bedrooms': stats['bedrooms'] if by_bedrooms else ANY_BEDROOMS,
+            'unit_type': stats['unit_type'] if by_type else '',
+            'count': stats['count'], 'p25': stats[0.25], 'median': stats[0.5], 'p75': stats[0.75]
+        }))
+
+    segments = pd.concat(parts, ignore_index=True)
+    keys = {
+        key: row for row, key in enumerate(zip(
+            segments['area'].tolist(), segments['bedrooms'].astype(int).tolist(), segments['unit_type'].tolist()
+        ))
+    }
+    return MarketModel(
+        comps, keys, segments['count'].to_numpy(dtype=np.int32),
+        segments['median'].to_numpy(dtype=np.float64), segments['p25'].to_numpy(dtype=np.float64),
+        segments['p75'].to_numpy(dtype=np.float64)
+    )
+
+_model: Optional[MarketModel] = None
+_model_mtime: Optional[float] = None
+_model_lock = threading.Lock()
+
+def get_market_model(path: str = RENTAL_COMPS_PATH) -> Optional[MarketModel]:
+    """Process-wide model, rebuilt only when the comps file changes; None without comps"""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _model is None or mtime != _model_mtime:
+        with _model_lock:
+            if _model is None or mtime != _model_mtime:
+                _model = build_market_model(path)
+                _model_mtime = mtime
+    return _model
+
+def lookup_segment(zip_code: str, bedrooms: Optional[int] = None,
+                   unit_type: Optional[str] = None) -> Optional[RentSegment]:
+    """Like-for-like segment for a unit, or None without comps data"""
+    try:
+        model = get_market_model()
+    except Exception as e:
+        print(f"Error building market model: {str(e)}")
+        return None
+    return model.lookup(zip_code, bedrooms, unit_type) if model else None
+
+def main():
+    import json
+
+    parser = argparse.ArgumentParser(description="Rent segments by area, bedrooms and unit type")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show_parser = subparsers.add_parser('show', help="Segment used for a unit")
+    show_parser.add_argument('zip_code')
+    show_parser.add_argument('--bedrooms', type=int)
+    show_parser.add_argument('--unit-type')
+    show_parser.add_argument('--comps', default=RENTAL_COMPS_PATH)
+    args = parser.parse_args()
+
+    model = build_market_model(args.comps)
+    print(f"{len(model)} segments from {len(model.comps)} comps")
+    segment = model.lookup(args.zip_code, args.bedrooms, args.unit_type)
+    print(json.dumps(segment.to_dict() if segment else None, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Metro x month rent matrix shared across Streamlit worker processes
+
+The rents live in a raw float32 values file stored month by month (one
+row of metros per month), so new months are appended to its end. Each
+published version is a directory with an index.json naming the values
+file and how many months of it the version covers, plus the derived
+per-metro arrays. A `current` symlink points at the live version and is
+swapped atomically, so every worker memory-maps the same pages instead
+of keeping its own pandas copy, and a worker on an older version never
+reads past the months it was published with.
+
+Derived metrics (YoY, seasonal, month-over-month volatility and 12-month
+forecasts) are stored next to the index. `refresh` appends newly
+published months to the values file and updates those metrics from the
+delta only, so its cost follows the new months rather than the whole
+history, and bumps the data version so caches keyed on it invalidate.
+Revisions are detected by re-reading the last REVISION_CHECK_MONTHS
+published months, which trigger a full rebuild when any value changed;
+revisions further back than that are not picked up by `refresh` and need
+a `publish`. Run it nightly to keep forecasts current.
+
+Usage:
+    python -m utils.market_store publish [--csv PATH] [--store-dir DIR]
+    python -m utils.market_store refresh [--csv PATH] [--store-dir DIR]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ZORI_CSV_PATH = 'attached_assets/Metro_zori_uc_sfrcondomfr_sm_month (1).csv'
+
+# Set to enable shared mode; unset keeps the per-process matrix
+MARKET_STORE_DIR = os.getenv('MARKET_STORE_DIR')
+
+CURRENT_LINK = 'current'
+INDEX_FILE = 'index.json'
+KEEP_VERSIONS = 2
+
+# Trailing months `refresh` compares against the CSV to catch revised history
+REVISION_CHECK_MONTHS = int(os.getenv('MARKET_REVISION_CHECK_MONTHS', 12))
+
+# Workers re-check the `current` link at most this often
+RELOAD_INTERVAL = float(os.getenv('MARKET_STORE_RELOAD_INTERVAL', 5))
+
+_MONTH_COLUMN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# Month columns bounding each season in the ZORI data
+SEASON_BOUNDS = {
+    'Spring': ('2023-01-31', '2023-04-30'),
+    'Summer': ('2023-04-30', '2023-07-31'),
+    'Fall': ('2023-07-31', '2023-10-31'),
+    'Winter': ('2023-10-31', '2024-01-31')
+}
+SEASONS = list(SEASON_BOUNDS)
+
+# Latest usable month skips the last column as it might be incomplete
+LATEST_OFFSET = 13
+YEAR_AGO_OFFSET = 25
+
+class MarketMatrix:
+    """Metro x month float32 rent matrix with a metro-name index"""
+
+    def __init__(self, metros: List[str], months: List[str], values: np.ndarray, version: int = 0):
+        self.metros = metros
+        self.months = months
+        self.values = values
+        self.version = version
+        # Derived per-metro arrays published alongside the values, keyed by name
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.path: Optional[str] = None
+        # Values file in the store this matrix was attached from
+        self.values_file: Optional[str] = None
+        self.metro_index: Dict[str, int] = {name: i for i, name in enumerate(metros)}
+        self.month_index: Dict[str, int] = {month: i for i, month in enumerate(months)}
+
+    def row(self, metro: str) -> Optional[np.ndarray]:
+        i = self.metro_index.get(metro)
+        return None if i is None else self.values[i]
+
+def _month_columns(columns) -> List[str]:
+    return [str(c) for c in columns if _MONTH_COLUMN.match(str(c))]
+
+def read_zori_csv(path: str = ZORI_CSV_PATH, version: int = 0) -> MarketMatrix:
+    """Read the Zillow CSV into a float32 matrix with derived metrics"""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    months = _month_columns(df.columns)
+    values = np.ascontiguousarray(df[months].to_numpy(dtype=np.float32))
+    matrix = MarketMatrix(df['RegionName'].astype(str).tolist(), months, values, version)
+    matrix.arrays = compute_metrics(values, months)
+    return matrix
+
+def _pct_change(new: np.ndarray, old: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ((new - old) / old).astype(np.float64)
+
+def _yearly_change(values: np.ndarray) -> np.ndarray:
+    if values.shape[1] < YEAR_AGO_OFFSET:
+        return np.full(values.shape[0], np.nan)
+    return _pct_change(values[:, -LATEST_OFFSET], values[:, -YEAR_AGO_OFFSET])
+
+def _seasonal(values: np.ndarray, months: List[str]) -> np.ndarray:
+    month_index = {month: i for i, month in enumerate(months)}
+    seasonal = np.full((values.shape[0], len(SEASONS)), np.nan)
+    for j, season in enumerate(SEASONS):
+        start, end = SEASON_BOUNDS[season]
+        if start in month_index and end in month_index:
+            seasonal[:, j] = _pct_change(values[:, month_index[end]], values[:, month_index[start]])
+    return seasonal
+
+def _mom_stats(values: np.ndarray) -> np.ndarray:
+    """Running count, sum and sum of squares of month-over-month changes per metro"""
+    changes = _pct_change(values[:, 1:], values[:, :-1])
+    valid = np.isfinite(changes)
+    changes = np.where(valid, changes, 0.0)
+    return np.stack([valid.sum(axis=1), changes.sum(axis=1), (changes ** 2).sum(axis=1)], axis=1)
+
+def _volatility(mom_stats: np.ndarray) -> np.ndarray:
+    count, total, total_sq = mom_stats[:, 0], mom_stats[:, 1], mom_stats[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean ** 2, 0.0)
+    return np.sqrt(variance)
+
+def compute_metrics(values: np.ndarray, months: List[str]) -> Dict[str, np.ndarray]:
+    """Compute every derived metric, including forecasts, from the full history"""
+    from utils import forecasting
+
+    mom_stats = _mom_stats(values)
+    return {
+        'yearly_change': _yearly_change(values),
+        'seasonal': _seasonal(values, months),
+        'mom_stats': mom_stats,
+        'volatility': _volatility(mom_stats),
+        **forecasting.fit(values)
+    }
+
+def update_metrics(metrics: Dict[str, np.ndarray], values: np.ndarray, months: List[str],
+                   new_months: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Update derived metrics after appending `new_months` to the end of `values`
+    Work is proportional to the new columns: YoY reads two columns, volatility
+    folds the new month-over-month changes into the running sums, and seasonal
+    patterns are only recomputed if a season boundary month arrived. The
+    forecaster's state is advanced over the new months only, or fitted on
+    the full series if history was too short for a fit before
+    """
+    from utils import forecasting
+
+    n_new = len(new_months)
+    # Include the last previously known month so the first new change is counted
+    delta_stats = _mom_stats(values[:, -(n_new + 1):])
+    mom_stats = np.asarray(metrics['mom_stats']) + delta_stats
+
+    seasonal = metrics['seasonal']
+    boundary_months = {month for bounds in SEASON_BOUNDS.values() for month in bounds}
+    if boundary_months & set(new_months):
+        seasonal = _seasonal(values, months)
+
+    return {
+        'yearly_change': _yearly_change(values),
+        'seasonal': np.asarray(seasonal),
+        'mom_stats': mom_stats,
+        'volatility': _volatility(mom_stats),
+        **forecasting.update(metrics, values, len(months) - n_new)
+    }
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_values(path: str, values: np.ndarray, offset: int = 0):
+    """Write metro x month `values` month by month at byte `offset`, dropping anything after it"""
+    with open(path, 'r+b' if offset else 'wb') as f:
+        # A refresh interrupted before publishing may have left unpublished months
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(np.ascontiguousarray(np.asarray(values, dtype=np.float32).T).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+def _map_values(path: str, n_metros: int, n_months: int) -> np.ndarray:
+    """Metro x month view of the first `n_months` months of a values file"""
+    if not n_metros or not n_months:
+        return np.empty((n_metros, n_months), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r', shape=(n_months, n_metros)).T
+
+def publish(matrix: MarketMatrix, store_dir: str, extra_arrays: Optional[Dict[str, np.ndarray]] = None,
+            values_file: Optional[str] = None) -> str:
+    """
+    Write a new version directory and atomically point `current` at it
+    Without `values_file` the values go to a new values file; with it, that
+    file must already hold the matrix's months. Readers see either the old
+    or the new version, never a partial one
+    """
+    if extra_arrays is None:
+        extra_arrays = matrix.arrays
+    os.makedirs(store_dir, exist_ok=True)
+    version_name = f"v{matrix.version:08d}-{os.getpid()}-{time.time_ns()}"
+    if values_file is None:
+        values_file = f"values-{version_name}.f32"
+        _write_values(os.path.join(store_dir, values_file), matrix.values)
+
+    staging = os.path.join(store_dir, f".{version_name}.tmp")
+    os.makedirs(staging)
+    for name, array in (extra_arrays or {}).items():
+        np.save(os.path.join(staging, f"{name}.npy"), array)
+    with open(os.path.join(staging, INDEX_FILE), 'w') as f:
+        json.dump({
+            'version': matrix.version,
+            'metros': matrix.metros,
+            'months': matrix.months,
+            'values_file': values_file,
+            'arrays': sorted(extra_arrays or {})
+        }, f)
+    _fsync_dir(staging)
+
+    final = os.path.join(store_dir, version_name)
+    os.rename(staging, final)
+
+    tmp_link = os.path.join(store_dir, f".{CURRENT_LINK}.{os.getpid()}")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(version_name, tmp_link)
+    os.replace(tmp_link, os.path.join(store_dir, CURRENT_LINK))
+    _fsync_dir(store_dir)
+
+    _prune_versions(store_dir, keep=version_name)
+    return final
+
+def _prune_versions(store_dir: str, keep: str):
+    # Workers that still map an old version keep their pages after unlink
+    versions = sorted(_version_dirs(store_dir))
+    for old in [v for v in versions if v != keep][:-(KEEP_VERSIONS - 1) or None]:
+        shutil.rmtree(os.path.join(store_dir, old), ignore_errors=True)
+
+    referenced = set()
+    for version in _version_dirs(store_dir):
+        try:
+            with open(os.path.join(store_dir, version, INDEX_FILE)) as f:
+                referenced.add(json.load(f).get('values_file'))
+        except (OSError, ValueError):
+            continue
+    for name in os.listdir(store_dir):
+        if name.startswith('values-') and name not in referenced:
+            os.remove(os.path.join(store_dir, name))
+
+def _version_dirs(store_dir: str) -> List[str]:
+    return [d for d in os.listdir(store_dir) if d.startswith('v') and os.path.isdir(os.path.join(store_dir, d))]
+
+def current_version_path(store_dir: str) -> Optional[str]:
+    link = os.path.join(store_dir, CURRENT_LINK)
+    try:
+        return os.path.join(store_dir, os.readlink(link))
+    except OSError:
+        return None
+
+def attach(store_dir: str) -> Optional[MarketMatrix]:
+    """Memory-map the current published version, or None if nothing is published"""
+    path = current_version_path(store_dir)
+    if not path:
+        return None
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = json.load(f)
+    values = _map_values(os.path.join(store_dir, index['values_file']), len(index['metros']), len(index['months']))
+    matrix = MarketMatrix(index['metros'], index['months'], values, index['version'])
+    matrix.arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+        for name in index.get('arrays', [])
+    }
+    matrix.path = path
+    matrix.values_file = index['values_file']
+    return matrix
+
+class SharedMarketStore:
+    """Per-process handle that re-attaches when a new version is published"""
+
+    def __init__(self, store_dir: str, reload_interval: float = RELOAD_INTERVAL):
+        self.store_dir = store_dir
+        self.reload_interval = reload_interval
+        self._matrix: Optional[MarketMatrix] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[MarketMatrix]:
+        now = time.monotonic()
+        if self._matrix is not None and now - self._checked_at < self.reload_interval:
+            return self._matrix
+        with self._lock:
+            self._checked_at = now
+            path = current_version_path(self.store_dir)
+            if path and (self._matrix is None or self._matrix.path != path):
+                self._matrix = attach(self.store_dir)
+            return self._matrix
+
+def refresh(store_dir: str, csv_path: str = ZORI_CSV_PATH) -> Optional[MarketMatrix]:
+    """
+    Append month columns published since the last refresh
+    Only the new columns and the last REVISION_CHECK_MONTHS published ones
+    are parsed from the CSV. Falls back to a full rebuild when there is no
+    published version, metros changed, or the history was revised rather
+    than appended. Returns None if nothing changed.
+    """
+    import pandas as pd
+
+    current = attach(store_dir)
+    months = _month_columns(pd.read_csv(csv_path, nrows=0).columns)
+
+    if current is None or months[:len(current.months)] != current.months:
+        rebuilt = read_zori_csv(csv_path, (current.version + 1) if current else 1)
+        publish(rebuilt, store_dir)
+        return rebuilt
+
+    new_months = months[len(current.months):]
+    checked = current.months[-REVISION_CHECK_MONTHS:] if REVISION_CHECK_MONTHS > 0 else []
+    delta = pd.read_csv(csv_path, usecols=['RegionName', *checked, *new_months])
+    revised = not np.array_equal(
+        delta[checked].to_numpy(dtype=np.float32), current.values[:, len(current.months) - len(checked):],
+        equal_nan=True
+    )
+    if delta['RegionName'].astype(str).tolist() != current.metros or revised:
+        rebuilt = read_zori_csv(csv_path, current.version + 1)
+        publish(rebuilt, store_dir)
+        return rebuilt
+    if not new_months:
+        return None
+
+    # Append the new months in place; published versions only map the months they list
+    values_path = os.path.join(store_dir, current.values_file)
+    _write_values(values_path, delta[new_months].to_numpy(dtype=np.float32),
+                  len(current.months) * len(current.metros) * 4)
+    all_months = current.months + new_months
+    values = _map_values(values_path, len(current.metros), len(all_months))
+
+    refreshed = MarketMatrix(current.metros, all_months, values, current.version + 1)
+    refreshed.arrays = update_metrics(current.arrays, values, all_months, new_months)
+    publish(refreshed, store_dir, values_file=current.values_file)
+    return refreshed
+
+def get_data_version() -> int:
+    """Version of the market data currently served, for cache keys"""
+    return get_market_matrix().version
+
+def _csv_version(path: str = ZORI_CSV_PATH) -> int:
+    # Without a store, the CSV's modification time versions the data, so every
+    # process reading the same file agrees on it and an updated file gets a new one
+    return int(os.path.getmtime(path))
+
+_local_matrix: Optional[MarketMatrix] = None
+_local_checked_at = 0.0
+_shared_store: Optional[SharedMarketStore] = None
+_matrix_lock = threading.Lock()
+
+def get_market_matrix() -> MarketMatrix:
+    """
+    Return the market matrix for this process
+    In shared mode the matrix is attached from MARKET_STORE_DIR, publishing it
+    first if no worker has done so yet. Otherwise it is read from the CSV and
+    re-read when the file changes, checked at most every RELOAD_INTERVAL
+    """
+    global _local_matrix, _local_checked_at, _shared_store
+    if MARKET_STORE_DIR:
+        if _shared_store is None:
+            _shared_store = SharedMarketStore(MARKET_STORE_DIR)
+        matrix = _shared_store.get()
+        if matrix is None:
+            publish(read_zori_csv(), MARKET_STORE_DIR)
+            _shared_store._checked_at = 0.0
+            matrix = _shared_store.get()
+        return matrix
+
+    now = time.monotonic()
+    if _local_matrix is not None and now - _local_checked_at < RELOAD_INTERVAL:
+        return _local_matrix
+    with _matrix_lock:
+        if _local_matrix is None or now - _local_checked_at >= RELOAD_INTERVAL:
+            version = _csv_version()
+            if _local_matrix is None or version != _local_matrix.version:
+                _local_matrix = read_zori_csv(version=version)
+            _local_checked_at = now
+    return _local_matrix
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the ZORI matrix for shared worker access")
+    parser.add_argument('command', choices=['publish', 'refresh', 'show'])
+    parser.add_argument('--csv', default=ZORI_CSV_PATH, help="Zillow ZORI CSV to read")
+    parser.add_argument('--store-dir', default=MARKET_STORE_DIR or 'data/market_store',
+                        help="Directory holding published versions")
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        current = attach(args.store_dir)
+        version = current.version + 1 if current else 1
+        path = publish(read_zori_csv(args.csv, version), args.store_dir)
+        print(f"Published market matrix version {version} to {path}")
+    elif args.command == 'refresh':
+        start = time.perf_counter()
+        refreshed = refresh(args.store_dir, args.csv)
+        if refreshed is None:
+            print("Market data already up to date")
+        else:
+            print(f"Refreshed to version {refreshed.version} with {len(refreshed.months)} months "
+                  f"in {time.perf_counter() - start:.2f}s")
+    else:
+        matrix = attach(args.store_dir)
+        if matrix is None:
+            print("No market matrix published")
+        else:
+            print(f"Version {matrix.version}: {len(matrix.metros)} metros x {len(matrix.months)} months "
+                  f"({matrix.values.nbytes / 1024:.0f} KB) at {matrix.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+In-process metrics registry
+
+Counters, gauges and latency histograms keyed by name and labels,
+rendered in the Prometheus text format. Each process keeps its own
+registry; nothing here does I/O.
+"""
+import threading
+from typing import Dict, Any, Tuple
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_gauges: Dict[Tuple[str, Tuple], float] = {}
+# name, labels -> [bucket counts..., +Inf count, sum]
+_histograms: Dict[Tuple[str, Tuple], list] = {}
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(LATENCY_BUCKETS)] += 1
+        histogram[-1] += value
+
+def snapshot() -> Dict[str, Any]:
+    """Plain-dict copy of every metric, for tests and reports"""
+    with _lock:
+        return {
+            'counters': {(name, labels): value for (name, labels), value in _counters.items()},
+            'gauges': dict(_gauges),
+            'histograms': {key: list(value) for key, value in _histograms.items()}
+        }
+
+def get_counter(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    data = snapshot()
+    for kind, metrics in (('counter', data['counters']), ('gauge', data['gauges'])):
+        for name in sorted({name for name, _ in metrics}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(metrics.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    histograms = data['histograms']
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+            cumulative += histogram[len(LATENCY_BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
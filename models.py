@@ -1,4 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import (
+    BigInteger, Column, Integer, String, Float, DateTime, ForeignKey, Boolean,
+    event, inspect, text, update
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import os
@@ -22,20 +26,154 @@ class RentSearch(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     address = Column(String)
-    zip_code = Column(String)
+    # watchlist.address_hash of the address, for finding searches by building
+    address_key = Column(BigInteger, index=True)
+    zip_code = Column(String, index=True)
     current_rent = Column(Float)
     market_rate = Column(Float)
     rent_score = Column(Float)
+    negotiated = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Latest values from the watchlist re-scoring; NULL until first re-scored
+    latest_market_rate = Column(Float)
+    latest_rent_score = Column(Float)
+    violation_count = Column(Integer, index=True)
+    rescored_at = Column(DateTime)
     user = relationship("User", back_populates="searches")
 
+    @property
+    def savings(self):
+        """Monthly savings credited to the counter once the user has negotiated"""
+        if not self.negotiated or self.market_rate is None or self.current_rent is None:
+            return 0.0
+        return max(0.0, self.market_rate - self.current_rent)
+
+class SavingsTotal(Base):
+    """Single-row materialized sum of RentSearch.savings, updated on every insert"""
+    __tablename__ = 'savings_totals'
+
+    id = Column(Integer, primary_key=True)
+    total = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+SAVINGS_TOTAL_ID = 1
+
+def add_to_savings_total(connection, amount):
+    """Atomically add to the materialized savings total inside the caller's transaction"""
+    if not amount:
+        return
+    result = connection.execute(
+        update(SavingsTotal.__table__)
+        .where(SavingsTotal.__table__.c.id == SAVINGS_TOTAL_ID)
+        .values(total=SavingsTotal.__table__.c.total + amount, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        connection.execute(SavingsTotal.__table__.insert().values(
+            id=SAVINGS_TOTAL_ID, total=amount, updated_at=datetime.utcnow()
+        ))
+
+@event.listens_for(RentSearch, 'before_insert')
+@event.listens_for(RentSearch, 'before_update')
+def _set_address_key(mapper, connection, target):
+    from utils.watchlist import address_hash
+    target.address_key = address_hash(target.address)
+
+@event.listens_for(RentSearch, 'after_insert')
+def _count_search_savings(mapper, connection, target):
+    add_to_savings_total(connection, target.savings)
+
+class NegotiationScore(Base):
+    """Each user's best negotiation score, used for the leaderboard"""
+    __tablename__ = 'negotiation_scores'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), unique=True, nullable=False)
+    zip_code = Column(String, index=True)
+    score = Column(Float, nullable=False)
+    level = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    user = relationship("User")
+
+# Columns added to rent_searches after its first release
+_RENT_SEARCH_COLUMNS = {
+    'negotiated': 'BOOLEAN NOT NULL DEFAULT FALSE',
+    'latest_market_rate': 'FLOAT',
+    'latest_rent_score': 'FLOAT',
+    'violation_count': 'INTEGER',
+    'rescored_at': 'TIMESTAMP',
+    'address_key': 'BIGINT',
+}
+_RENT_SEARCH_INDEXES = ('zip_code', 'address_key', 'violation_count')
+
+def _add_missing_columns(engine):
+    # create_all doesn't alter existing tables; add columns introduced since
+    columns = {c['name'] for c in inspect(engine).get_columns('rent_searches')}
+    missing = [name for name in _RENT_SEARCH_COLUMNS if name not in columns]
+    if missing:
+        with engine.begin() as conn:
+            for name in missing:
+                conn.execute(text(f'ALTER TABLE rent_searches ADD COLUMN {name} {_RENT_SEARCH_COLUMNS[name]}'))
+    with engine.begin() as conn:
+        for name in _RENT_SEARCH_INDEXES:
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_rent_searches_{name} ON rent_searches ({name})'))
+        # Leaderboard catch-up reads scores changed since its last pass
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_negotiation_scores_updated_at ON negotiation_scores (updated_at)'))
+
+def _backfill_address_keys(engine, batch_size: int = 10000):
+    # Searches saved before address_key existed
+    from utils.watchlist import address_hash
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                'SELECT id, address FROM rent_searches WHERE address_key IS NULL LIMIT :limit'
+            ), {'limit': batch_size}).all()
+            if not rows:
+                return
+            conn.execute(text('UPDATE rent_searches SET address_key = :key WHERE id = :id'),
+                         [{'id': search_id, 'key': address_hash(address)} for search_id, address in rows])
+
+def _insert_if_missing(engine, table):
+    # Several processes may run init_db at once; the first insert wins
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table).on_conflict_do_nothing(index_elements=[table.c.id])
+
+def _seed_savings_total(engine):
+    # One aggregate at setup so inserts only ever increment the row
+    table = SavingsTotal.__table__
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(table.select().where(table.c.id == SAVINGS_TOTAL_ID)).first()
+            if exists is None:
+                total = conn.execute(text(
+                    'SELECT COALESCE(SUM(market_rate - current_rent), 0) FROM rent_searches '
+                    'WHERE negotiated AND market_rate > current_rent'
+                )).scalar()
+                insert = _insert_if_missing(engine, table)
+                conn.execute((insert if insert is not None else table.insert()).values(
+                    id=SAVINGS_TOTAL_ID, total=total, updated_at=datetime.utcnow()
+                ))
+    except IntegrityError:
+        # Another process seeded the row between our read and insert
+        pass
+
 def init_db():
     """Initialize database and create all tables"""
     database_url = os.getenv('DATABASE_URL')
     if database_url:
-        engine = create_engine(database_url)
+        from database.session import get_engine
+
+        engine = get_engine()
         # Create all tables
         Base.metadata.create_all(engine)
+        _add_missing_columns(engine)
+        _backfill_address_keys(engine)
+        _seed_savings_total(engine)
         return engine
     else:
         raise ValueError("DATABASE_URL environment variable not set")
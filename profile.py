@@ -1,7 +1,10 @@
 import streamlit as st
-from database.session import get_session
+from database.session import get_session, get_read_session
 from database.models import User, RentSearch # Added RentSearch import
+from utils.savings import mark_negotiated
+from utils.export import FORMATS, export_searches, export_filename, export_mime
 from datetime import datetime
+import io
 
 def update_user_profile(user_id, name=None, email=None, password=None):
     """Update user profile information"""
@@ -32,7 +35,8 @@ def show_profile():
         return
 
     user_id = st.session_state['user']['id']
-    session = get_session()
+    # Replica reads; marking a search negotiated moves the session to the primary
+    session = get_read_session()
 
     try:
         user = session.query(User).filter(User.id == user_id).first()
@@ -51,6 +55,38 @@ def show_profile():
             search_count = session.query(RentSearch).filter(RentSearch.user_id == user_id).count()
             st.metric("Total Searches", search_count)
 
+        # Negotiated searches count toward the site-wide savings counter
+        open_searches = session.query(RentSearch).filter(
+            RentSearch.user_id == user_id,
+            RentSearch.negotiated.is_(False)
+        ).order_by(RentSearch.created_at.desc()).limit(10).all()
+        if open_searches:
+            st.subheader("Did You Negotiate?")
+            labels = {
+                search.id: f"{search.address} ({search.created_at.strftime('%b %d, %Y')}) - ${search.current_rent:,.0f}/month"
+                for search in open_searches
+            }
+            search_id = st.selectbox("Search", list(labels), format_func=labels.get)
+            if st.button("I negotiated this rent"):
+                if mark_negotiated(session, search_id, user_id):
+                    st.success("Congratulations! Your savings now count toward our community total.")
+
+        if search_count:
+            st.subheader("Export Search History")
+            with st.form("export_form"):
+                export_format = st.selectbox("Format", list(FORMATS), format_func=str.upper)
+                compress = st.checkbox("Compress (gzip)")
+                prepare = st.form_submit_button("Prepare Export")
+            if prepare:
+                buffer = io.BytesIO()
+                rows = export_searches(session, buffer, export_format, compress, user_id=user_id)
+                st.download_button(
+                    f"Download ({rows:,} rows)",
+                    buffer.getvalue(),
+                    file_name=export_filename(export_format, compress),
+                    mime=export_mime(export_format, compress)
+                )
+
         # Profile Form
         with st.form("profile_form"):
             name = st.text_input("Name", value=user.name)
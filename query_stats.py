@@ -0,0 +1,265 @@
+"""
+SQL statement instrumentation
+
+Every engine created by database.session is hooked so that each
+statement is timed and aggregated by fingerprint: the SQL with literals
+and bound values replaced by `?` and IN lists collapsed, so the same
+query with different arguments lands in one bucket.
+
+- Statements slower than SLOW_QUERY_SECONDS are logged with the app code
+  that issued them and kept in a bounded slow log.
+- N+1 detection: a SELECT fingerprint that runs N_PLUS_ONE_THRESHOLD or
+  more times while one connection is checked out (one session, one
+  page run) is flagged with the line that triggered it, typically a
+  lazy load such as iterating `user.searches` per user.
+- Counts and latencies per operation and table go to utils.metrics.
+
+Set SQL_INSTRUMENTATION=0 to leave engines unhooked.
+
+Usage:
+    python -m utils.query_stats demo
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any, Tuple
+
+from utils import metrics
+
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', '1') != '0'
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', 0.25))
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+# Further distinct statements are pooled under OTHER
+MAX_FINGERPRINTS = 1000
+SLOW_LOG_SIZE = 100
+OTHER = 'other'
+
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.I)
+_PARAMS = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\$\d+')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+"?(\w+)', re.I)
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """(id, normalized SQL) for a statement"""
+    normalized = _COMMENTS.sub(' ', statement)
+    normalized = _STRINGS.sub('?', normalized)
+    normalized = _PARAMS.sub('?', normalized)
+    normalized = _NUMBERS.sub('?', normalized)
+    normalized = _LISTS.sub('(?...)', normalized)
+    normalized = _ROWS.sub(r'\1', normalized)
+    normalized = _SPACE.sub(' ', normalized).strip()
+    return hashlib.blake2b(normalized.encode(), digest_size=4).hexdigest(), normalized
+
+def _labels(normalized: str) -> Dict[str, str]:
+    operation = normalized.split(' ', 1)[0].upper() or 'UNKNOWN'
+    table = _TABLE.search(normalized)
+    return {'operation': operation, 'table': table.group(1) if table else ''}
+
+_HOOKS = {'_before', '_after', '_error', '_checkin', '_record', '_end_scope', '_caller'}
+
+def _caller() -> str:
+    """Innermost frame outside SQLAlchemy and these hooks, as file:line in function"""
+    for frame in reversed(traceback.extract_stack()):
+        if 'sqlalchemy' not in frame.filename and not (frame.filename == __file__ and frame.name in _HOOKS):
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+class StatementStats:
+    __slots__ = ('fingerprint', 'sql', 'count', 'total', 'max', 'rows', 'slow')
+
+    def __init__(self, fingerprint_id: str, sql: str):
+        self.fingerprint = fingerprint_id
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+
+_lock = threading.Lock()
+_statements: Dict[str, StatementStats] = {}
+_slow_log: deque = deque(maxlen=SLOW_LOG_SIZE)
+# fingerprint -> {'sql', 'scopes', 'max_repeats', 'caller'}
+_n_plus_one: Dict[str, Dict[str, Any]] = {}
+
+def _record(statement: str, elapsed: float, rows: int, info: Dict[str, Any]):
+    fingerprint_id, normalized = fingerprint(statement)
+    labels = _labels(normalized)
+    slow = elapsed >= SLOW_QUERY_SECONDS
+
+    with _lock:
+        stats = _statements.get(fingerprint_id)
+        if stats is None:
+            if len(_statements) >= MAX_FINGERPRINTS:
+                fingerprint_id = OTHER
+                stats = _statements.get(OTHER)
+            if stats is None:
+                stats = _statements[fingerprint_id] = StatementStats(
+                    fingerprint_id, normalized if fingerprint_id != OTHER else '(other statements)')
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.rows += max(rows, 0)
+        stats.slow += slow
+
+    metrics.inc('sql_queries_total', **labels)
+    metrics.observe('sql_query_seconds', elapsed, **labels)
+    if slow:
+        caller = _caller()
+        metrics.inc('sql_slow_queries_total', **labels)
+        with _lock:
+            _slow_log.append({'at': time.time(), 'seconds': elapsed, 'fingerprint': fingerprint_id,
+                              'sql': statement[:2000], 'caller': caller})
+        print(f"Slow query ({elapsed * 1000:.0f} ms, {fingerprint_id}) from {caller}: {_SPACE.sub(' ', statement)[:200]}",
+              file=sys.stderr)
+
+    if labels['operation'] == 'SELECT':
+        # Repeats of one SELECT while this connection is checked out
+        counts = info.setdefault('query_counts', {})
+        counts[fingerprint_id] = counts.get(fingerprint_id, 0) + 1
+        if counts[fingerprint_id] == N_PLUS_ONE_THRESHOLD:
+            info.setdefault('n_plus_one_callers', {})[fingerprint_id] = (normalized, _caller())
+
+def _end_scope(info: Dict[str, Any]):
+    counts = info.pop('query_counts', None) or {}
+    for fingerprint_id, (sql, caller) in (info.pop('n_plus_one_callers', None) or {}).items():
+        repeats = counts[fingerprint_id]
+        metrics.inc('sql_n_plus_one_total', table=_labels(sql)['table'])
+        with _lock:
+            found = _n_plus_one.get(fingerprint_id)
+            first = found is None
+            if first:
+                found = _n_plus_one[fingerprint_id] = {'sql': sql, 'scopes': 0, 'max_repeats': 0, 'caller': caller}
+            found['scopes'] += 1
+            found['max_repeats'] = max(found['max_repeats'], repeats)
+        if first:
+            print(f"Possible N+1 ({repeats} repeats, {fingerprint_id}) from {caller}: {sql[:200]}", file=sys.stderr)
+
+def instrument(engine):
+    """Attach timing and N+1 hooks to an engine"""
+    from sqlalchemy import event
+
+    if not SQL_INSTRUMENTATION:
+        return engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        _record(statement, elapsed, cursor.rowcount, conn.info)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        # after_cursor_execute doesn't run for failed statements
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(engine, 'checkin')
+    def _checkin(dbapi_connection, connection_record):
+        _end_scope(connection_record.info)
+
+    return engine
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            'statements': [
+                {'fingerprint': s.fingerprint, 'sql': s.sql, 'count': s.count, 'total': s.total,
+                 'mean': s.total / s.count, 'max': s.max, 'rows': s.rows, 'slow': s.slow}
+                for s in sorted(_statements.values(), key=lambda s: s.total, reverse=True)
+            ],
+            'slow': list(_slow_log),
+            'n_plus_one': [{'fingerprint': k, **v} for k, v in _n_plus_one.items()]
+        }
+
+def report(limit: int = 20) -> str:
+    """Top statements by total time, then slow queries and N+1 suspects"""
+    data = snapshot()
+    lines = [f"{'fingerprint':<11}{'count':>8}{'total ms':>11}{'mean ms':>10}{'max ms':>10}{'rows':>9}{'slow':>6}  sql"]
+    for s in data['statements'][:limit]:
+        lines.append(f"{s['fingerprint']:<11}{s['count']:>8}{s['total'] * 1000:>11.1f}{s['mean'] * 1000:>10.2f}"
+                     f"{s['max'] * 1000:>10.1f}{s['rows']:>9}{s['slow']:>6}  {s['sql'][:100]}")
+    if data['slow']:
+        lines += ['', f"Slow queries (>= {SLOW_QUERY_SECONDS * 1000:.0f} ms), latest first:"]
+        for entry in reversed(data['slow'][-limit:]):
+            lines.append(f"  {entry['seconds'] * 1000:8.1f} ms  {entry['fingerprint']}  {entry['caller']}")
+    if data['n_plus_one']:
+        lines += ['', f"Possible N+1 (>= {N_PLUS_ONE_THRESHOLD} repeats per connection checkout):"]
+        for entry in data['n_plus_one']:
+            lines.append(f"  {entry['fingerprint']}  up to {entry['max_repeats']} repeats in {entry['scopes']} scope(s)"
+                         f" from {entry['caller']}: {entry['sql'][:100]}")
+    return '\n'.join(lines)
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _slow_log.clear()
+        _n_plus_one.clear()
+
+def _demo():
+    """Lazy-load N+1 and a slow statement against a throwaway SQLite database"""
+    import tempfile
+    from sqlalchemy import text
+    # The engine hooks report to the imported module, not to __main__
+    from utils import query_stats
+
+    query_stats.SLOW_QUERY_SECONDS = 0.05
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{tmp}/demo.db"
+        from database.models import User, RentSearch, init_db
+        from database.session import get_session
+
+        init_db()
+        session = get_session()
+        try:
+            for i in range(20):
+                user = User(name=f"user{i}", email=f"user{i}@example.com")
+                user.searches = [RentSearch(zip_code='10001', current_rent=2000 + j, address=f"{j} Main St")
+                                 for j in range(3)]
+                session.add(user)
+            session.commit()
+        finally:
+            session.close()
+
+        session = get_session()
+        try:
+            # One query per user for their searches
+            for user in session.query(User).all():
+                len(user.searches)
+            session.execute(text(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 300000) "
+                "SELECT count(*) FROM n"
+            )).scalar()
+        finally:
+            session.close()
+
+    print()
+    print(query_stats.report())
+    print()
+    print('\n'.join(line for line in metrics.render().splitlines()
+                    if line.startswith(('sql_queries_total', 'sql_slow', 'sql_n_plus'))))
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL instrumentation report")
+    parser.add_argument('command', choices=['demo'])
+    parser.parse_args()
+    _demo()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Typed records for comps, violations and market metrics
+
+Single records are slotted dataclasses: no per-instance __dict__, fixed
+fields and plain attribute access. Comps come in a `CompBatch`, one
+NumPy array per field, so averages and filters run over whole columns
+and a batch can be handed to vectorized code without copying. Records
+convert to and from the plain dicts used in JSON payloads.
+
+MarketMetrics is frozen because one instance is shared by every caller
+of the cached market insights.
+"""
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+@dataclass(slots=True)
+class Comp:
+    rent: float
+    bedrooms: int
+    address: str
+    zip_code: str
+    # Normalized unit type (see market_model.UNIT_TYPES), empty when unknown
+    unit_type: str = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Comp":
+        return cls(float(data['rent']), int(data.get('bedrooms') or 0),
+                   str(data.get('address', '')), str(data.get('zip_code', '')),
+                   str(data.get('unit_type') or ''))
+
+@dataclass(slots=True)
+class Violation:
+    type: str
+    description: str
+    date: str = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Violation":
+        return cls(str(data.get('type', '')), str(data.get('description', '')), str(data.get('date') or ''))
+
+@dataclass(slots=True, frozen=True)
+class RentSegment:
+    """Rent statistics for comps sharing an area, bedroom count and unit type"""
+    area: str
+    bedrooms: Optional[int]
+    unit_type: Optional[str]
+    count: int
+    median: float
+    p25: float
+    p75: float
+
+    @property
+    def spread(self) -> float:
+        """Interquartile range"""
+        return self.p75 - self.p25
+
+    def describe(self) -> str:
+        bedrooms = {None: '', 0: 'studio '}.get(self.bedrooms, f"{self.bedrooms}BR ")
+        return f"{bedrooms}{self.unit_type or 'unit'}s in {self.area}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'spread': self.spread}
+
+def violations_from_dicts(items: Iterable[Dict[str, Any]]) -> List[Violation]:
+    return [Violation.from_dict(item) for item in items]
+
+@dataclass(slots=True, frozen=True)
+class Forecast:
+    """Monthly rent forecast with its prediction interval"""
+    months: Tuple[str, ...]
+    rent: Tuple[float, ...]
+    lower: Tuple[float, ...]
+    upper: Tuple[float, ...]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'months': list(self.months), 'rent': list(self.rent),
+                'lower': list(self.lower), 'upper': list(self.upper)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Forecast":
+        return cls(tuple(data['months']), tuple(map(float, data['rent'])),
+                   tuple(map(float, data['lower'])), tuple(map(float, data['upper'])))
+
+@dataclass(slots=True, frozen=True)
+class ZipComps:
+    """Count and rent quartiles of one ZIP's comps"""
+    count: int
+    median_rent: float
+    p25_rent: float
+    p75_rent: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ZipComps":
+        return cls(int(data['count']), float(data['median_rent']), float(data['p25_rent']), float(data['p75_rent']))
+
+@dataclass(slots=True, frozen=True)
+class MarketMetrics:
+    """Market data for one metro; `seasonal` is in market_store.SEASONS order, empty without data"""
+    avg_rent: float = 0.0
+    vacancy_rate: float = 0.0
+    yearly_change: float = 0.0
+    seasonal: Tuple[float, ...] = ()
+    volatility: float = 0.0
+    forecast: Optional[Forecast] = None
+    data_source: str = 'No Data Available'
+    data_version: Optional[int] = None
+    # Count and quartiles of the ZIP's comps, when served from Postgres
+    zip_comps: Optional[ZipComps] = None
+
+    @property
+    def seasonal_patterns(self) -> Dict[str, float]:
+        from utils.market_store import SEASONS
+        return dict(zip(SEASONS, self.seasonal))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'avg_rent': self.avg_rent,
+            'vacancy_rate': self.vacancy_rate,
+            'yearly_change': self.yearly_change,
+            'seasonal_patterns': self.seasonal_patterns,
+            'volatility': self.volatility,
+            'forecast': self.forecast.to_dict() if self.forecast else None,
+            'data_source': self.data_source,
+            'data_version': self.data_version
+        }
+        if self.zip_comps:
+            data['zip_comps'] = self.zip_comps.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MarketMetrics":
+        from utils.market_store import SEASONS
+
+        patterns = data.get('seasonal_patterns') or {}
+        forecast = data.get('forecast')
+        return cls(
+            avg_rent=float(data.get('avg_rent') or 0),
+            vacancy_rate=float(data.get('vacancy_rate') or 0),
+            yearly_change=float(data.get('yearly_change') or 0),
+            seasonal=tuple(float(patterns.get(season, 0)) for season in SEASONS) if patterns else (),
+            volatility=float(data.get('volatility') or 0),
+            forecast=Forecast.from_dict(forecast) if forecast else None,
+            data_source=str(data.get('data_source', 'Client Supplied')),
+            data_version=data.get('data_version'),
+            zip_comps=ZipComps.from_dict(data['zip_comps']) if data.get('zip_comps') else None
+        )
+
+class CompBatch:
+    """Comps as columns: rent (float64), bedrooms (int16), address, zip_code and unit_type (object)"""
+    __slots__ = ('rent', 'bedrooms', 'address', 'zip_code', 'unit_type')
+
+    def __init__(self, rent: np.ndarray, bedrooms: np.ndarray, address: np.ndarray, zip_code: np.ndarray,
+                 unit_type: np.ndarray):
+        self.rent = rent
+        self.bedrooms = bedrooms
+        self.address = address
+        self.zip_code = zip_code
+        self.unit_type = unit_type
+
+    @classmethod
+    def from_columns(cls, rent: Iterable[float], bedrooms: Iterable[int], address: Iterable[str],
+                     zip_code: Iterable[str], unit_type: Optional[Iterable[str]] = None) -> "CompBatch":
+        rent = np.asarray(rent, dtype=np.float64)
+        return cls(
+            rent,
+            np.asarray(bedrooms, dtype=np.int16),
+            _strings(address),
+            _strings(zip_code),
+            _strings(unit_type if unit_type is not None else [''] * len(rent))
+        )
+
+    @classmethod
+    def from_records(cls, comps: Iterable[Comp]) -> "CompBatch":
+        comps = list(comps)
+        return cls.from_columns(
+            [c.rent for c in comps], [c.bedrooms for c in comps],
+            [c.address for c in comps], [c.zip_code for c in comps], [c.unit_type for c in comps]
+        )
+
+    @classmethod
+    def from_dicts(cls, comps: Iterable[Dict[str, Any]]) -> "CompBatch":
+        return cls.from_records(Comp.from_dict(comp) for comp in comps)
+
+    @classmethod
+    def empty(cls) -> "CompBatch":
+        return cls.from_columns([], [], [], [])
+
+    def __len__(self) -> int:
+        return len(self.rent)
+
+    def __iter__(self) -> Iterator[Comp]:
+        for i in range(len(self.rent)):
+            yield self[i]
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray]) -> Union[Comp, "CompBatch"]:
+        """A Comp for an integer index, a CompBatch for a slice or mask"""
+        if isinstance(key, (int, np.integer)):
+            return Comp(float(self.rent[key]), int(self.bedrooms[key]), self.address[key], self.zip_code[key],
+                        self.unit_type[key])
+        return CompBatch(self.rent[key], self.bedrooms[key], self.address[key], self.zip_code[key],
+                         self.unit_type[key])
+
+    def __repr__(self) -> str:
+        return f"CompBatch({len(self)} comps)"
+
+    def mean_rent(self) -> float:
+        return float(self.rent.mean()) if len(self.rent) else 0.0
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [comp.to_dict() for comp in self]
+
+def _strings(values: Iterable[str]) -> np.ndarray:
+    values = list(values)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
@@ -0,0 +1,157 @@
+"""
+Precomputed rent distributions for percentile queries
+
+The comps of utils.market_model are grouped once per ZIP and per
+(ZIP, bedrooms) into sorted rent arrays; bedrooms use the model's
+buckets. Percentile lookups are a binary search over the cumulative
+weights. Distributions larger than MAX_POINTS are compressed into
+equal-weight quantile points, so memory stays bounded as comps grow and
+distributions can be merged for metro-level views.
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+RENTAL_COMPS_PATH = 'data/rental_comps.csv'
+
+# Points kept per distribution; beyond this rents are summarised as quantiles
+MAX_POINTS = 256
+
+class RentDistribution:
+    """Sorted rent values with weights and a cumulative weight array"""
+    __slots__ = ('values', 'weights', 'cumulative')
+
+    def __init__(self, values: np.ndarray, weights: np.ndarray):
+        self.values = values
+        self.weights = weights
+        self.cumulative = np.cumsum(weights, dtype=np.float64)
+
+    @classmethod
+    def from_rents(cls, rents: Iterable[float], max_points: int = MAX_POINTS) -> "RentDistribution":
+        values = np.sort(np.fromiter(rents, dtype=np.float32))
+        return cls(*_compress(values, np.ones(len(values), dtype=np.float32), max_points))
+
+    @property
+    def count(self) -> float:
+        return float(self.cumulative[-1]) if len(self.cumulative) else 0.0
+
+    def percentile(self, rent: float) -> float:
+        """
+        Share of rents below `rent`, counting ties as half (mid-rank), in 0-100
+        Duplicate rents therefore all map to the same percentile
+        """
+        if not len(self.values):
+            return 50.0
+        lo = np.searchsorted(self.values, rent, side='left')
+        hi = np.searchsorted(self.values, rent, side='right')
+        below = self.cumulative[lo - 1] if lo else 0.0
+        equal = (self.cumulative[hi - 1] if hi else 0.0) - below
+        return float((below + 0.5 * equal) / self.count * 100)
+
+    def quantile(self, q: float) -> float:
+        """Rent at quantile q (0-1)"""
+        if not len(self.values):
+            return 0.0
+        i = np.searchsorted(self.cumulative, q * self.count, side='left')
+        return float(self.values[min(i, len(self.values) - 1)])
+
+    def merge(self, *others: "RentDistribution", max_points: int = MAX_POINTS) -> "RentDistribution":
+        """Combine distributions, e.g. several ZIPs into a metro view"""
+        parts = (self,) + others
+        values = np.concatenate([p.values for p in parts])
+        weights = np.concatenate([p.weights for p in parts])
+        order = np.argsort(values, kind='stable')
+        return RentDistribution(*_compress(values[order], weights[order], max_points))
+
+def _compress(values: np.ndarray, weights: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce sorted weighted values to at most max_points equal-weight quantiles"""
+    if len(values) <= max_points:
+        return values, weights
+    cumulative = np.cumsum(weights, dtype=np.float64)
+    total = cumulative[-1]
+    targets = (np.arange(max_points) + 0.5) * total / max_points
+    picks = np.searchsorted(cumulative, targets, side='left')
+    return values[picks], np.full(max_points, total / max_points, dtype=np.float32)
+
+class RentDistributionIndex:
+    """Distributions keyed by ZIP and by (ZIP, bedrooms)"""
+
+    def __init__(self, by_zip: Dict[str, RentDistribution],
+                 by_zip_bedrooms: Dict[Tuple[str, int], RentDistribution]):
+        self.by_zip = by_zip
+        self.by_zip_bedrooms = by_zip_bedrooms
+        self._merged: Dict[Tuple[str, ...], RentDistribution] = {}
+
+    def get(self, zip_code: str, bedrooms: Optional[int] = None) -> Optional[RentDistribution]:
+        if bedrooms is not None:
+            distribution = self.by_zip_bedrooms.get((zip_code, int(bedrooms)))
+            if distribution is not None:
+                return distribution
+        return self.by_zip.get(zip_code)
+
+    def for_zips(self, zip_codes: Iterable[str]) -> Optional[RentDistribution]:
+        """Merged distribution over several ZIPs, cached per ZIP set"""
+        key = tuple(sorted(z for z in zip_codes if z in self.by_zip))
+        if not key:
+            return None
+        if key not in self._merged:
+            first, *rest = (self.by_zip[z] for z in key)
+            self._merged[key] = first.merge(*rest) if rest else first
+        return self._merged[key]
+
+    def for_metro(self, metro: str) -> Optional[RentDistribution]:
+        from utils.data_loader import get_metro_for_zip
+
+        return self.for_zips(z for z in self.by_zip if get_metro_for_zip(z) == metro)
+
+def build_distribution_index(comps, max_points: int = MAX_POINTS) -> RentDistributionIndex:
+    """Group a CompBatch by ZIP and bedrooms in one sorted pass"""
+    zips = comps.zip_code.astype(str)
+    bedrooms = comps.bedrooms.astype(np.int64)
+    rents = comps.rent.astype(np.float32)
+    order = np.lexsort((rents, bedrooms, zips))
+    zips, bedrooms, rents = zips[order], bedrooms[order], rents[order]
+
+    by_zip_bedrooms = {}
+    boundary = np.flatnonzero((zips[1:] != zips[:-1]) | (bedrooms[1:] != bedrooms[:-1])) + 1
+    bounds = [0] + boundary.tolist() + [len(rents)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        values = rents[start:end]
+        if end > start and bedrooms[start] >= 0:
+            by_zip_bedrooms[(str(zips[start]), int(bedrooms[start]))] = RentDistribution(
+                *_compress(values, np.ones(len(values), dtype=np.float32), max_points))
+
+    by_zip = {}
+    boundary = np.flatnonzero(zips[1:] != zips[:-1]) + 1
+    bounds = [0] + boundary.tolist() + [len(rents)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        values = np.sort(rents[start:end])
+        if end > start:
+            by_zip[str(zips[start])] = RentDistribution(
+                *_compress(values, np.ones(len(values), dtype=np.float32), max_points))
+
+    return RentDistributionIndex(by_zip, by_zip_bedrooms)
+
+_index: Optional[RentDistributionIndex] = None
+_index_model = None
+_index_lock = threading.Lock()
+
+def get_distribution_index(path: str = RENTAL_COMPS_PATH) -> Optional[RentDistributionIndex]:
+    """
+    Process-wide index over the comps of utils.market_model, so percentiles
+    rank against the same normalized comps the analysis compares with;
+    rebuilt whenever the model is
+    """
+    global _index, _index_model
+    from utils.market_model import get_market_model
+
+    model = get_market_model(path)
+    if model is None:
+        return None
+    if model is not _index_model:
+        with _index_lock:
+            if model is not _index_model:
+                _index = build_distribution_index(model.comps)
+                _index_model = model
+    return _index
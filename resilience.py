@@ -0,0 +1,366 @@
+"""
+Resilience layer for calls to external services
+
+`call` wraps one upstream request with:
+- a deadline: the remaining budget of the API request or call site, set with
+  `deadline()` and carried in a contextvar, so nested calls never
+  outlive their caller;
+- a per-dependency circuit breaker that fails fast while an upstream is
+  down and lets a single probe through after a cool-down;
+- hedged attempts: a second attempt starts if the first hasn't answered
+  within the hedge delay, and fast failures are retried after a jittered
+  exponential backoff, all inside the deadline;
+- stale-while-revalidate: fresh cached values are returned directly,
+  stale ones are returned at once while a background refresh runs, and
+  the last good value is served whenever the upstream fails or the
+  breaker is open.
+
+Usage:
+    python -m utils.resilience demo [--latency 3] [--error-rate 0.5]
+"""
+import argparse
+import contextvars
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Dict, Callable, Hashable, Optional, TypeVar
+
+from utils import metrics
+
+T = TypeVar('T')
+
+class UpstreamError(Exception):
+    """Raised by a call function when the upstream answered with a server-side failure"""
+
+class CircuitOpenError(UpstreamError):
+    """Raised when a dependency's breaker is rejecting calls"""
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the request's time budget is used up"""
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('upstream_deadline', default=None)
+
+@contextmanager
+def deadline(seconds: float):
+    """Bound upstream calls made inside the block; a nested deadline can only shorten it"""
+    end = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(end, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then half-opens for one probe after a cool-down"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open probe whose attempt was abandoned without an outcome"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+        metrics.set_gauge('upstream_circuit_open', 0, dependency=self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            is_open = self.state == 'open'
+        metrics.set_gauge('upstream_circuit_open', int(is_open), dependency=self.name)
+
+class _LastGood:
+    """Bounded LRU of the last successful value per key, with when it was stored"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class Dependency:
+    """Timeouts, hedging, breaker and cache settings for one upstream service"""
+
+    def __init__(self, name: str, timeout: float, hedge_after: float, max_attempts: int = 2,
+                 fresh_ttl: float = 300.0, stale_ttl: float = 3600.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, backoff_base: float = 0.05, backoff_cap: float = 1.0,
+                 cache_size: int = 1024):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts
+        # Served without calling upstream
+        self.fresh_ttl = fresh_ttl
+        # Served immediately while a background refresh runs
+        self.stale_ttl = stale_ttl
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.cache = _LastGood(cache_size)
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+DEPENDENCIES: Dict[str, Dependency] = {
+    'openai': Dependency('openai', timeout=15.0, hedge_after=6.0, max_attempts=2,
+                         fresh_ttl=3600.0, stale_ttl=86400.0),
+    # Whole LLM completions; per-provider breakers use the provider names
+    # above and below, and hedging across providers is in utils.llm_providers
+    'llm': Dependency('llm', timeout=20.0, hedge_after=20.0, max_attempts=1,
+                      fresh_ttl=3600.0, stale_ttl=86400.0),
+    'anthropic': Dependency('anthropic', timeout=15.0, hedge_after=6.0, max_attempts=2,
+                            fresh_ttl=3600.0, stale_ttl=86400.0),
+    'hud': Dependency('hud', timeout=2.0, hedge_after=0.4, max_attempts=3,
+                      fresh_ttl=86400.0, stale_ttl=30 * 86400.0),
+}
+
+def get_dependency(name: str) -> Dependency:
+    dependency = DEPENDENCIES.get(name)
+    if dependency is None:
+        dependency = DEPENDENCIES.setdefault(name, Dependency(name, timeout=5.0, hedge_after=1.0))
+    return dependency
+
+def configure(name: str, **settings) -> Dependency:
+    """Replace a dependency's settings, resetting its breaker and cache"""
+    current = get_dependency(name)
+    defaults = {
+        'timeout': current.timeout, 'hedge_after': current.hedge_after,
+        'max_attempts': current.max_attempts, 'fresh_ttl': current.fresh_ttl,
+        'stale_ttl': current.stale_ttl, 'failure_threshold': current.breaker.failure_threshold,
+        'reset_timeout': current.breaker.reset_timeout, 'backoff_base': current.backoff_base,
+        'backoff_cap': current.backoff_cap, 'cache_size': current.cache.maxsize,
+    }
+    DEPENDENCIES[name] = Dependency(name, **{**defaults, **settings})
+    return DEPENDENCIES[name]
+
+# Attempts run here so a slow upstream never blocks the caller past its budget
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='upstream')
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upstream-refresh')
+
+def _timed_attempt(dependency: Dependency, fn: Callable[[float], T], timeout: float) -> T:
+    start = time.perf_counter()
+    try:
+        return fn(timeout)
+    finally:
+        metrics.observe('upstream_attempt_seconds', time.perf_counter() - start, dependency=dependency.name)
+
+def _hedged(dependency: Dependency, fn: Callable[[float], T], timeout: float) -> T:
+    """First successful result among up to max_attempts overlapping attempts"""
+    end = time.monotonic() + timeout
+    pending = set()
+    errors = []
+    attempts = 0
+    next_start = time.monotonic()
+
+    try:
+        while True:
+            now = time.monotonic()
+            if attempts < dependency.max_attempts and now >= next_start:
+                attempts += 1
+                if attempts > 1:
+                    metrics.inc('upstream_hedges_total', dependency=dependency.name)
+                context = contextvars.copy_context()
+                pending.add(_executor.submit(context.run, _timed_attempt, dependency, fn, end - now))
+                next_start = now + dependency.hedge_after * random.uniform(0.8, 1.2)
+
+            if not pending:
+                if attempts >= dependency.max_attempts:
+                    raise errors[-1]
+                time.sleep(max(0.0, min(end, next_start) - time.monotonic()))
+            else:
+                wake = end if attempts >= dependency.max_attempts else min(end, next_start)
+                done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        # Retry a fast failure after a jittered backoff instead of the full hedge delay
+                        backoff = random.uniform(0, min(dependency.backoff_cap, dependency.backoff_base * 2 ** len(errors)))
+                        next_start = min(next_start, time.monotonic() + backoff)
+
+            if time.monotonic() >= end:
+                raise DeadlineExceeded(f"{dependency.name} did not answer within {timeout:.2f}s")
+    finally:
+        # Losing attempts still queued never start; running ones stop at their own timeout
+        for future in pending:
+            future.cancel()
+
+def _fetch(dependency: Dependency, fn: Callable[[float], T]) -> T:
+    """One guarded upstream call: deadline, breaker, then hedged attempts"""
+    budget = remaining()
+    timeout = dependency.timeout if budget is None else min(dependency.timeout, budget)
+    if timeout <= 0:
+        raise DeadlineExceeded(f"No time left to call {dependency.name}")
+    if not dependency.breaker.allow():
+        raise CircuitOpenError(f"{dependency.name} circuit is open")
+    try:
+        value = _hedged(dependency, fn, timeout)
+    except DeadlineExceeded:
+        # Running out of the caller's budget says nothing about the upstream
+        if budget is not None and budget < dependency.timeout:
+            dependency.breaker.release()
+        else:
+            dependency.breaker.record_failure()
+        raise
+    except Exception:
+        dependency.breaker.record_failure()
+        raise
+    dependency.breaker.record_success()
+    return value
+
+def _revalidate(dependency: Dependency, key: Hashable, fn: Callable[[float], T]):
+    # Single flight per key; runs outside the request so it isn't bound by its deadline
+    with dependency._refreshing_lock:
+        if key in dependency._refreshing:
+            return
+        dependency._refreshing.add(key)
+
+    def refresh():
+        try:
+            dependency.cache.set(key, _fetch(dependency, fn))
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"Background refresh of {dependency.name} failed: {str(e)}")
+        finally:
+            with dependency._refreshing_lock:
+                dependency._refreshing.discard(key)
+
+    _refresh_executor.submit(refresh)
+
+def call(dependency_name: str, key: Hashable, fn: Callable[[float], T], fallback: Optional[T] = None) -> Optional[T]:
+    """
+    Call an upstream through the resilience layer
+    `fn(timeout)` performs one attempt and must give up after `timeout` seconds.
+    Returns the fresh, stale or last good value, or `fallback` if there is none.
+    """
+    dependency = get_dependency(dependency_name)
+    entry = dependency.cache.get(key)
+    age = time.monotonic() - entry[1] if entry else None
+
+    if entry and age < dependency.fresh_ttl:
+        metrics.inc('upstream_requests_total', dependency=dependency_name, outcome='fresh')
+        return entry[0]
+    if entry and age < dependency.stale_ttl:
+        metrics.inc('upstream_requests_total', dependency=dependency_name, outcome='stale')
+        _revalidate(dependency, key, fn)
+        return entry[0]
+
+    start = time.perf_counter()
+    try:
+        value = _fetch(dependency, fn)
+    except Exception as e:
+        outcome = 'open' if isinstance(e, CircuitOpenError) else 'error'
+        metrics.inc('upstream_requests_total', dependency=dependency_name, outcome=outcome)
+        if outcome == 'error':
+            print(f"Error calling {dependency_name}: {str(e)}")
+        # Stale-if-error: any last good value beats the hard-coded fallback
+        return entry[0] if entry else fallback
+    finally:
+        metrics.observe('upstream_request_seconds', time.perf_counter() - start, dependency=dependency_name)
+
+    dependency.cache.set(key, value)
+    metrics.inc('upstream_requests_total', dependency=dependency_name, outcome='ok')
+    return value
+
+def _demo(latency: float, error_rate: float, requests_count: int, budget: float):
+    """Call the HUD client against a faulty stub and print per-request latency"""
+    import os
+    from utils.stub_services import StubServer
+    # The layer the HUD client uses, rather than this module run as __main__
+    from utils.resilience import configure, deadline, get_dependency
+
+    server = StubServer().start()
+    os.environ['HUD_API_BASE_URL'] = server.hud_base_url
+    os.environ.setdefault('HUD_API_KEY', 'stub')
+    # Always go upstream so the demo exercises failures, not the fresh cache
+    configure('hud', fresh_ttl=0, stale_ttl=0, reset_timeout=2.0)
+
+    from utils.api_integrations import HUDAPI
+
+    client = HUDAPI()
+    zip_codes = [f"{10000 + i:05d}" for i in range(5)]
+    try:
+        # A healthy pass leaves a last good value for each ZIP
+        for zip_code in zip_codes:
+            client.get_fair_market_rent(zip_code)
+        server.set_fault('hud', latency=latency, error_rate=error_rate)
+
+        for i in range(requests_count):
+            start = time.perf_counter()
+            with deadline(budget):
+                result = client.get_fair_market_rent(zip_codes[i % len(zip_codes)])
+            breaker = get_dependency('hud').breaker
+            print(f"request {i:2d}: {(time.perf_counter() - start) * 1000:7.1f} ms  "
+                  f"{'data' if result else 'no data':8s} breaker={breaker.state}")
+    finally:
+        server.stop()
+    print()
+    print(metrics.render())
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the resilience layer against a fault-injecting stub")
+    parser.add_argument('command', choices=['demo'])
+    parser.add_argument('--latency', type=float, default=3.0, help="Seconds the stub waits before answering")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of stub requests that fail with 503")
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=0.5, help="Per-request deadline in seconds")
+    args = parser.parse_args()
+    _demo(args.latency, args.error_rate, args.requests, args.budget)
+
+if __name__ == "__main__":
+    main()
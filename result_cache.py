@@ -0,0 +1,168 @@
+"""
+Full-analysis result cache shared across worker processes
+
+Results of `analysis.analyze` are stored in a local SQLite database in WAL
+mode, so every Streamlit worker on the host reads the same entries.
+Entries are keyed on (ZIP, rent, address, bedrooms, unit type, data
+version), expire after a TTL, and are dropped when the data version
+moves on. The data version covers the market data, the comps file the
+market model is built from and the violations file. Degraded results, with no market data or no comps,
+are kept only briefly so a recovered source is picked up soon.
+Payloads are pickled and zlib-compressed.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', 'data/result_cache.sqlite3')
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 6 * 3600))
+
+# Fallback results (no market data or no comps) expire after this many seconds
+RESULT_CACHE_DEGRADED_TTL = float(os.getenv('RESULT_CACHE_DEGRADED_TTL', 60))
+
+# Part of every key; bump when the shape of analysis results changes so
+# entries pickled in the old shape are never read back
+PAYLOAD_FORMAT = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_results (
+    key BLOB PRIMARY KEY,
+    data_version INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    payload BLOB NOT NULL
+) WITHOUT ROWID
+"""
+
+def _encode(value: Any) -> bytes:
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+
+def _decode(payload: bytes) -> Any:
+    return pickle.loads(zlib.decompress(payload))
+
+def make_key(zip_code: str, current_rent: float, address: str, data_version: int,
+             bedrooms: Optional[int] = None, unit_type: Optional[str] = None) -> bytes:
+    normalized = '\x1f'.join([
+        (zip_code or '').strip(),
+        # Score, comps and market rate all depend on the exact rent
+        repr(float(current_rent)),
+        ' '.join((address or '').lower().split()),
+        '' if bedrooms is None else str(bedrooms),
+        (unit_type or '').strip().lower(),
+        str(data_version),
+        str(PAYLOAD_FORMAT)
+    ])
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+class ResultCache:
+    """SQLite-backed key/value store with TTL and data-version invalidation"""
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, ttl: float = RESULT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: bytes, data_version: int) -> Optional[Any]:
+        row = self._connection().execute(
+            'SELECT payload FROM analysis_results WHERE key = ? AND data_version = ? AND expires_at > ?',
+            (key, data_version, time.time())
+        ).fetchone()
+        return _decode(row[0]) if row else None
+
+    def set(self, key: bytes, data_version: int, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO analysis_results (key, data_version, expires_at, payload) VALUES (?, ?, ?, ?)',
+            (key, data_version, expires_at, _encode(value))
+        )
+
+    def purge(self, current_version: Optional[int] = None) -> int:
+        """Delete expired entries and, if given, entries from other data versions"""
+        conn = self._connection()
+        if current_version is None:
+            cursor = conn.execute('DELETE FROM analysis_results WHERE expires_at <= ?', (time.time(),))
+        else:
+            cursor = conn.execute(
+                'DELETE FROM analysis_results WHERE expires_at <= ? OR data_version != ?',
+                (time.time(), current_version)
+            )
+        return cursor.rowcount
+
+    def clear(self):
+        self._connection().execute('DELETE FROM analysis_results')
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+def is_degraded(result: Dict[str, Any]) -> bool:
+    """True for fallback results: no market data for the ZIP, or no comps"""
+    return result.get('score_source') == 'No Market Data Available' or not len(result.get('comps') or ())
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def data_version() -> int:
+    """Version of every input analyze() reads: market data, comps and violations"""
+    from utils.analysis import VIOLATIONS_PATH
+    from utils.market_store import get_data_version
+    from utils.rent_distribution import RENTAL_COMPS_PATH
+
+    # The market model is rebuilt whenever the comps file changes, so its mtime versions the model
+    parts = (get_data_version(), _mtime_ns(RENTAL_COMPS_PATH), _mtime_ns(VIOLATIONS_PATH))
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def get_cached_analysis(zip_code: str, current_rent: float, address: str,
+                        bedrooms: Optional[int] = None, unit_type: Optional[str] = None) -> Dict[str, Any]:
+    """Return the full analysis for a search, computing and storing it on a miss"""
+    from utils.analysis import analyze
+
+    try:
+        version = data_version()
+    except Exception as e:
+        print(f"Error reading analysis data version: {str(e)}")
+        return analyze(zip_code, current_rent, address, bedrooms, unit_type)
+
+    cache = get_result_cache()
+    key = make_key(zip_code, current_rent, address, version, bedrooms, unit_type)
+    try:
+        cached = cache.get(key, version)
+        if cached is not None:
+            return cached
+    except sqlite3.Error as e:
+        print(f"Error reading result cache: {str(e)}")
+
+    result = analyze(zip_code, current_rent, address, bedrooms, unit_type)
+    try:
+        cache.set(key, version, result, RESULT_CACHE_DEGRADED_TTL if is_degraded(result) else None)
+    except sqlite3.Error as e:
+        print(f"Error writing result cache: {str(e)}")
+    return result
@@ -0,0 +1,68 @@
+"""
+Customer savings counter for the landing and home pages
+
+The total lives in the single-row savings_totals table, incremented in
+the same transaction as each RentSearch insert or negotiation update.
+Pages read it through a short in-process cache, so a landing-page hit
+is at most one primary-key lookup and never an aggregate query.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+SAVINGS_CACHE_TTL = float(os.getenv('SAVINGS_CACHE_TTL', 30))
+
+_lock = threading.Lock()
+_cached_total: Optional[float] = None
+_cached_at = 0.0
+
+def _read_total() -> float:
+    from database.models import SavingsTotal, SAVINGS_TOTAL_ID
+    from database.session import get_read_session
+
+    session = get_read_session()
+    try:
+        row = session.get(SavingsTotal, SAVINGS_TOTAL_ID)
+        return float(row.total) if row else 0.0
+    finally:
+        session.close()
+
+def get_total_savings() -> float:
+    """Total savings, at most SAVINGS_CACHE_TTL seconds stale"""
+    global _cached_total, _cached_at
+    now = time.monotonic()
+    if _cached_total is not None and now - _cached_at < SAVINGS_CACHE_TTL:
+        return _cached_total
+    with _lock:
+        if _cached_total is not None and now - _cached_at < SAVINGS_CACHE_TTL:
+            return _cached_total
+        try:
+            _cached_total = _read_total()
+        except Exception as e:
+            print(f"Error loading savings total: {str(e)}")
+            # Serve the last known value and retry after the next TTL
+            _cached_total = _cached_total or 0.0
+        _cached_at = now
+        return _cached_total
+
+def mark_negotiated(session, search_id: int, user_id: Optional[int] = None) -> bool:
+    """
+    Flag a saved search as negotiated and credit its savings to the counter
+    Returns False if the search doesn't exist or was already counted
+    """
+    from database.models import RentSearch, add_to_savings_total
+
+    query = session.query(RentSearch).filter(RentSearch.id == search_id)
+    if user_id is not None:
+        query = query.filter(RentSearch.user_id == user_id)
+    search = query.with_for_update().first()
+    if search is None or search.negotiated:
+        return False
+    search.negotiated = True
+    add_to_savings_total(session.connection(), search.savings)
+    session.commit()
+    return True
+
+def format_savings(total: float) -> str:
+    return f"${total:,.0f}"
@@ -1,20 +1,140 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+"""
+Database sessions with read/write routing
+
+DATABASE_URL is the primary. DATABASE_REPLICA_URLS optionally lists
+read replicas, comma-separated. Engines and their pools are created once
+per process and URL.
+
+`get_session()` always talks to the primary. `get_read_session()` is for
+read-mostly pages: its queries go to a replica, but anything that writes
+(a flush, an INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE) goes to the
+primary and pins the rest of the session there. For read-your-writes
+across sessions, a client (the Streamlit browser session, otherwise the
+thread) that committed a write within READ_YOUR_WRITES_WINDOW seconds
+reads from the primary too, which covers the replica lag.
+"""
+import itertools
 import os
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', 5.0))
 
-def get_session():
+def _primary_url() -> str:
     database_url = os.getenv('DATABASE_URL')
     if not database_url:
         raise ValueError("DATABASE_URL environment variable not set")
+    return database_url
 
-    engine = create_engine(
-        database_url,
+def _replica_urls() -> List[str]:
+    return [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+@lru_cache(maxsize=None)
+def _engine(url: str):
+    from utils.query_stats import instrument
+
+    return instrument(create_engine(
+        url,
         poolclass=QueuePool,
         pool_size=5,
         max_overflow=10,
         pool_timeout=30,
-        pool_recycle=1800
-    )
-    Session = sessionmaker(bind=engine)
-    return Session()
\ No newline at end of file
+        pool_recycle=1800,
+        pool_pre_ping=True
+    ))
+
+def get_engine():
+    """Engine for the primary"""
+    return _engine(_primary_url())
+
+_replica_cycle = None
+_replica_lock = threading.Lock()
+
+def get_read_engine():
+    """Next replica engine in round-robin order, or the primary without replicas"""
+    global _replica_cycle
+    urls = _replica_urls()
+    if not urls:
+        return get_engine()
+    with _replica_lock:
+        if _replica_cycle is None:
+            _replica_cycle = itertools.cycle(urls)
+        return _engine(next(_replica_cycle))
+
+def _client_key() -> Hashable:
+    # Only look for a Streamlit session if Streamlit is already loaded
+    if 'streamlit' in sys.modules:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            return ctx.session_id
+    return threading.get_ident()
+
+_last_write: Dict[Hashable, float] = {}
+_last_write_lock = threading.Lock()
+
+def _record_write(client: Hashable):
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write[client] = now
+        # Drop clients outside the window so the map stays small
+        if len(_last_write) > 10000:
+            for key, at in list(_last_write.items()):
+                if now - at > READ_YOUR_WRITES_WINDOW:
+                    del _last_write[key]
+
+def wrote_recently(client: Optional[Hashable] = None) -> bool:
+    with _last_write_lock:
+        at = _last_write.get(_client_key() if client is None else client)
+    return at is not None and time.monotonic() - at < READ_YOUR_WRITES_WINDOW
+
+def _is_write(clause) -> bool:
+    if clause is None:
+        return False
+    return bool(getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None)
+
+class RoutingSession(Session):
+    """Session that reads from a replica and writes to the primary"""
+
+    def __init__(self, read_only: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.client = _client_key()
+        # Writers, and readers whose client just wrote, stay on the primary
+        self.pinned = not read_only or wrote_recently(self.client)
+        self.wrote = False
+        self._replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or _is_write(clause):
+            self.wrote = True
+            self.pinned = True
+        if self.pinned:
+            return get_engine()
+        if self._replica is None:
+            # One replica per session so its reads are mutually consistent
+            self._replica = get_read_engine()
+        return self._replica
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session.wrote:
+        _record_write(session.client)
+        session.wrote = False
+
+_Session = sessionmaker(class_=RoutingSession)
+
+def get_session() -> RoutingSession:
+    """Session on the primary, for anything that writes or must read its own writes"""
+    return _Session()
+
+def get_read_session() -> RoutingSession:
+    """Session whose reads may be served by a replica"""
+    return _Session(read_only=True)
@@ -0,0 +1,253 @@
+"""
+Local stub servers for the OpenAI, Anthropic and HUD APIs used in load tests
+
+Chat completions and messages stream as server-sent events when the
+request asks for it, in the chunk and event order of the real APIs, with
+token usage estimated at four characters per token.
+
+Faults can be injected per service with `set_fault`: added latency and a
+share of requests that fail with a given status, to exercise timeouts,
+circuit breakers and fallbacks.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+
+STUB_MARKET_ANALYSIS = {
+    "market_position": "above market",
+    "price_trend": "stable",
+    "negotiation_leverage": "moderate",
+    "best_time_to_negotiate": "Winter",
+    "key_insights": ["Stubbed market insight"],
+    "confidence_score": 0.5
+}
+
+STUB_FAIR_MARKET_RENT = {
+    "data": {
+        "basicdata": {
+            "zip_code": "00000",
+            "Efficiency": 1500,
+            "One-Bedroom": 1700,
+            "Two-Bedroom": 2000,
+            "Three-Bedroom": 2500,
+            "Four-Bedroom": 2800
+        }
+    }
+}
+
+def _pieces(text: str, size: int = 16):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def _usage(request: Dict[str, Any], completion: str):
+    """Rough (input, output) token counts for a chat request"""
+    prompt = ''.join(str(message.get('content', '')) for message in request.get('messages', []))
+    return max(1, len(prompt) // 4), max(1, len(completion) // 4)
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep load test output readable
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, events):
+        """Stream (event name, payload) pairs as server-sent events, then close"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for event, payload in events:
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            prefix = f"event: {event}\n" if event else ""
+            self.wfile.write(f"{prefix}data: {data}\n\n".encode())
+            self.wfile.flush()
+
+    def _inject_fault(self, service: str) -> bool:
+        """Apply the configured fault; True if an error response was sent"""
+        fault = self.server.faults.get(service)
+        if not fault:
+            return False
+        if fault['latency']:
+            time.sleep(fault['latency'])
+        if fault['error_rate'] and random.random() < fault['error_rate']:
+            self._send_json(fault['status'], {"error": "injected fault"})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            self.server.record_call('openai')
+            if self._inject_fault('openai'):
+                return
+            self._chat_completion(request)
+        elif path.endswith('/v1/messages'):
+            self.server.record_call('anthropic')
+            if self._inject_fault('anthropic'):
+                return
+            self._message(request)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _chat_completion(self, request: Dict[str, Any]):
+        content = json.dumps(STUB_MARKET_ANALYSIS)
+        usage = _usage(request, content)
+        usage = {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)}
+        model = request.get('model', 'gpt-4o')
+        if not request.get('stream'):
+            self._send_json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        def chunk(delta, finish_reason=None):
+            return None, {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += [chunk({"content": piece}) for piece in _pieces(content)]
+        events.append(chunk({}, "stop"))
+        if request.get('stream_options', {}).get('include_usage'):
+            events.append((None, {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [], "usage": usage
+            }))
+        events.append((None, "[DONE]"))
+        self._send_events(events)
+
+    def _message(self, request: Dict[str, Any]):
+        content = json.dumps(STUB_MARKET_ANALYSIS)
+        input_tokens, output_tokens = _usage(request, content)
+        message = {
+            "id": "msg_stub", "type": "message", "role": "assistant",
+            "model": request.get('model', 'claude-3-5-sonnet-20241022'),
+            "content": [{"type": "text", "text": content}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        }
+        if not request.get('stream'):
+            self._send_json(200, message)
+            return
+
+        start = {**message, "content": [], "stop_reason": None,
+                 "usage": {"input_tokens": input_tokens, "output_tokens": 1}}
+        events = [
+            ("message_start", {"type": "message_start", "message": start}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+        ]
+        events += [
+            ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                     "delta": {"type": "text_delta", "text": piece}})
+            for piece in _pieces(content)
+        ]
+        events += [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": output_tokens}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        self._send_events(events)
+
+    def do_GET(self):
+        if self.path.startswith('/hud/fmr/data'):
+            self.server.record_call('hud')
+            if self._inject_fault('hud'):
+                return
+            self._send_json(200, STUB_FAIR_MARKET_RENT)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering OpenAI chat completions, Anthropic messages and HUD FMR lookups"""
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self.calls: Dict[str, int] = {}
+        self.faults: Dict[str, Dict[str, Any]] = {}
+        self._calls_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def hud_base_url(self) -> str:
+        return f"{self.base_url}/hud/fmr/data"
+
+    def record_call(self, service: str):
+        with self._calls_lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up on an injected delay close the socket first
+        import sys
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def set_fault(self, service: str, latency: float = 0.0, error_rate: float = 0.0, status: int = 503):
+        """Delay every response to `service` and fail a share of them"""
+        self.faults[service] = {'latency': latency, 'error_rate': error_rate, 'status': status}
+
+    def clear_faults(self):
+        self.faults.clear()
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve stub OpenAI, Anthropic and HUD APIs")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--service', action='append', choices=['openai', 'anthropic', 'hud'],
+                        help="Service to inject faults into (default: all)")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--status', type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubServer(port=args.port)
+    if args.latency or args.error_rate:
+        for service in args.service or ['openai', 'anthropic', 'hud']:
+            server.set_fault(service, args.latency, args.error_rate, args.status)
+    print(f"Stub services listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,214 @@
+"""
+Jurisdiction-indexed tenant rights catalog
+
+data/tenant_rights.json is a tree of federal, state and city
+jurisdictions. Each level lists rights by key, and a child's right
+replaces the parent's right with the same key. States and cities claim
+ZIPs by 3-digit prefix ranges ("100-149") or by full 5-digit ZIPs.
+
+The tree is compiled into data/tenant_rights.bin. The file holds a small
+JSON header, with deduplicated right texts and each jurisdiction's
+resolved right ids, followed by a uint16 array mapping every 5-digit ZIP
+to its most specific jurisdiction. Workers memory-map the array, so a
+lookup is one array read and the index costs 200 KB of shared pages
+however many states are listed.
+
+Usage:
+    python -m utils.tenant_rights compile
+    python -m utils.tenant_rights lookup 10001
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+TENANT_RIGHTS_PATH = 'data/tenant_rights.json'
+COMPILED_PATH = 'data/tenant_rights.bin'
+
+_MAGIC = b'TRC1'
+_HEADER = struct.Struct('<4sI')
+ZIP_SPACE = 100000
+FEDERAL = 0
+
+class TenantRightsCatalog:
+    """Compiled catalog: right texts, jurisdictions and a ZIP -> jurisdiction array"""
+
+    def __init__(self, texts: List[str], jurisdictions: List[List[Any]], zip_index: np.ndarray):
+        self.texts = texts
+        # [name, level, parent id, resolved right ids]
+        self.jurisdictions = jurisdictions
+        self.zip_index = zip_index
+
+    def jurisdiction_for(self, zip_code: Optional[str]) -> int:
+        digits = (zip_code or '').strip()[:5]
+        if len(digits) != 5 or not digits.isdigit():
+            return FEDERAL
+        return int(self.zip_index[int(digits)])
+
+    def chain(self, jurisdiction: int) -> List[str]:
+        """Jurisdiction names from federal down to the given one"""
+        names = []
+        while jurisdiction is not None:
+            name, _, parent, _ = self.jurisdictions[jurisdiction]
+            names.append(name)
+            jurisdiction = parent
+        return names[::-1]
+
+    def rights(self, zip_code: Optional[str] = None) -> List[str]:
+        ids = self.jurisdictions[self.jurisdiction_for(zip_code)][3]
+        return [self.texts[i] for i in ids]
+
+    def lookup(self, zip_code: Optional[str] = None) -> Dict[str, Any]:
+        jurisdiction = self.jurisdiction_for(zip_code)
+        name, level, _, ids = self.jurisdictions[jurisdiction]
+        return {
+            'jurisdiction': name,
+            'level': level,
+            'chain': self.chain(jurisdiction),
+            'rights': [self.texts[i] for i in ids]
+        }
+
+def _zip_ranges(spec: str) -> Tuple[int, int]:
+    """'100-149' -> (10000, 15000); '10001' -> (10001, 10002)"""
+    if len(spec) == 5:
+        return int(spec), int(spec) + 1
+    low, _, high = spec.partition('-')
+    return int(low) * 100, (int(high or low) + 1) * 100
+
+def compile_catalog(tree: Dict[str, Any]) -> TenantRightsCatalog:
+    """Resolve inheritance and build the ZIP index from a catalog tree"""
+    texts: List[str] = []
+    text_ids: Dict[str, int] = {}
+    jurisdictions: List[List[Any]] = []
+
+    def add(name, level, parent, node, inherited):
+        rights = dict(inherited)
+        for right in node.get('rights', []):
+            text = right['text']
+            if text not in text_ids:
+                text_ids[text] = len(texts)
+                texts.append(text)
+            rights[right['key']] = text_ids[text]
+        jurisdictions.append([name, level, parent, list(rights.values())])
+        return len(jurisdictions) - 1, rights
+
+    zip_index = np.full(ZIP_SPACE, FEDERAL, dtype=np.uint16)
+    _, federal_rights = add(tree.get('name', 'United States'), 'federal', None, tree, {})
+
+    # States first so that city ZIPs overwrite their state's
+    cities = []
+    for code, state in tree.get('states', {}).items():
+        state_id, state_rights = add(state.get('name', code), 'state', FEDERAL, state, federal_rights)
+        for spec in state.get('zip3', []) + state.get('zips', []):
+            low, high = _zip_ranges(spec)
+            zip_index[low:high] = state_id
+        for city_name, city in state.get('cities', {}).items():
+            cities.append((f"{city_name}, {code}", state_id, city, state_rights))
+
+    for name, state_id, city, state_rights in cities:
+        city_id, _ = add(name, 'city', state_id, city, state_rights)
+        for spec in city.get('zip3', []) + city.get('zips', []):
+            low, high = _zip_ranges(spec)
+            zip_index[low:high] = city_id
+
+    if len(jurisdictions) > np.iinfo(np.uint16).max:
+        raise ValueError(f"Too many jurisdictions for a uint16 index: {len(jurisdictions)}")
+    return TenantRightsCatalog(texts, jurisdictions, zip_index)
+
+def save_compiled(catalog: TenantRightsCatalog, path: str = COMPILED_PATH):
+    """Write the compiled catalog atomically"""
+    header = json.dumps(
+        {'texts': catalog.texts, 'jurisdictions': catalog.jurisdictions},
+        separators=(',', ':'), ensure_ascii=False
+    ).encode()
+    # Pad so the index starts on an 8-byte boundary
+    header += b' ' * (-(_HEADER.size + len(header)) % 8)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(header)))
+        f.write(header)
+        f.write(np.ascontiguousarray(catalog.zip_index, dtype='<u2').tobytes())
+    os.replace(tmp_path, path)
+
+def load_compiled(path: str = COMPILED_PATH) -> TenantRightsCatalog:
+    """Read the header and memory-map the ZIP index"""
+    with open(path, 'rb') as f:
+        magic, header_len = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a compiled tenant rights catalog")
+        header = json.loads(f.read(header_len))
+    zip_index = np.memmap(path, dtype='<u2', mode='r', offset=_HEADER.size + header_len, shape=(ZIP_SPACE,))
+    return TenantRightsCatalog(header['texts'], header['jurisdictions'], zip_index)
+
+def build(source_path: str = TENANT_RIGHTS_PATH, compiled_path: str = COMPILED_PATH) -> TenantRightsCatalog:
+    with open(source_path) as f:
+        catalog = compile_catalog(json.load(f))
+    save_compiled(catalog, compiled_path)
+    return catalog
+
+def _fallback_catalog() -> TenantRightsCatalog:
+    # The flat list from the violations data, as a single federal jurisdiction
+    from utils.analysis import load_violations_data
+
+    texts = list(load_violations_data().get('tenant_rights', []))
+    return TenantRightsCatalog(
+        texts, [['United States', 'federal', None, list(range(len(texts)))]],
+        np.zeros(ZIP_SPACE, dtype=np.uint16)
+    )
+
+_catalog: Optional[TenantRightsCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> TenantRightsCatalog:
+    """
+    Process-wide catalog, loaded once
+    Recompiles first if the compiled file is missing or older than the source
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                try:
+                    stale = os.path.exists(TENANT_RIGHTS_PATH) and (
+                        not os.path.exists(COMPILED_PATH)
+                        or os.path.getmtime(TENANT_RIGHTS_PATH) > os.path.getmtime(COMPILED_PATH)
+                    )
+                    if stale:
+                        build()
+                    _catalog = load_compiled()
+                except Exception as e:
+                    print(f"Error loading tenant rights catalog: {str(e)}")
+                    _catalog = _fallback_catalog()
+    return _catalog
+
+def get_tenant_rights(zip_code: Optional[str] = None) -> List[str]:
+    """Tenant rights that apply at a ZIP code, federal rights if unknown"""
+    return get_catalog().rights(zip_code)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile or query the tenant rights catalog")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile')
+    compile_parser.add_argument('--source', default=TENANT_RIGHTS_PATH)
+    compile_parser.add_argument('--out', default=COMPILED_PATH)
+    lookup_parser = subparsers.add_parser('lookup')
+    lookup_parser.add_argument('zip_code')
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        catalog = build(args.source, args.out)
+        print(f"Compiled {len(catalog.jurisdictions)} jurisdictions and {len(catalog.texts)} rights "
+              f"into {args.out} ({os.path.getsize(args.out) / 1024:.0f} KB)")
+    else:
+        result = get_catalog().lookup(args.zip_code)
+        print(" > ".join(result['chain']))
+        for right in result['rights']:
+            print(f"- {right}")
+
+if __name__ == "__main__":
+    main()
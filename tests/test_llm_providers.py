@@ -0,0 +1,110 @@
+import time
+import uuid
+
+import pytest
+
+from utils.llm_providers import LLMError, LLMStream, StubProvider, complete_json
+from utils.resilience import CircuitOpenError, configure
+
+SCHEMA = {
+    'type': 'object',
+    'required': ['summary', 'score'],
+    'properties': {'summary': {'type': 'string'}, 'score': {'type': 'integer', 'minimum': 0, 'maximum': 100}},
+}
+VALID = {'summary': 'Rents are flat', 'score': 60}
+
+@pytest.fixture
+def stub():
+    """Stub providers with unique names, so each test gets fresh breakers"""
+    def make(label, **kwargs):
+        name = f"{label}-{uuid.uuid4().hex[:8]}"
+        configure(name, failure_threshold=kwargs.pop('failure_threshold', 5),
+                  reset_timeout=kwargs.pop('reset_timeout', 30.0))
+        return StubProvider(name, **kwargs)
+    return make
+
+def breaker(provider):
+    from utils.resilience import get_dependency
+    return get_dependency(provider.name).breaker
+
+def test_primary_wins_without_hedging(stub):
+    primary, secondary = stub('a', response=VALID), stub('b', response=VALID)
+    stream = LLMStream('prompt', [primary, secondary], hedge_after=1.0)
+    assert ''.join(stream) == '{"summary": "Rents are flat", "score": 60}'
+    assert stream.provider is primary
+    assert stream.usage['output_tokens'] > 0
+
+def test_hedge_wins_when_primary_is_slow(stub):
+    primary = stub('a', response=VALID, first_token_latency=2.0)
+    secondary = stub('b', response=VALID)
+    start = time.monotonic()
+    stream = LLMStream('prompt', [primary, secondary], hedge_after=0.05, timeout=5.0)
+    ''.join(stream)
+    assert stream.provider is secondary
+    assert time.monotonic() - start < 1.0
+    # The cancelled primary is not counted against its breaker
+    assert breaker(primary).failures == 0
+
+def test_failover_after_error(stub):
+    primary = stub('a', error=RuntimeError('boom'))
+    secondary = stub('b', response=VALID)
+    stream = LLMStream('prompt', [primary, secondary], hedge_after=10.0)
+    ''.join(stream)
+    assert stream.provider is secondary
+    assert breaker(primary).failures == 1
+    assert len(stream.errors) == 1
+
+def test_every_provider_failing_raises(stub):
+    providers = [stub('a', error=RuntimeError('a down')), stub('b', error=RuntimeError('b down'))]
+    with pytest.raises(RuntimeError, match='down'):
+        ''.join(LLMStream('prompt', providers, hedge_after=10.0))
+
+def test_schema_invalid_output_falls_through(stub):
+    invalid = stub('a', response={'summary': 'Missing score'})
+    valid = stub('b', response=VALID)
+    assert complete_json('prompt', SCHEMA, providers=[invalid, valid], hedge_after=10.0) == VALID
+
+def test_no_valid_output_raises(stub):
+    providers = [stub('a', response='not json'), stub('b', response={'summary': 1, 'score': 500})]
+    with pytest.raises(LLMError, match='No provider returned valid output'):
+        complete_json('prompt', SCHEMA, providers=providers, hedge_after=10.0)
+
+def test_open_circuits_are_skipped(stub):
+    down = stub('a', response=VALID, failure_threshold=1)
+    breaker(down).record_failure()
+    with pytest.raises(CircuitOpenError):
+        ''.join(LLMStream('prompt', [down], hedge_after=10.0))
+    up = stub('b', response=VALID)
+    stream = LLMStream('prompt', [down, up], hedge_after=10.0)
+    ''.join(stream)
+    assert stream.provider is up
+
+def test_breaker_recovers_through_probe(stub):
+    provider = stub('a', response=VALID, failure_threshold=1, reset_timeout=0.05)
+    breaker(provider).record_failure()
+    assert breaker(provider).state == 'open'
+    time.sleep(0.1)
+    stream = LLMStream('prompt', [provider], hedge_after=10.0)
+    ''.join(stream)
+    assert stream.provider is provider
+    assert breaker(provider).state == 'closed'
+
+def test_unused_half_open_provider_keeps_its_probe(stub):
+    primary = stub('a', response=VALID)
+    backup = stub('b', response=VALID, failure_threshold=1, reset_timeout=0.05)
+    breaker(backup).record_failure()
+    time.sleep(0.1)
+    # The primary answers before the hedge, so the backup is never started
+    ''.join(LLMStream('prompt', [primary, backup], hedge_after=1.0))
+    assert breaker(backup).allow()
+
+def test_cancelled_probe_is_released(stub):
+    slow = stub('a', response=VALID, first_token_latency=1.0, failure_threshold=1, reset_timeout=0.05)
+    fast = stub('b', response=VALID)
+    breaker(slow).record_failure()
+    time.sleep(0.1)
+    stream = LLMStream('prompt', [slow, fast], hedge_after=0.05, timeout=5.0)
+    ''.join(stream)
+    assert stream.provider is fast
+    assert breaker(slow).state == 'half_open'
+    assert breaker(slow).allow()
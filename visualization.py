@@ -1,5 +1,6 @@
 import plotly.graph_objects as go
 import plotly.express as px
+from plotly.subplots import make_subplots
 
 def create_rent_comparison_chart(current_rent, market_rate, comps):
     """Create a bar chart comparing current rent with market rate"""
@@ -23,28 +24,50 @@ def create_rent_comparison_chart(current_rent, market_rate, comps):
     return fig
 
 def create_trend_chart(market_data):
-    """Create a line chart showing rental trends"""
-    if not market_data or 'seasonal_patterns' not in market_data:
+    """Create a line chart showing rental trends, with the 12-month forecast when available"""
+    if not market_data or not market_data.seasonal:
         return go.Figure()  # Return empty figure if no data
 
-    seasonal_patterns = market_data.get('seasonal_patterns', {})
+    seasonal_patterns = market_data.seasonal_patterns
     seasons = list(seasonal_patterns.keys())
     changes = [seasonal_patterns[season] * 100 for season in seasons]  # Convert to percentage
+    seasonal_trace = go.Scatter(
+        x=seasons,
+        y=changes,
+        mode='lines+markers',
+        line=dict(color='#FF4B4B')
+    )
 
-    fig = go.Figure(data=[
-        go.Scatter(
-            x=seasons,
-            y=changes,
-            mode='lines+markers',
-            line=dict(color='#FF4B4B')
+    forecast = market_data.forecast
+    if not forecast:
+        fig = go.Figure(data=[seasonal_trace])
+        fig.update_layout(
+            title='Seasonal Rent Patterns',
+            yaxis_title='Price Change (%)',
+            showlegend=False
         )
-    ])
+        return fig
 
-    fig.update_layout(
-        title='Seasonal Rent Patterns',
-        yaxis_title='Price Change (%)',
-        showlegend=False
-    )
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Seasonal Rent Patterns', '12-Month Rent Forecast'))
+    fig.add_trace(seasonal_trace, row=1, col=1)
+    fig.add_trace(go.Scatter(
+        x=forecast.months + forecast.months[::-1],
+        y=forecast.upper + forecast.lower[::-1],
+        fill='toself',
+        fillcolor='rgba(31, 119, 180, 0.2)',
+        line=dict(color='rgba(0, 0, 0, 0)'),
+        hoverinfo='skip'
+    ), row=1, col=2)
+    fig.add_trace(go.Scatter(
+        x=forecast.months,
+        y=forecast.rent,
+        mode='lines+markers',
+        line=dict(color='#1F77B4')
+    ), row=1, col=2)
+
+    fig.update_yaxes(title_text='Price Change (%)', row=1, col=1)
+    fig.update_yaxes(title_text='Monthly Rent ($)', row=1, col=2)
+    fig.update_layout(showlegend=False)
 
     return fig
 
@@ -77,8 +100,8 @@ def create_price_metrics_chart(price_metrics, market_data):
     categories = ['Value Score', 'Market Percentile', 'Price Stability', 'Negotiation Power']
 
     # Calculate negotiation power based on market data
-    vacancy_rate = market_data.get('vacancy_rate', 0) * 100
-    yearly_change = market_data.get('yearly_change', 0) * 100
+    vacancy_rate = market_data.vacancy_rate * 100
+    yearly_change = market_data.yearly_change * 100
     negotiation_power = min(100, max(0, 
         50 + (vacancy_rate * 3) - (yearly_change * 2)
     ))
@@ -0,0 +1,61 @@
+"""Background warmup of heavy modules and clients after the first paint"""
+import importlib
+import threading
+import time
+from typing import Dict, Optional
+
+# Modules that are imported lazily by the pages but needed once a user clicks Analyze
+WARMUP_MODULES = (
+    'pandas',
+    'plotly.graph_objects',
+    'utils.visualization',
+)
+
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+timings: Dict[str, float] = {}
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        print(f"Warmup step {name} failed: {str(e)}")
+    timings[name] = time.perf_counter() - start
+
+def _warm():
+    for module in WARMUP_MODULES:
+        _timed(module, lambda module=module: importlib.import_module(module))
+
+    from utils.advanced_analysis import get_client
+    from utils.api_integrations import get_hud_client
+    from utils.data_loader import ensure_sample_data
+    from utils.leaderboard import get_leaderboard
+    from utils.market_model import get_market_model
+    from utils.tenant_rights import get_catalog
+
+    _timed('openai_client', get_client)
+    _timed('hud_client', get_hud_client)
+    _timed('sample_data', ensure_sample_data)
+    _timed('market_model', get_market_model)
+    _timed('tenant_rights', get_catalog)
+    # Starts the leaderboard's background load before the first save needs it
+    _timed('leaderboard', get_leaderboard)
+
+def start_warmup() -> threading.Thread:
+    """
+    Preload heavy modules and clients on a daemon thread
+    Safe to call on every rerun; only the first call starts work
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm, name='rent-warmup', daemon=True)
+            _thread.start()
+        return _thread
+
+def wait_for_warmup(timeout: Optional[float] = None) -> bool:
+    """Block until warmup finishes, returning False on timeout"""
+    thread = start_warmup()
+    thread.join(timeout)
+    return not thread.is_alive()
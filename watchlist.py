@@ -0,0 +1,420 @@
+"""
+Saved-search watchlist, re-scored when market or violations data changes
+
+A refresh loads only the saved searches that depend on what changed:
+searches in the affected ZIPs, or in the ZIP prefixes of the affected
+metros, through the index on `rent_searches.zip_code`, and searches at
+the affected addresses through the indexed `address_key` hash. They are
+streamed into columnar numpy arrays (`WatchIndex`), re-scored in one
+vectorized pass, the rows whose values moved are written back and alerts
+are queued in a local JSONL outbox. `deliver` hands queued alerts to a
+sender.
+
+Run `market` after `python -m utils.market_store refresh`; with no
+arguments it re-scores the metros whose latest rent changed since the
+previous run.
+
+Usage:
+    python -m utils.watchlist market [--metro NAME ...] [--zip ZIP ...]
+    python -m utils.watchlist violations [--address ADDRESS ...]
+    python -m utils.watchlist deliver
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+
+OUTBOX_PATH = os.getenv('ALERT_OUTBOX_PATH', 'data/alert_outbox.jsonl')
+SENT_PATH = os.getenv('ALERT_SENT_PATH', 'data/alert_sent.jsonl')
+
+# Latest rent per metro as of the previous market run
+STATE_PATH = 'data/watchlist_state.json'
+
+# Alert when a rent score moves by at least this many points...
+SCORE_ALERT_DELTA = 5.0
+# ...or the market rate moves by at least this fraction
+RATE_ALERT_CHANGE = 0.03
+
+LOAD_BATCH_SIZE = 50000
+WRITE_BATCH_SIZE = 10000
+# Stays under SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 900
+
+def normalize_address(address: str) -> str:
+    return ' '.join((address or '').lower().split())
+
+def address_hash(address: str) -> int:
+    """Signed 64-bit hash of the normalized address, stored as `RentSearch.address_key`"""
+    digest = hashlib.blake2b(normalize_address(address).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+def score_rents(current_rents: np.ndarray, avg_rents: np.ndarray) -> np.ndarray:
+    """Vectorized `analysis.score_rent`"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        over_market = np.maximum(0, 100 - np.minimum(100, (current_rents - avg_rents) / avg_rents * 100))
+    return np.where(current_rents > avg_rents, over_market, 100.0)
+
+def metro_rates(matrix) -> np.ndarray:
+    """Latest rent per metro, as served by `load_market_data`"""
+    from utils.market_store import LATEST_OFFSET
+    return np.asarray(matrix.values[:, -LATEST_OFFSET], dtype=np.float64)
+
+def _prefix_ranges(prefixes: Iterable[str]) -> List[tuple]:
+    """[low, high) bounds for ZIP codes starting with each prefix, so the zip_code index is usable"""
+    return [(p, p[:-1] + chr(ord(p[-1]) + 1)) for p in sorted(set(prefixes))]
+
+def market_condition(matrix, metros: Iterable[int] = (), zip_codes: Iterable[str] = ()):
+    """Filter for the saved searches priced off the given metros (matrix rows) or in the given ZIPs"""
+    from sqlalchemy import and_, false, not_, or_
+    from database.models import RentSearch
+    from utils.data_loader import ZIP_TO_METRO, DEFAULT_METRO
+
+    def in_prefixes(prefixes):
+        return [and_(RentSearch.zip_code >= low, RentSearch.zip_code < high) for low, high in _prefix_ranges(prefixes)]
+
+    names = {matrix.metros[i] for i in metros}
+    conditions = in_prefixes(zip_prefix[:3] for zip_prefix, metro in ZIP_TO_METRO.items() if metro in names)
+    zip_codes = list(zip_codes)
+    if zip_codes:
+        conditions.append(RentSearch.zip_code.in_(zip_codes))
+    if DEFAULT_METRO in names:
+        # Unmapped ZIPs are priced off the default metro; no index covers them
+        conditions.append(or_(RentSearch.zip_code.is_(None), not_(or_(*in_prefixes(p[:3] for p in ZIP_TO_METRO)))))
+    return or_(*conditions) if conditions else false()
+
+def address_conditions(hashes: Iterable[int]) -> List:
+    """Filters for the saved searches at the given address hashes, in batches"""
+    from database.models import RentSearch
+
+    hashes = sorted(set(hashes))
+    return [RentSearch.address_key.in_(hashes[start:start + LOOKUP_BATCH_SIZE])
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE)]
+
+class WatchIndex:
+    """A set of saved searches as columns"""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.ids = columns['id']
+        self.user_ids = columns['user_id']
+        self.metros = columns['metro']
+        self.addresses = columns['address']
+        self.rents = columns['rent']
+        # Market rate and score as of the last re-score, or as saved
+        self.rates = columns['rate']
+        self.scores = columns['score']
+        # -1 until a violations run has recorded a count
+        self.violations = columns['violations']
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, session, matrix, conditions: Optional[List] = None) -> 'WatchIndex':
+        """
+        Stream the saved searches matching any of `conditions` in batches
+        Each condition is queried separately and should select disjoint rows; None loads every search
+        """
+        from sqlalchemy import func, select
+        from database.models import RentSearch
+        from utils.data_loader import get_metro_for_zip, DEFAULT_METRO
+
+        default_metro = matrix.metro_index.get(DEFAULT_METRO, -1)
+        zip_metros: Dict[str, int] = {}
+
+        def lookup_zip(zip_code):
+            metro = zip_metros.get(zip_code)
+            if metro is None:
+                metro = zip_metros[zip_code] = matrix.metro_index.get(get_metro_for_zip(zip_code or ''), default_metro)
+            return metro
+
+        query = select(
+            RentSearch.id, RentSearch.user_id, RentSearch.zip_code, RentSearch.address,
+            RentSearch.current_rent,
+            func.coalesce(RentSearch.latest_market_rate, RentSearch.market_rate),
+            func.coalesce(RentSearch.latest_rent_score, RentSearch.rent_score),
+            RentSearch.violation_count
+        ).execution_options(yield_per=LOAD_BATCH_SIZE)
+
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name in (
+            'id', 'user_id', 'metro', 'address', 'rent', 'rate', 'score', 'violations'
+        )}
+        for condition in (conditions if conditions is not None else [None]):
+            filtered = query if condition is None else query.where(condition)
+            for rows in session.execute(filtered).partitions():
+                ids, user_ids, zip_codes, addresses, rents, rates, scores, violations = zip(*rows)
+                metros = [lookup_zip(z) for z in zip_codes]
+                chunks['id'].append(np.array(ids, dtype=np.int64))
+                chunks['user_id'].append(np.array([-1 if u is None else u for u in user_ids], dtype=np.int64))
+                chunks['metro'].append(np.array(metros, dtype=np.int32))
+                chunks['address'].append(np.array([address_hash(a) for a in addresses], dtype=np.int64))
+                chunks['rent'].append(np.array(rents, dtype=np.float64))
+                chunks['rate'].append(np.array(rates, dtype=np.float64))
+                chunks['score'].append(np.array(scores, dtype=np.float64))
+                chunks['violations'].append(np.array([-1 if v is None else v for v in violations], dtype=np.int32))
+
+        empty = {'id': np.int64, 'user_id': np.int64, 'metro': np.int32, 'address': np.int64, 'rent': np.float64, 'rate': np.float64,
+                 'score': np.float64, 'violations': np.int32}
+        return cls({
+            name: np.concatenate(parts) if parts else np.empty(0, dtype=empty[name])
+            for name, parts in chunks.items()
+        })
+
+class Outbox:
+    """Append-only JSONL queue of alerts waiting to be delivered"""
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+
+    def extend(self, alerts: List[Dict[str, Any]]):
+        if not alerts:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            for alert in alerts:
+                f.write(json.dumps(alert) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+class StubSender:
+    """Local sender that records alerts instead of contacting anyone"""
+
+    def __init__(self, path: str = SENT_PATH):
+        self.path = path
+
+    def send(self, alert: Dict[str, Any]):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({**alert, 'sent_at': datetime.utcnow().isoformat()}) + '\n')
+
+def deliver(sender=None, outbox: Optional[Outbox] = None) -> Dict[str, int]:
+    """
+    Send queued alerts; failures go back on the queue
+    The queue is moved aside first so alerts queued meanwhile wait for the next run
+    """
+    sender = sender or StubSender()
+    outbox = outbox or Outbox()
+    sending = f"{outbox.path}.sending"
+    if not os.path.exists(sending):
+        if not os.path.exists(outbox.path):
+            return {'sent': 0, 'failed': 0}
+        os.replace(outbox.path, sending)
+
+    sent, failed = 0, []
+    with open(sending) as f:
+        for line in f:
+            alert = json.loads(line)
+            try:
+                sender.send(alert)
+                sent += 1
+            except Exception as e:
+                print(f"Error sending alert for search {alert.get('search_id')}: {str(e)}")
+                failed.append(alert)
+    outbox.extend(failed)
+    os.remove(sending)
+    return {'sent': sent, 'failed': len(failed)}
+
+def _write_back(session, ids: np.ndarray, values: Dict[str, np.ndarray]):
+    """Bulk UPDATE by primary key, in batches"""
+    from sqlalchemy import update
+    from database.models import RentSearch
+
+    now = datetime.utcnow()
+    columns = {name: array.tolist() for name, array in values.items()}
+    ids = ids.tolist()
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        end = start + WRITE_BATCH_SIZE
+        session.execute(update(RentSearch), [
+            {'id': search_id, 'rescored_at': now, **{name: column[start + j] for name, column in columns.items()}}
+            for j, search_id in enumerate(ids[start:end])
+        ])
+    session.commit()
+
+def _search_details(session, ids: List[int]) -> Dict[int, tuple]:
+    """Address, user id and email for the searches being alerted"""
+    from database.models import RentSearch, User
+
+    details = {}
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        rows = session.query(RentSearch.id, RentSearch.address, RentSearch.user_id, User.email).outerjoin(
+            User, RentSearch.user_id == User.id
+        ).filter(RentSearch.id.in_(ids[start:start + LOOKUP_BATCH_SIZE]))
+        for search_id, address, user_id, email in rows:
+            details[search_id] = (address, user_id, email)
+    return details
+
+def _queue_alerts(session, outbox: Outbox, kind: str, ids: np.ndarray, messages) -> int:
+    ids = ids.tolist()
+    details = _search_details(session, ids)
+    created_at = datetime.utcnow().isoformat()
+    alerts = []
+    for j, search_id in enumerate(ids):
+        address, user_id, email = details.get(search_id, ('', None, None))
+        alerts.append({
+            'search_id': search_id, 'user_id': user_id, 'email': email, 'kind': kind,
+            'message': messages(j, address), 'created_at': created_at
+        })
+    outbox.extend(alerts)
+    return len(alerts)
+
+def _load_state() -> Dict[str, float]:
+    try:
+        with open(STATE_PATH) as f:
+            return json.load(f).get('rates', {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_state(matrix, rates: np.ndarray):
+    with open(f"{STATE_PATH}.tmp", 'w') as f:
+        json.dump({
+            'data_version': matrix.version,
+            'rates': {metro: float(rates[i]) for i, metro in enumerate(matrix.metros)}
+        }, f)
+    os.replace(f"{STATE_PATH}.tmp", STATE_PATH)
+
+def changed_metros(matrix, rates: np.ndarray) -> List[int]:
+    """Metros whose latest rent differs from the previous market run"""
+    previous = _load_state()
+    return [
+        i for i, metro in enumerate(matrix.metros)
+        if previous.get(metro) != float(rates[i])
+    ]
+
+def rescore_market(session, matrix, metros: Optional[Iterable[str]] = None,
+                   zip_codes: Optional[Iterable[str]] = None, outbox: Optional[Outbox] = None) -> Dict[str, int]:
+    """
+    Re-score searches in the given metros and ZIPs against the current market
+    With neither given, re-scores the metros that changed since the last run
+    """
+    outbox = outbox or Outbox()
+    rates = metro_rates(matrix)
+
+    if metros is None and zip_codes is None:
+        condition = market_condition(matrix, changed_metros(matrix, rates))
+    else:
+        metro_ids = [matrix.metro_index[m] for m in (metros or []) if m in matrix.metro_index]
+        condition = market_condition(matrix, metro_ids, zip_codes or [])
+    index = WatchIndex.load(session, matrix, [condition])
+    rows = np.flatnonzero(index.metros >= 0)
+
+    new_rates = rates[index.metros[rows]]
+    rents = index.rents[rows]
+    usable = np.isfinite(new_rates) & (new_rates > 0) & np.isfinite(rents)
+    rows, new_rates, rents = rows[usable], new_rates[usable], rents[usable]
+    new_scores = score_rents(rents, new_rates)
+
+    old_rates, old_scores = index.rates[rows], index.scores[rows]
+    changed = (new_rates != old_rates) | (new_scores != old_scores)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_move = np.abs(new_rates - old_rates) / old_rates
+    alert = changed & ((np.abs(new_scores - old_scores) >= SCORE_ALERT_DELTA) | (rate_move >= RATE_ALERT_CHANGE))
+
+    updated = rows[changed]
+    _write_back(session, index.ids[updated], {
+        'latest_market_rate': new_rates[changed], 'latest_rent_score': new_scores[changed]
+    })
+
+    alerted = np.flatnonzero(alert)
+    alerts = _queue_alerts(session, outbox, 'market', index.ids[rows[alerted]], lambda j, address: (
+        f"Market rent near {address} moved from ${old_rates[alerted[j]]:,.0f} to "
+        f"${new_rates[alerted[j]]:,.0f}; your rent score is now {new_scores[alerted[j]]:.0f}/100"
+    ))
+
+    if metros is None and zip_codes is None:
+        _save_state(matrix, rates)
+    return {'checked': len(rows), 'updated': len(updated), 'alerts': alerts}
+
+def violation_counts(addresses: Optional[Iterable[str]] = None) -> Dict[int, int]:
+    """Violations per address hash; addresses without records count as zero"""
+    from utils.analysis import load_violations_data
+
+    counts = {
+        address_hash(building['address']): len(building['violations'])
+        for building in load_violations_data().get('building_violations', [])
+    }
+    if addresses is not None:
+        counts = {h: counts.get(h, 0) for h in {address_hash(a) for a in addresses}}
+    return counts
+
+def rescore_violations(session, matrix, addresses: Optional[Iterable[str]] = None,
+                       outbox: Optional[Outbox] = None) -> Dict[str, int]:
+    """
+    Update violation counts for searches at the given addresses
+    With none given, covers every address in the violations data, plus
+    searches still holding a count for an address the data no longer lists
+    """
+    from database.models import RentSearch
+
+    outbox = outbox or Outbox()
+    counts = violation_counts(addresses)
+    hashes = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.int32, count=len(counts))
+    order = np.argsort(hashes)
+    hashes, values = hashes[order], values[order]
+
+    conditions = address_conditions(counts)
+    if addresses is None:
+        # Addresses dropped from the data go back to zero
+        conditions.append(RentSearch.violation_count > 0)
+    index = WatchIndex.load(session, matrix, conditions)
+    # A search can match both an address batch and the nonzero-count filter
+    _, rows = np.unique(index.ids, return_index=True)
+    positions = np.minimum(np.searchsorted(hashes, index.addresses[rows]), max(len(hashes) - 1, 0))
+    listed = hashes[positions] == index.addresses[rows] if len(hashes) else np.zeros(len(rows), dtype=bool)
+    new_counts = np.where(listed, values[positions] if len(values) else 0, 0).astype(np.int32)
+    old_counts = index.violations[rows]
+    changed = new_counts != old_counts
+    # The first count recorded for a search is a baseline, not news
+    alert = changed & (old_counts >= 0) & (new_counts > old_counts)
+
+    updated = rows[changed]
+    _write_back(session, index.ids[updated], {'violation_count': new_counts[changed]})
+
+    alerted = np.flatnonzero(alert)
+
+    def message(j, address):
+        added = int(new_counts[alerted[j]] - old_counts[alerted[j]])
+        return (f"{added} new building violation{'s' if added != 1 else ''} reported at {address}; "
+                f"this can strengthen your negotiation")
+
+    alerts = _queue_alerts(session, outbox, 'violations', index.ids[rows[alerted]], message)
+    return {'checked': len(rows), 'updated': len(updated), 'alerts': alerts}
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score saved searches and deliver alerts")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    market_parser = subparsers.add_parser('market', help="Re-score against the current market data")
+    market_parser.add_argument('--metro', action='append')
+    market_parser.add_argument('--zip', action='append')
+    violations_parser = subparsers.add_parser('violations', help="Re-check building violations")
+    violations_parser.add_argument('--address', action='append')
+    subparsers.add_parser('deliver', help="Send queued alerts")
+    args = parser.parse_args()
+
+    if args.command == 'deliver':
+        print(deliver())
+        return
+
+    from database.session import get_session
+    from utils.market_store import get_market_matrix
+
+    session = get_session()
+    try:
+        start = time.perf_counter()
+        matrix = get_market_matrix()
+        if args.command == 'market':
+            result = rescore_market(session, matrix, args.metro, args.zip)
+        else:
+            result = rescore_violations(session, matrix, args.address)
+        print(f"Checked {result['checked']}, updated {result['updated']}, "
+              f"queued {result['alerts']} alerts in {time.perf_counter() - start:.1f}s")
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
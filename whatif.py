@@ -0,0 +1,57 @@
+"""What-if recompute of scores for a hypothetical rent or lease length"""
+import time
+from typing import Dict, Any, List
+
+from utils.records import CompBatch, Violation
+from utils.analysis import score_rent
+from utils.advanced_analysis import value_score_from_averages
+from utils.gamification import (
+    calculate_negotiation_power, calculate_negotiation_score, lease_length_bonus
+)
+
+class AnalysisContext:
+    """
+    Everything a what-if recompute needs, precomputed from an analysis result
+    Recomputing from a context is pure arithmetic with no I/O
+    """
+    __slots__ = ('market_rate', 'comp_avg', 'comps', 'violations', 'base_power', 'name', 'address')
+
+    def __init__(self, market_rate: float, comp_avg: float, comps: CompBatch,
+                 violations: List[Violation], base_power: float, name: str, address: str):
+        self.market_rate = market_rate
+        self.comp_avg = comp_avg
+        self.comps = comps
+        self.violations = violations
+        self.base_power = base_power
+        self.name = name
+        self.address = address
+
+def build_context(result: Dict[str, Any]) -> AnalysisContext:
+    """Precompute averages and negotiation power from a stored analysis result"""
+    return AnalysisContext(
+        market_rate=result['market_rate'],
+        # Like-for-like median, as calculate_value_score uses
+        comp_avg=result['segment'].median if result.get('segment') else result['comps'].mean_rent(),
+        comps=result['comps'],
+        violations=result['violations'],
+        base_power=calculate_negotiation_power(result['market_data'], result['violations']),
+        name=result.get('name', ''),
+        address=result.get('address', '')
+    )
+
+def evaluate(context: AnalysisContext, rent: float, lease_months: int = 12) -> Dict[str, Any]:
+    """Scores for a hypothetical rent and lease length"""
+    start = time.perf_counter()
+    power = min(100, context.base_power + lease_length_bonus(lease_months))
+    negotiation = calculate_negotiation_score(
+        rent, context.market_rate, power, context.violations, context.comps
+    )
+    return {
+        'rent': rent,
+        'lease_months': lease_months,
+        'rent_score': score_rent(rent, context.market_rate),
+        'value_score': value_score_from_averages(rent, context.market_rate, context.comp_avg),
+        'negotiation_power': power,
+        'negotiation': negotiation,
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }